@@ -16,39 +16,39 @@
 #MG206855,MK231582,NY222079,SG222341
 
 # +
-import glob
-import os
-import re
 import warnings
 
-import numpy as np
 import pandas as pd
-#import textract
-from PyPDF2 import PdfReader
 from tenacity import retry, stop_after_attempt, wait_random_exponential
-from vertexai.language_models import TextEmbeddingModel, TextGenerationModel
-warnings.filterwarnings("ignore")
-import glob
-import os
-import re
-import warnings
 
-import numpy as np
-import pandas as pd
+from docqa import metrics, models
+
+warnings.filterwarnings("ignore")
 
 # -
 
-generation_model = TextGenerationModel.from_pretrained("text-bison@001")
-embedding_model = TextEmbeddingModel.from_pretrained("textembedding-gecko@001")
+# Model clients are created on first use (see docqa).
+generation_model = models.generation_model("text-bison@001")
+embedding_model = models.embedding_model("textembedding-gecko@001")
 
 
 # +
-@retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(3))
+@metrics.timed("text_generation")
+@retry(
+    wait=wait_random_exponential(min=1, max=20),
+    stop=stop_after_attempt(3),
+    before_sleep=metrics.retry_hook("text_generation"),
+)
 def text_generation_model_with_backoff(**kwargs):
     return generation_model.predict(**kwargs).text
 
 
-@retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(3))
+@metrics.timed("embedding")
+@retry(
+    wait=wait_random_exponential(min=1, max=20),
+    stop=stop_after_attempt(3),
+    before_sleep=metrics.retry_hook("embedding"),
+)
 def embedding_model_with_backoff(text=[]):
     embeddings = embedding_model.get_embeddings(text)
     return [each.values for each in embeddings][0]
@@ -56,104 +56,21 @@ def embedding_model_with_backoff(text=[]):
 
 # -
 
-def create_data_packet(file_name, file_type, page_number, file_content):
-    """Creating a simple dictionary to store all information (content and metadata)
-    extracted from the document"""
-    data_packet = {}
-    data_packet["file_name"] = file_name
-    data_packet["file_type"] = file_type
-    data_packet["page_number"] = page_number
-    data_packet["content"] = file_content
-    return data_packet
-
-
+# create_data_packet and files are shared with the other notebooks and live in
+# docqa.ingest; every page packet has the same keys (file_name, file_type,
+# page_number, content, extractor).
 path = 'pocfiles'
-def files(path):
-    """
-    Function that returns only filenames (and not folder names)
-    """
-    for file in os.listdir(path):
-        if os.path.isfile(os.path.join(path, file)):
-            yield file
-
 
 # +
-import os
-from PyPDF2 import PdfReader  # For searchable PDFs
-import fitz  # For handling unsearchable PDFs
-import textract  # For handling other file types
-
-def files(path):
-    """
-    Function that returns only filenames if the path is a directory,
-    or returns the single file if the path is a file.
-    """
-    if os.path.isfile(path):
-        # If it's a file, yield just that file
-        yield path
-    elif os.path.isdir(path):
-        # If it's a directory, list all files
-        for file in os.listdir(path):
-            file_path = os.path.join(path, file)
-            if os.path.isfile(file_path):
-                yield file_path
-    else:
-        raise NotADirectoryError(f"{path} is neither a file nor a directory")
-
+from docqa.ingest import extract_pages, files
 
+# Each PDF is read once; every page is tried with fitz first and falls back to
+# PyPDF2 per page, and the packet records which extractor produced the text.
 final_data = []
 
 for file_name in files(path):
     print(file_name)
-    _, file_type = os.path.splitext(file_name)
-    
-    if file_type == ".pdf":
-        # Attempt to load and extract text using PdfReader (for searchable PDFs)
-        reader = PdfReader(file_name)
-        is_text_extracted = False
-        for i, page in enumerate(reader.pages):
-            text = page.extract_text()
-            if text:
-                packet = create_data_packet(
-                    file_name, file_type, page_number=int(i + 1), file_content=text
-                )
-                final_data.append(packet)
-                is_text_extracted = True
-        
-        # If no text was extracted (likely an unsearchable PDF), use fitz (PyMuPDF)
-        if not is_text_extracted:
-            print(f"No text found with PdfReader, using fitz for {file_name}")
-            doc = fitz.open(file_name)
-            for i in range(doc.page_count):
-                page = doc.load_page(i)
-                text = page.get_text("text")  # Extract text
-                if text.strip():  # Ensure non-empty text
-                    packet = create_data_packet(
-                        file_name, file_type, page_number=int(i + 1), file_content=text
-                    )
-                    final_data.append(packet)
-                else:
-                    # If page is still non-text, render page as image (optional)
-                    pix = page.get_pixmap()
-                    pix.save(f"page-{i + 1}-{file_name}.png")
-                    print(f"Page {i + 1} rendered as image.")
-    
-    else:
-        # For non-PDF file types, use textract
-        text = textract.process(file_name).decode("utf-8")
-        packet = create_data_packet(
-            file_name, file_type, page_number=None, file_content=text
-        )
-        final_data.append(packet)
-
-# Define create_data_packet if not already defined
-def create_data_packet(file_name, file_type, page_number, file_content):
-    return {
-        'file_name': file_name,
-        'file_type': file_type,
-        'page_number': page_number,
-        'file_content': file_content
-    }
+    final_data.extend(extract_pages(file_name))
 
 
 # -
@@ -178,27 +95,9 @@ print("The total words in the context: ", len(context))
 # +
 # The function get_chunks_iter() can be used to split a piece of text into smaller chunks,
 # each of which is at most maxlength characters long.
-# This can be useful for tasks such as summarization, question answering, and translation.
-def get_chunks_iter(text, maxlength):
-    """
-    Get chunks of text, each of which is at most maxlength characters long.
-
-    Args:
-        text: The text to be chunked.
-        maxlength: The maximum length of each chunk.
-
-    Returns:
-        An iterator over the chunks of text.
-    """
-    start = 0
-    end = 0
-    final_chunk = []
-    while start + maxlength < len(text) and end != -1:
-        end = text.rfind(" ", start, start + maxlength + 1)
-        final_chunk.append(text[start:end])
-        start = end + 1
-    final_chunk.append(text[start:])
-    return final_chunk
+# docqa.chunking.chunk_text does the same by token budget, with overlap and
+# paragraph/sentence boundaries, for the pipeline used by the other notebooks.
+from docqa.chunking import get_chunks_iter
 
 
 # function to apply "get_chunks_iter" function on each row of dataframe.
@@ -210,17 +109,23 @@ def split_text(row):
 
 # +
 global chunk_size
-# you can define how many words should be there in a given chunk.
+# you can define how many characters should be there in a given chunk.
 chunk_size = 5000
 
 pdf_data_sample = pdf_data.copy()
 # -
 
-# Remove all non-alphabets and numbers from the data to clean it up.
-# This is harsh cleaning. You can define your custom logic for cleansing here.
-pdf_data_sample["content"] = pdf_data_sample["content"].apply(
-    lambda x: re.sub("[^A-Za-z0-9]+", " ", x)
-)
+# Clean the pages one document at a time, in one regex pass over each
+# document's text. The "qa" profile keeps the % . $ - characters numbers and
+# dates are written with, repairs words hyphenated across line breaks and drops
+# headers/footers repeated on every page; "harsh" is the old letters-and-digits
+# only cleaning. See docqa.cleaning.PROFILES.
+from docqa import pipeline
+
+pdf_data_sample["content"] = [
+    packet["content"]
+    for packet in pipeline.clean(pdf_data_sample.to_dict("records"), profile="qa")
+]
 
 # Apply the chunk splitting logic here on each row of content in dataframe.
 pdf_data_sample["chunks"] = pdf_data_sample["content"].apply(split_text)
@@ -261,10 +166,18 @@ print("The chunked dataframe has :", pdf_data_sample.shape[0], " rows with chunk
 
 
 
-pdf_data_sample_head["embedding"] = pdf_data_sample_head["chunks"].apply(
-    lambda x: embedding_model_with_backoff([x])
+from docqa.cache import CachedEmbedder, EmbeddingCache
+from docqa.embedding import BatchEmbedder
+
+# Embeddings are batched and cached on disk by (model, chunk text).
+embedder = CachedEmbedder(
+    BatchEmbedder(embedding_model),
+    EmbeddingCache(".cache/embeddings.sqlite"),
+    model_name="textembedding-gecko@001",
 )
-pdf_data_sample_head["embedding"] = pdf_data_sample_head.embedding.apply(np.array)
+# The embeddings stay in one (chunks x 768) float32 matrix, row i belonging to
+# row i of the DataFrame, instead of one np.array object per DataFrame cell.
+chunk_embeddings = embedder.embed(pdf_data_sample_head["chunks"].tolist())
 pdf_data_sample_head.head(2)
 
 
@@ -279,26 +192,18 @@ pdf_data_sample_head.head(2)
 # This will become your context for the question asked.
 
 # +
-def get_dot_product(row):
-    return np.dot(row, query_vector)
+from docqa.retrieval import VectorIndex, context_from_positions
 
+# All chunk embeddings stacked into one float32 matrix; a question is scored
+# against every chunk with a single matrix-vector product.
+vector_index = VectorIndex(chunk_embeddings)
 
+
+@metrics.timed("retrieval")
 def get_context_from_question(question, vector_store, sort_index_value=2):
-    global query_vector
-    query_vector = np.array(embedding_model_with_backoff([question]))
-    top_matched = (
-        vector_store["embedding"]
-        .apply(get_dot_product)
-        .sort_values(ascending=False)[:sort_index_value]
-        .index
-    )
-    top_matched_df = vector_store[vector_store.index.isin(top_matched)][
-        ["file_name", "page_number", "chunks"]
-    ]
-    context = " ".join(
-        vector_store[vector_store.index.isin(top_matched)]["chunks"].values
-    )
-    return context, top_matched_df
+    query_vector = embedding_model_with_backoff([question])
+    top_matched, _ = vector_index.search(query_vector, k=sort_index_value)
+    return context_from_positions(vector_store, top_matched)
 
 
 # -
@@ -335,19 +240,15 @@ print("PaLM Predicted:", text_generation_model_with_backoff(prompt=prompt))
 # +
 import json
 
-# Load the JSON data
-with open('prompt_questions.json') as f:
-    data = json.load(f)
-
+from docqa.generation import AnswerEngine
 
-import json
-import pandas as pd
 # Load the JSON data
 with open('prompt_questions.json') as f:
     data = json.load(f)
 documentids = ['MG206855','MK231582','NY222079','SG222341']
 # Iterate through each question in the JSON
 prompt_answers = []
+prompts = []
 for document in documentids:
     for question_data in data['documentResponse'][0]['documentDetails']:
     # Construct prompt for each question
@@ -373,7 +274,19 @@ for document in documentids:
     # Use your code to interact with the language model here
     # Replace the following line with your actual code
         generated_answer = "Generated answer for " + question
-        prompt_answers.append({'documentID':document,'question':question,'Answer':generation_model.predict(prompt).text})
+        prompt_answers.append({'documentID':document,'question':question})
+        prompts.append(prompt)
+
+# Answers are generated concurrently and cached on disk by (model, parameters, prompt).
+from docqa.cache import AnswerCache, CachedGenerator
+
+engine = CachedGenerator(
+    AnswerEngine(generation_model, max_concurrency=8),
+    AnswerCache(".cache/answers.sqlite", ttl=30 * 24 * 3600),
+    model_name="text-bison@001",
+)
+for row, answer in zip(prompt_answers, engine.generate_all(prompts)):
+    row['Answer'] = answer
 
 # Create a DataFrame from the list of prompt answers
 df = pd.DataFrame(prompt_answers)
@@ -386,6 +299,11 @@ df.head(50)
 
 df.to_csv("processed_data.csv",header=True)
 
+# Metrics are only recorded when DOCQA_METRICS is set.
+if metrics.REGISTRY.enabled:
+    print(metrics.summary())
+    metrics.write(".cache/metrics.json")
+
 df.head(50)
 
 
@@ -1,131 +1,26 @@
-import glob
-import os
-import re
 import warnings
 
-import numpy as np
-import pandas as pd
-import textract
-from PyPDF2 import PdfReader
-from tenacity import retry, stop_after_attempt, wait_random_exponential
-from vertexai.language_models import TextEmbeddingModel, TextGenerationModel
+from docqa import metrics, models
 
 warnings.filterwarnings("ignore")
-generation_model = TextGenerationModel.from_pretrained("text-bison@001")
-embedding_model = TextEmbeddingModel.from_pretrained("textembedding-gecko@001")
-@retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(3))
-def text_generation_model_with_backoff(**kwargs):
-    return generation_model.predict(**kwargs).text
-
 
-@retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(3))
-def embedding_model_with_backoff(text=[]):
-    embeddings = embedding_model.get_embeddings(text)
-    return [each.values for each in embeddings][0]
+# Model clients are created on first use (see docqa).
+generation_model = models.generation_model("text-bison@001")
+embedding_model = models.embedding_model("textembedding-gecko@001")
 	
-# Copying the files from the GCS bucket to local
+# Syncing the files from the GCS bucket to local: rsync only downloads
+# reports that are new or changed, and -d removes local copies of reports
+# deleted from the bucket.
 #!mkdir documents
-!gsutil -m cp -r gs://test-data-bucket-damodar/dataset/ .
-
-def create_data_packet(file_name, file_type, page_number, file_content):
-    """Creating a simple dictionary to store all information (content and metadata)
-    extracted from the document"""
-    data_packet = {}
-    data_packet["file_name"] = file_name
-    data_packet["file_type"] = file_type
-    data_packet["page_number"] = page_number
-    data_packet["content"] = file_content
-    return data_packet
-	
-final_data = []
-
-
-def files(path):
-    """
-    Function that returns only filenames (and not folder names)
-    """
-    for file in os.listdir(path):
-        if os.path.isfile(os.path.join(path, file)):
-            yield file
-
-
-for file_name in files("dataset/"):
-    path = f"dataset/{file_name}"
-    print(file_name)
-    _, file_type = os.path.splitext(path)
-    if file_type == ".pdf":
-        # loading pdf files, with page numbers as metadata.
-        reader = PdfReader(path)
-        for i, page in enumerate(reader.pages):
-            text = page.extract_text()
-            if text:
-                packet = create_data_packet(
-                    file_name, file_type, page_number=int(i + 1), file_content=text
-                )
-
-                final_data.append(packet)
-    else:
-        # loading other file types
-        text = textract.process(path).decode("utf-8")
-        packet = create_data_packet(
-            file_name, file_type, page_number=None, file_content=text
-        )
-        final_data.append(packet)
-		
-# converting the data that has been read from GCS to Pandas DataFrame for easy readibility and downstream logic
-pdf_data = pd.DataFrame.from_dict(final_data)
-pdf_data = pdf_data.sort_values(
-    by=["file_name", "page_number"]
-)  # sorting the datafram by filename and page_number
-pdf_data.reset_index(inplace=True, drop=True)
-pdf_data.head()
-
-# The function get_chunks_iter() can be used to split a piece of text into smaller chunks,
-# each of which is at most maxlength characters long.
-# This can be useful for tasks such as summarization, question answering, and translation.
-def get_chunks_iter(text, maxlength):
-    """
-    Get chunks of text, each of which is at most maxlength characters long.
-
-    Args:
-        text: The text to be chunked.
-        maxlength: The maximum length of each chunk.
-
-    Returns:
-        An iterator over the chunks of text.
-    """
-    start = 0
-    end = 0
-    final_chunk = []
-    while start + maxlength < len(text) and end != -1:
-        end = text.rfind(" ", start, start + maxlength + 1)
-        final_chunk.append(text[start:end])
-        start = end + 1
-    final_chunk.append(text[start:])
-    return final_chunk
-
-
-# function to apply "get_chunks_iter" function on each row of dataframe.
-# currently each row here for file_type=pdf is content of each page and for other file_type its the whole document.
-def split_text(row):
-    chunk_iter = get_chunks_iter(row, chunk_size)
-    return chunk_iter
-global chunk_size
-# you can define how many words should be there in a given chunk.
-chunk_size = 5000
-
-pdf_data_sample = pdf_data.copy()
-
-# Remove all non-alphabets and numbers from the data to clean it up.
-# This is harsh cleaning. You can define your custom logic for cleansing here.
-pdf_data_sample["content"] = pdf_data_sample["content"].apply(
-    lambda x: re.sub("[^A-Za-z0-9]+", " ", x)
-)
+!gsutil -m rsync -r -d gs://test-data-bucket-damodar/dataset/ dataset/
 
-# Apply the chunk splitting logic here on each row of content in dataframe.
-pdf_data_sample["chunks"] = pdf_data_sample["content"].apply(split_text)
-# Now, each row in 'chunks' contains list of all chunks and hence we need to explode them into individual rows.
-pdf_data_sample = pdf_data_sample.explode("chunks")
+from docqa import pipeline
+from docqa.cache import AnswerCache, CachedEmbedder, CachedGenerator, EmbeddingCache
+from docqa.embedding import BatchEmbedder
+from docqa.ingest import files
+
+# you can define how many tokens should be there in a given chunk.
+chunk_tokens = 1024
 
 prompt = f"""Answer the question as precise as possible using the provided context. If the answer is
               not contained in the context, say "answer not available in context" \n\n
@@ -136,57 +31,48 @@ prompt = f"""Answer the question as precise as possible using the provided conte
 print("the words in the prompt: ", len(prompt))
 print("PaLM Predicted:", generation_model.predict(prompt).text)
 
-pdf_data_sample_head["embedding"] = pdf_data_sample_head["chunks"].apply(
-    lambda x: embedding_model_with_backoff([x])
+# Embeddings are batched and cached on disk by (model, chunk text).
+embedder = CachedEmbedder(
+    BatchEmbedder(embedding_model),
+    EmbeddingCache(".cache/embeddings.sqlite"),
+    model_name="textembedding-gecko@001",
 )
-pdf_data_sample_head["embedding"] = pdf_data_sample_head.embedding.apply(np.array)
-pdf_data_sample_head.head(2)
-
-def get_dot_product(row):
-    return np.dot(row, query_vector)
 
+# Pages stream through clean -> chunk -> embed as generators, so only the
+# final index (chunk metadata plus one float32 embedding matrix) is ever
+# materialized, instead of several DataFrame copies of the whole corpus.
+# Chunks are grouped by company (matched against the report file names), so a
+# company's questions only search its own reports.
+# The store is saved to disk and memory-mapped back, so later sessions open
+# it in milliseconds. A refresh only ingests and embeds the reports that are
+# new or changed since the last run (by size, mtime and content hash) and
+# drops the chunks of deleted ones.
+from docqa.incremental import refresh_index
+
+companies = ['Regal Rexnord','AMETEK','Crane','IDEX','ESCO','Nordson','SPX','Franklin','WATTS','enpro','columbus-mckinnon']
+STORE_DIR = ".cache/sustainability_store"
+pdf_data_sample_head, vector_index, file_diff = refresh_index(
+    STORE_DIR,
+    files("dataset/"),
+    embedder,
+    entity_of=pipeline.entity_matcher(companies),
+    max_tokens=chunk_tokens,
+)
+pdf_data_sample_head.head(2)
 
-def get_context_from_question(question, vector_store, sort_index_value=2):
-    global query_vector
-    query_vector = np.array(embedding_model_with_backoff([question]))
-    top_matched = (
-        vector_store["embedding"]
-        .apply(get_dot_product)
-        .sort_values(ascending=False)[:sort_index_value]
-        .index
-    )
-    top_matched_df = vector_store[vector_store.index.isin(top_matched)][
-        ["file_name", "page_number", "chunks"]
-    ]
-    context = " ".join(
-        vector_store[vector_store.index.isin(top_matched)]["chunks"].values
-    )
-    return context, top_matched_df
-	
-	import json
+import json
 import pandas as pd
+from docqa.generation import AnswerEngine
+from docqa.journal import SweepJournal, sweep_fingerprint
+from docqa.queries import QueryEmbedder, sweep_contexts
+from docqa.results import ResultsWriter
 # Load the JSON data
 with open('/home/jupyter/documents/prompt_questions.json') as f:
     data = json.load(f)
-    companies = ['Regal Rexnord','AMETEK','Crane','IDEX','ESCO','Nordson','SPX','Franklin','WATTS','enpro','columbus-mckinnon']
-# Iterate through each question in the JSON
-prompt_answers = []
-for company in companies:
-    for question_data in data['esgResponse'][0]['benchmarkDetails']:
-    # Construct prompt for each question
-        #company = company
-        question = question_data['question'] + f" For {company}"
-        esgType = question_data['esgType']
-        esgIndicators = question_data['esgIndicators']
-        primaryDetails = question_data['primaryDetails']
-        secondaryDetails = question_data['secondaryDetails']
-        citationDetails = question_data['citationDetails']
-        pageNumber = question_data['pageNumber']
-        
-    #CompanyName = question_data['entityName']
-   # context = "Provide your context here"  # Replace with your actual context
-        context, top_matched_df = get_context_from_question(question,vector_store=pdf_data_sample_head,sort_index_value=5, )
-        prompt = f"""Answer the question with only to the point. If the answer is not contained in the context, say "NULL".
+
+
+def build_prompt(context, question):
+    return f"""Answer the question with only to the point. If the answer is not contained in the context, say "NULL".
 
         Context:
         {context}?
@@ -197,20 +83,79 @@ for company in companies:
         Answer:
         """
 
-    # Pass the prompt to the language model and get the answer
-    # Use your code to interact with the language model here
-    # Replace the following line with your actual code
-        generated_answer = "Generated answer for " + question
-
-    # Print or process the generated answer
-        #print(f"Question: {question}")
-        #print(f"esgType: {esgType}")
-        #print(f"esgType: {CompanyName}")
-        #print(f"Answer: {generation_model.predict(prompt).text}")
-        
-        #print("\n")
-        # Append question, esgType, and generated_answer to the list
-        prompt_answers.append({'company':company,'esgType': esgType,'esgIndicators':esgIndicators, 'primaryDetails':primaryDetails,'secondaryDetails':secondaryDetails,'Answer':generation_model.predict(prompt).text})
+
+# Answers are generated concurrently and cached on disk by (model, parameters, prompt).
+engine = CachedGenerator(
+    AnswerEngine(generation_model, max_concurrency=8),
+    AnswerCache(".cache/answers.sqlite", ttl=30 * 24 * 3600),
+    model_name="text-bison@001",
+)
+
+benchmarkDetails = data['esgResponse'][0]['benchmarkDetails']
+
+# Every question is embedded once (and cached on disk) instead of once per
+# (company, question) pair, and searched over each company's partition in one
+# batch. A company without matching reports falls back to the whole index
+# with its name mixed into the query.
+contexts = sweep_contexts(
+    companies,
+    benchmarkDetails,
+    QueryEmbedder(embedder),
+    vector_index,
+    pdf_data_sample_head,
+    sort_index_value=5,
+)
+
+# Answered pairs are journaled, so a re-run after a failure resumes the sweep.
+from docqa.store import read_manifest
+
+journal = SweepJournal(
+    ".cache/sustainability_sweep.jsonl",
+    fingerprint=sweep_fingerprint(
+        read_manifest(STORE_DIR),
+        build_prompt("{context}", "{question}"),
+        "text-bison@001",
+        companies,
+        benchmarkDetails,
+    ),
+)
+
+# Answers are streamed to a Parquet dataset partitioned by run and company,
+# results/run=<run>/entity=<company>/, as they come in.
+results = ResultsWriter("results")
+
+# Iterate through each question in the JSON
+prompt_answers = []
+for result in pipeline.answer(
+    companies,
+    benchmarkDetails,
+    get_context=contexts.__getitem__,
+    answer_question=lambda question, context, top_matched_df: engine.generate(
+        build_prompt(context, question)
+    ),
+    map_fn=engine.map,
+    journal=journal,
+):
+    question_data = result['question_data']
+    # Append question, esgType, and generated_answer to the list
+    prompt_answers.append({'company':result['entity'],'esgType': question_data['esgType'],'esgIndicators':question_data['esgIndicators'], 'primaryDetails':question_data['primaryDetails'],'secondaryDetails':question_data['secondaryDetails'],'Answer':result['answer']})
+    results.write(
+        result['entity'],
+        question=question_data['question'],
+        esgType=question_data['esgType'],
+        esgIndicators=question_data['esgIndicators'],
+        answer=result['answer'],
+        chunk_ids=result['chunk_ids'],
+    )
+results.close()
+print(f"{results.rows_written} answers written to results/run={results.run}")
+
+print(f"answer cache hit rate: {engine.cache.hit_rate:.0%}")
+
+# Metrics are only recorded when DOCQA_METRICS is set.
+if metrics.REGISTRY.enabled:
+    print(metrics.summary())
+    metrics.write(".cache/metrics.json")
 
 # Create a DataFrame from the list of prompt answers
 df = pd.DataFrame(prompt_answers)
@@ -218,14 +163,18 @@ df = pd.DataFrame(prompt_answers)
 # Display the DataFrame
 #print(df)
 
-for idx, row in df_rating.iterrows():
-    answer = row['Answer']
-    if pd.notnull(answer):
-        primary_details = None
-        secondary_details = answer
-        df_rating.at[idx, 'primaryDetails'] = 'Yes'
-        df_rating.at[idx, 'secondaryDetails'] = secondary_details
+# Parse the "{ value, page }" answers of all rows at once: primaryDetails
+# says whether the information was found, secondaryDetails holds the value,
+# and the typed value/page/is_null columns are kept for the report.
+from docqa.answers import normalize_answers
+
+df_rating = normalize_answers(df, categories=['company', 'esgType', 'esgIndicators'])
 print(df_rating)
 
 # Drop the 'Answer' column
-df_rating.drop(columns=['Answer'], inplace=True)
\ No newline at end of file
+df_rating.drop(columns=['Answer'], inplace=True)
+
+# The typed results of this run (or of any earlier run or company) are
+# loaded from the Parquet dataset instead of a CSV dump:
+# from docqa.results import read_results
+# read_results("results", runs=[results.run], entities=companies[:1])
\ No newline at end of file
@@ -0,0 +1,92 @@
+"""Recall@k and queries/sec of the ANN indexes against exact search.
+
+The corpus is synthetic: unit vectors drawn around a few thousand topic
+centres, with queries that are noisy copies of corpus rows, so neighbours
+are clustered the way chunk embeddings of a document collection are.
+
+Usage:
+    python benchmarks/bench_ann.py --sizes 10000 100000 --dimensions 768 --n-probe 4 8 16
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docqa.ann import HNSWIndex, IVFIndex  # noqa: E402
+from docqa.retrieval import VectorIndex  # noqa: E402
+
+
+def synthetic_corpus(size, dimensions, queries, seed=0):
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((max(16, size // 50), dimensions)).astype(np.float32)
+    corpus = topics[rng.integers(0, topics.shape[0], size)]
+    corpus += 1.5 * rng.standard_normal(corpus.shape).astype(np.float32)
+    corpus /= np.linalg.norm(corpus, axis=1, keepdims=True)
+    picked = corpus[rng.integers(0, size, queries)]
+    noise = rng.standard_normal(picked.shape).astype(np.float32)
+    query_vectors = picked + 0.3 * noise / np.sqrt(dimensions)
+    return corpus, query_vectors
+
+
+def timed_search(index, queries, k):
+    start = time.perf_counter()
+    positions, _ = index.search_batch(queries, k)
+    return positions, queries.shape[0] / (time.perf_counter() - start)
+
+
+def recall(found, truth):
+    hits = sum(len(np.intersect1d(f, t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000, 100000])
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--n-probe", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--ef", type=int, nargs="+", default=[32, 64, 128])
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        corpus, queries = synthetic_corpus(size, args.dimensions, args.queries)
+        exact = VectorIndex(corpus)
+        truth, exact_qps = timed_search(exact, queries, args.k)
+        print(f"\n{size} chunks x {args.dimensions} dimensions, recall@{args.k}")
+        print(f"  exact                     {exact_qps:10.1f} q/s  recall 1.000")
+
+        start = time.perf_counter()
+        ivf = IVFIndex(corpus)
+        build = time.perf_counter() - start
+        for n_probe in args.n_probe:
+            ivf.n_probe = n_probe
+            found, qps = timed_search(ivf, queries, args.k)
+            print(
+                f"  ivf n_lists={ivf.n_lists:<5} n_probe={n_probe:<4}"
+                f"{qps:10.1f} q/s  recall {recall(found, truth):.3f}  (build {build:.1f}s)"
+            )
+
+        try:
+            start = time.perf_counter()
+            hnsw = HNSWIndex(corpus)
+            build = time.perf_counter() - start
+        except ImportError:
+            print("  hnsw                      skipped, hnswlib is not installed")
+            continue
+        for ef in args.ef:
+            hnsw.ef = ef
+            found, qps = timed_search(hnsw, queries, args.k)
+            print(
+                f"  hnsw ef={ef:<18}{qps:10.1f} q/s  recall {recall(found, truth):.3f}"
+                f"  (build {build:.1f}s)"
+            )
+
+
+if __name__ == "__main__":
+    main()
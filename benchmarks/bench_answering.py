@@ -0,0 +1,57 @@
+"""Sequential vs concurrent answering against the fake generation model.
+
+Usage:
+    python benchmarks/bench_answering.py --prompts 200 --latency 0.2 --failure-rate 0.05
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tenacity import wait_fixed  # noqa: E402
+
+from docqa.fakes import FakeGenerationModel  # noqa: E402
+from docqa.generation import AnswerEngine  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--prompts", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--rpm", type=float, default=0,
+                        help="client-side requests per minute (0: unlimited)")
+    args = parser.parse_args()
+
+    prompts = [
+        f"Context: page {i} reports {i % 97}% renewable electricity.\nQuestion: target?"
+        for i in range(args.prompts)
+    ]
+    baseline = None
+    for concurrency in args.concurrency:
+        model = FakeGenerationModel(args.latency, args.jitter, args.failure_rate)
+        engine = AnswerEngine(
+            model,
+            max_concurrency=concurrency,
+            requests_per_minute=args.rpm or None,
+            attempts=5,
+            retry_wait=wait_fixed(args.latency),
+        )
+        start = time.perf_counter()
+        answers = engine.generate_all(prompts)
+        seconds = time.perf_counter() - start
+        assert answers[1] == "{ 1, NULL }", answers[1]
+        baseline = baseline or seconds
+        print(
+            f"concurrency={concurrency:<4} {args.prompts / seconds:8.1f} prompts/s  "
+            f"speedup {baseline / seconds:5.1f}x  calls {engine.calls}  retries {engine.retries}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Time of answer post-processing: DataFrame.iterrows against normalize_answers.
+
+The rows are resampled from the answers in final_metrics.csv, so the mix of
+well-formed, NULL and free-text answers is the one the model produces.
+
+Usage:
+    python benchmarks/bench_answers.py --rows 1000 10000 100000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from docqa.answers import normalize_answers  # noqa: E402
+
+
+def iterrows_rating(df_rating):
+    # The loop the notebook used, which did not parse the answers at all.
+    for idx, row in df_rating.iterrows():
+        answer = row["Answer"]
+        if pd.notnull(answer):
+            df_rating.at[idx, "primaryDetails"] = "Yes"
+            df_rating.at[idx, "secondaryDetails"] = answer
+    return df_rating
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--iterrows-max", type=int, default=20000,
+                        help="skip the iterrows loop above this many rows")
+    args = parser.parse_args()
+
+    sample = pd.read_csv(os.path.join(ROOT, "final_metrics.csv"), index_col=0)
+    sample = sample.drop(columns=["Question"])
+    for rows in args.rows:
+        frame = sample.sample(rows, replace=True, random_state=0).reset_index(drop=True)
+        frame[["primaryDetails", "secondaryDetails"]] = frame[
+            ["primaryDetails", "secondaryDetails"]
+        ].astype(object)
+        print(f"\n{rows} answers")
+        if rows <= args.iterrows_max:
+            start = time.perf_counter()
+            iterrows_rating(frame.copy())
+            print(f"  iterrows            {1000 * (time.perf_counter() - start):10.1f} ms")
+        start = time.perf_counter()
+        typed = normalize_answers(frame, categories=["esgType", "esgIndicators"])
+        elapsed = time.perf_counter() - start
+        print(
+            f"  normalize_answers   {1000 * elapsed:10.1f} ms  "
+            f"{typed['page'].notna().mean():.0%} with a page, {typed['is_null'].mean():.0%} NULL"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Throughput of the cleaning profiles on a synthetic page corpus.
+
+Compares the notebooks' old DataFrame.apply(re.sub) cleaning with
+pipeline.clean, which cleans each document's pages in one bulk pass per
+profile, and counts how many of the corpus' percentages survive each.
+
+Usage:
+    python benchmarks/bench_cleaning.py --documents 200 --pages 40
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docqa import pipeline  # noqa: E402
+from docqa.cleaning import PROFILES  # noqa: E402
+
+WORDS = (
+    "emissions scope renewable electricity water intensity target baseline "
+    "reduction suppliers governance employees safety waste recycled board"
+).split()
+
+
+def synthetic_pages(documents, pages, seed=0):
+    rng = random.Random(seed)
+    packets = []
+    for document in range(documents):
+        file_name = f"dataset/company_{document}_esg_report.pdf"
+        for page in range(pages):
+            lines = [f"Company {document} Sustainability Report 2022"]
+            hyphenated = False
+            for _ in range(30):
+                words = rng.choices(WORDS, k=10)
+                words[rng.randrange(10)] = f"{rng.randint(1, 99)}.{rng.randint(0, 9)}%"
+                if hyphenated:
+                    words.insert(0, "sions")
+                # A word hyphenated across a line break.
+                hyphenated = rng.random() < 0.1
+                lines.append(" ".join(words) + (" emis-" if hyphenated else ""))
+            lines.append(f"Page {page + 1} of {pages}")
+            packets.append(
+                {"file_name": file_name, "file_type": ".pdf", "page_number": page,
+                 "content": "\n".join(lines)}
+            )
+    return packets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=100)
+    parser.add_argument("--pages", type=int, default=40)
+    args = parser.parse_args()
+
+    packets = synthetic_pages(args.documents, args.pages)
+    megabytes = sum(len(p["content"]) for p in packets) / 1e6
+    percentages = sum(p["content"].count("%") for p in packets)
+    print(f"{len(packets)} pages, {megabytes:.1f} MB, {percentages} percentages")
+
+    frame = pd.DataFrame(packets)
+    start = time.perf_counter()
+    legacy = frame["content"].apply(lambda x: re.sub("[^A-Za-z0-9]+", " ", x))
+    report("DataFrame.apply(re.sub)", time.perf_counter() - start, megabytes,
+           legacy.str.count("%").sum())
+
+    no_headers = PROFILES["qa"]._replace(strip_headers_footers=False)
+    for name, profile in [
+        ("harsh", "harsh"),
+        ("light", "light"),
+        ("qa", "qa"),
+        ("qa without header removal", no_headers),
+    ]:
+        start = time.perf_counter()
+        cleaned = [p["content"] for p in pipeline.clean(packets, profile)]
+        report(name, time.perf_counter() - start, megabytes,
+               sum(text.count("%") for text in cleaned))
+
+
+def report(name, seconds, megabytes, percentages):
+    print(f"{name:<28} {megabytes / seconds:8.1f} MB/s  {percentages:>8} percentages kept")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Throughput of per-chunk vs batched embedding against the fake backend.
+
+Usage:
+    python benchmarks/bench_embedding.py --chunks 2000 --latency 0.05
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docqa.embedding import BatchEmbedder  # noqa: E402
+from docqa.fakes import FakeEmbeddingModel  # noqa: E402
+
+
+def synthetic_chunks(count, words=200):
+    vocabulary = [f"term{i}" for i in range(5000)]
+    return [
+        " ".join(vocabulary[(i * 7919 + j * 31) % len(vocabulary)] for j in range(words))
+        for i in range(count)
+    ]
+
+
+def bench_one_per_request(model, chunks):
+    start = time.perf_counter()
+    for chunk in chunks:
+        model.get_embeddings([chunk])
+    return time.perf_counter() - start
+
+
+def bench_batched(model, chunks, batch_size, concurrency):
+    embedder = BatchEmbedder(
+        model, max_batch_size=batch_size, max_concurrency=concurrency
+    )
+    start = time.perf_counter()
+    embedder.embed(chunks)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="seconds per request of the fake model")
+    parser.add_argument("--batch-size", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+
+    chunks = synthetic_chunks(args.chunks)
+    model = FakeEmbeddingModel(latency=args.latency)
+
+    seconds = bench_one_per_request(model, chunks)
+    print(f"{'one text per request':<32} {args.chunks / seconds:10.1f} chunks/s")
+    for concurrency in args.concurrency:
+        seconds = bench_batched(model, chunks, args.batch_size, concurrency)
+        label = f"batch={args.batch_size} concurrency={concurrency}"
+        print(f"{label:<32} {args.chunks / seconds:10.1f} chunks/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Ingestion throughput at several process-pool sizes.
+
+Usage:
+    python benchmarks/bench_ingest.py pocfiles --processes 1 2 4 8
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docqa.ingest import files, ingest_parallel  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="folder of documents to parse")
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--timeout", type=float, default=300.0)
+    args = parser.parse_args()
+
+    paths = list(files(args.path))
+    baseline = None
+    for processes in args.processes:
+        start = time.perf_counter()
+        results = list(ingest_parallel(paths, processes, args.timeout))
+        seconds = time.perf_counter() - start
+        pages = sum(len(r.packets) for r in results)
+        failed = sum(1 for r in results if r.error)
+        slowest = max(results, key=lambda r: r.seconds, default=None)
+        baseline = baseline or seconds
+        print(
+            f"processes={processes:<3} {len(paths) / seconds:8.1f} files/s "
+            f"{pages / seconds:9.1f} pages/s  speedup {baseline / seconds:4.1f}x  "
+            f"failed {failed}"
+            + (f"  slowest {slowest.file_name} ({slowest.seconds:.2f}s)" if slowest else "")
+        )
+
+
+if __name__ == "__main__":
+    main()
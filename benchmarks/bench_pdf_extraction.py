@@ -0,0 +1,82 @@
+"""Pages/sec of the PDF extraction strategies on a local sample corpus.
+
+Usage:
+    python benchmarks/bench_pdf_extraction.py pocfiles
+    python benchmarks/bench_pdf_extraction.py --synthetic 20 --pages 30
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # noqa: E402
+from PyPDF2 import PdfReader  # noqa: E402
+
+from docqa.ingest import extract_pdf_pages, files  # noqa: E402
+
+
+def legacy_extract(file_name):
+    """The old notebook flow: PyPDF2 for the whole file, fitz only if it found nothing."""
+    texts = [page.extract_text() for page in PdfReader(file_name).pages]
+    texts = [text for text in texts if text]
+    if not texts:
+        doc = fitz.open(file_name)
+        texts = [doc.load_page(i).get_text("text") for i in range(doc.page_count)]
+        texts = [text for text in texts if text.strip()]
+    return texts
+
+
+STRATEGIES = {
+    "legacy (pypdf2, then fitz per file)": legacy_extract,
+    "pypdf2": lambda f: extract_pdf_pages(f, extractors=("pypdf2",)),
+    "fitz": lambda f: extract_pdf_pages(f, extractors=("fitz",)),
+    "fitz, pypdf2 fallback per page": extract_pdf_pages,
+}
+
+
+def write_synthetic_corpus(directory, documents, pages):
+    sentence = "Scope 1 and 2 emissions fell 42% against the 2019 baseline of 1.2 MtCO2e. "
+    for n in range(documents):
+        doc = fitz.open()
+        for p in range(pages):
+            page = doc.new_page()
+            # Leave every tenth page without a text layer, like a scanned insert.
+            if p % 10 != 9:
+                page.insert_textbox(page.rect + (50, 50, -50, -50), sentence * 30, fontsize=9)
+        doc.save(os.path.join(directory, f"report-{n:03d}.pdf"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", nargs="?", help="folder of PDFs")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="generate this many PDFs instead of reading a folder")
+    parser.add_argument("--pages", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.synthetic:
+            write_synthetic_corpus(tmp, args.synthetic, args.pages)
+            path = tmp
+        elif args.path:
+            path = args.path
+        else:
+            parser.error("give a folder of PDFs or --synthetic N")
+        pdfs = [f for f in files(path) if f.endswith(".pdf")]
+        total_pages = sum(fitz.open(f).page_count for f in pdfs)
+        for name, strategy in STRATEGIES.items():
+            start = time.perf_counter()
+            with_text = sum(len(strategy(f)) for f in pdfs)
+            seconds = time.perf_counter() - start
+            print(
+                f"{name:<38} {total_pages / seconds:9.1f} pages/s  "
+                f"{with_text}/{total_pages} pages with text"
+            )
+
+
+if __name__ == "__main__":
+    main()
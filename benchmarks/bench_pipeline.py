@@ -0,0 +1,397 @@
+"""End-to-end pipeline benchmark against the fake Vertex models.
+
+Generates a synthetic corpus of ESG report PDFs (and plain-text files) for a
+number of companies, then runs ingest -> clean -> chunk -> embed -> index ->
+retrieve -> answer -> parse with docqa.fakes standing in for
+TextEmbeddingModel and TextGenerationModel, at several corpus sizes. Each
+stage is run to completion before the next one, so its wall time,
+throughput and peak memory can be attributed to it. tracemalloc slows the
+Python-heavy stages several times over, so the stages are timed in one pass
+and their peak traced memory is taken in a second one. Parsing runs in
+worker processes, whose memory tracemalloc does not see; it is not traced.
+
+The import time of the docqa modules and of the CLI is measured too (see
+bench_startup.py). The results can be written as a JSON baseline and later
+runs compared against it; a stage whose throughput drops, or a startup that
+slows down, by more than --tolerance is reported and the script exits with
+status 1.
+
+benchmarks/pipeline_baseline.json holds a run with the default settings.
+
+Usage:
+    python benchmarks/bench_pipeline.py --baseline benchmarks/pipeline_baseline.json
+    python benchmarks/bench_pipeline.py --documents 10 40 --write-baseline baseline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import fitz
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tenacity import wait_fixed  # noqa: E402
+
+from docqa import metrics, pipeline  # noqa: E402
+from docqa.answers import normalize_answers  # noqa: E402
+from docqa.embedding import GECKO_MAX_BATCH_SIZE, BatchEmbedder  # noqa: E402
+from docqa.fakes import FakeEmbeddingModel, FakeEncoder, FakeGenerationModel  # noqa: E402
+from docqa.generation import AnswerEngine  # noqa: E402
+from docqa.ingest import files  # noqa: E402
+from docqa.queries import QueryEmbedder, sweep_contexts  # noqa: E402
+from docqa.tokens import get_encoder  # noqa: E402
+
+from bench_startup import startup_times  # noqa: E402
+
+WORDS = (
+    "emissions scope renewable electricity water intensity target baseline reduction "
+    "suppliers governance employees safety waste recycled board diversity audit climate "
+    "energy packaging circularity reporting disclosure assurance"
+).split()
+INDICATORS = [
+    ("net zero target", "date for net zero emission"),
+    ("interim emission reduction target", "interim emission reduction target value"),
+    ("Renewable Electricity Target", "Renewable Electricity Target value"),
+    ("Circularity Stratergy & targets", "Circularity Stratergy & targets value"),
+    ("Diversity, Equity and Inclusion target", "Diversity, Equity and Inclusion target value"),
+    ("supplier audit target", "supplier audit target value"),
+    ("water reduction target", "water reduction target value"),
+    ("waste to landfill target", "waste to landfill target value"),
+]
+
+
+def companies(count):
+    return [f"Company {i:03d}" for i in range(count)]
+
+
+def page_text(rng, company, page, pages):
+    lines = [f"{company} Sustainability Report 2022"]
+    for _ in range(28):
+        words = rng.choices(WORDS, k=12)
+        if rng.random() < 0.3:
+            words[rng.randrange(12)] = f"{rng.randint(1, 100)}% by {rng.choice([2025, 2030, 2050])}"
+        lines.append(" ".join(words) + ".")
+        if rng.random() < 0.15:
+            lines.append("")
+    lines.append(f"Page {page + 1} of {pages}")
+    return "\n".join(lines)
+
+
+def write_corpus(directory, documents, pages, text_share=0.0, seed=0):
+    """
+    Write a synthetic corpus: one report per company, a text_share of them
+    as .txt files and the rest as PDFs with pages pages.
+
+    Returns:
+        The company names the reports belong to.
+    """
+    rng = random.Random(seed)
+    names = companies(documents)
+    os.makedirs(directory, exist_ok=True)
+    for name in names:
+        stem = os.path.join(directory, name.lower().replace(" ", "-") + "-esg-report-2022")
+        texts = [page_text(rng, name, page, pages) for page in range(pages)]
+        if rng.random() < text_share:
+            with open(stem + ".txt", "w") as f:
+                f.write("\n\n".join(texts))
+            continue
+        document = fitz.open()
+        for text in texts:
+            page = document.new_page()
+            page.insert_text((36, 36), text, fontsize=7)
+        document.save(stem + ".pdf")
+        document.close()
+    return names
+
+
+def questions():
+    return [
+        {
+            "question": f"what is the {indicator} and also get the page number relevant for "
+            f"the information? Put it in the following format :{{ {field},page number }}",
+            "esgType": "Environment",
+            "esgIndicators": indicator.title().replace(" ", ""),
+        }
+        for indicator, field in INDICATORS
+    ]
+
+
+def build_prompt(context, question):
+    return f"""Answer the question with only to the point. If the answer is not contained in the context, say "NULL".
+
+        Context:
+        {context}?
+
+        Question:
+        {question}
+
+        Answer:
+        """
+
+
+class Stages:
+    """Runs the stages one at a time and records what each one cost."""
+
+    def __init__(self, trace_memory):
+        self.trace_memory = trace_memory
+        self.results = {}
+
+    def run(self, name, fn, count, unit, trace=True):
+        trace = trace and self.trace_memory
+        if trace:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        output = fn()
+        seconds = time.perf_counter() - start
+        items = count(output)
+        self.results[name] = {
+            "seconds": round(seconds, 4),
+            "items": items,
+            "unit": unit,
+            "per_second": round(items / seconds, 2) if seconds else None,
+            "peak_mb": (
+                round((tracemalloc.get_traced_memory()[1] - base) / 1e6, 2)
+                if trace
+                else None
+            ),
+        }
+        return output
+
+
+def run_pipeline(paths, entities, args, trace_memory=False):
+    stages = Stages(trace_memory)
+    encoder = FakeEncoder() if args.tokenizer == "fake" else get_encoder(args.tokenizer)
+    embedder = BatchEmbedder(
+        FakeEmbeddingModel(args.dimensions, latency=args.embed_latency),
+        max_batch_size=GECKO_MAX_BATCH_SIZE,
+        max_concurrency=args.concurrency,
+        retry_wait=wait_fixed(0),
+    )
+    engine = AnswerEngine(
+        FakeGenerationModel(latency=args.generate_latency),
+        max_concurrency=args.concurrency,
+        requests_per_minute=None,
+    )
+    question_list = questions()
+
+    pages = stages.run(
+        "ingest",
+        lambda: list(pipeline.ingest(paths, processes=args.processes)),
+        len,
+        "pages",
+        trace=False,
+    )
+    cleaned = stages.run("clean", lambda: list(pipeline.clean(pages)), len, "pages")
+    chunks = stages.run(
+        "chunk",
+        lambda: list(pipeline.chunk(cleaned, args.chunk_tokens, encoder=encoder)),
+        len,
+        "chunks",
+    )
+    batches = stages.run(
+        "embed",
+        lambda: list(pipeline.embed(chunks, embedder)),
+        lambda output: sum(len(batch) for batch, _ in output),
+        "chunks",
+    )
+    chunk_store, index = stages.run(
+        "index",
+        lambda: pipeline.build_index(batches, pipeline.entity_matcher(entities)),
+        lambda output: len(output[0]),
+        "chunks",
+    )
+    contexts = stages.run(
+        "retrieve",
+        lambda: sweep_contexts(
+            entities, question_list, QueryEmbedder(embedder), index, chunk_store, args.k
+        ),
+        len,
+        "pairs",
+    )
+    results = stages.run(
+        "answer",
+        lambda: list(
+            pipeline.answer(
+                entities,
+                question_list,
+                get_context=contexts.__getitem__,
+                answer_question=lambda question, context, top_matched_df: engine.generate(
+                    build_prompt(context, question)
+                ),
+                map_fn=engine.map,
+            )
+        ),
+        len,
+        "pairs",
+    )
+    frame = pd.DataFrame(
+        {
+            "company": result["entity"],
+            "esgType": result["question_data"]["esgType"],
+            "esgIndicators": result["question_data"]["esgIndicators"],
+            "primaryDetails": None,
+            "secondaryDetails": None,
+            "Answer": result["answer"],
+        }
+        for result in results
+    )
+    stages.run(
+        "parse",
+        lambda: normalize_answers(frame, categories=["company", "esgType", "esgIndicators"]),
+        len,
+        "answers",
+    )
+    tracemalloc.stop()
+    return stages.results
+
+
+def compare(baseline, report, tolerance, min_startup_change=0.05):
+    """
+    Regressions of report against baseline: stages whose throughput fell by
+    more than tolerance, and startups that got slower by more than tolerance
+    (and by at least min_startup_change seconds, to ignore noise).
+
+    Returns:
+        A list of messages.
+    """
+    regressions = []
+    for documents, stages in report["runs"].items():
+        for stage, result in stages.items():
+            before = baseline.get("runs", {}).get(documents, {}).get(stage)
+            if not before or not before["per_second"] or not result["per_second"]:
+                continue
+            if result["per_second"] < (1 - tolerance) * before["per_second"]:
+                regressions.append(
+                    f"{documents} documents, {stage}: "
+                    f"{before['per_second']:.1f}/s -> {result['per_second']:.1f}/s"
+                )
+    for name, seconds in report.get("startup", {}).items():
+        before = baseline.get("startup", {}).get(name)
+        if before and seconds > (1 + tolerance) * before and seconds - before >= min_startup_change:
+            regressions.append(f"{name}: {1000 * before:.0f} ms -> {1000 * seconds:.0f} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, nargs="+", default=[10, 40, 160])
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--text-share", type=float, default=0.0,
+                        help="share of the reports written as .txt (parsed by textract)")
+    parser.add_argument("--corpus-dir", help="keep the generated corpora here (default: a temp dir)")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--embed-latency", type=float, default=0.01,
+                        help="seconds per fake embedding request")
+    parser.add_argument("--generate-latency", type=float, default=0.02,
+                        help="seconds per fake generation request")
+    parser.add_argument("--dimensions", type=int, default=768)
+    parser.add_argument("--chunk-tokens", type=int, default=256)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--tokenizer", default="fake",
+                        help='"fake" (offline, word tokens) or a tiktoken encoding name')
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+                        help="skip the second, memory-traced pass")
+    parser.add_argument("--write-baseline", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against this JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="throughput drop reported as a regression")
+    parser.add_argument("--startup-repeat", type=int, default=3,
+                        help="interpreter starts per startup measurement (0: skip)")
+    parser.add_argument("--metrics", help="record docqa.metrics in the timed passes and "
+                        "write them here (.json or .prom)")
+    args = parser.parse_args()
+
+    corpus_root = args.corpus_dir or tempfile.mkdtemp(prefix="docqa-bench-")
+    runs = {}
+    try:
+        for documents in args.documents:
+            directory = os.path.join(
+                corpus_root, f"documents-{documents}-pages-{args.pages}-text-{args.text_share}"
+            )
+            start = time.perf_counter()
+            entities = write_corpus(directory, documents, args.pages, args.text_share)
+            paths = list(files(directory))
+            megabytes = sum(os.path.getsize(path) for path in paths) / 1e6
+            print(
+                f"\n{documents} documents x {args.pages} pages, {megabytes:.1f} MB "
+                f"(generated in {time.perf_counter() - start:.1f}s)"
+            )
+            if args.metrics:
+                metrics.enable()
+            stages = run_pipeline(paths, entities, args)
+            metrics.disable()
+            if args.memory:
+                traced = run_pipeline(paths, entities, args, trace_memory=True)
+                for name, result in stages.items():
+                    result["peak_mb"] = traced[name]["peak_mb"]
+            runs[str(documents)] = stages
+            for name, result in stages.items():
+                peak = f"{result['peak_mb']:9.1f} MB" if result["peak_mb"] is not None else ""
+                print(
+                    f"  {name:<9} {result['seconds']:9.3f}s {result['per_second']:12.1f} "
+                    f"{result['unit']}/s {peak}"
+                )
+            print(f"  total     {sum(r['seconds'] for r in stages.values()):9.3f}s")
+    finally:
+        if not args.corpus_dir:
+            shutil.rmtree(corpus_root, ignore_errors=True)
+    if args.metrics:
+        print(metrics.summary())
+        metrics.write(args.metrics)
+    max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+    print(f"\nmax RSS {max_rss_mb:.0f} MB")
+    startup = startup_times(args.startup_repeat) if args.startup_repeat else {}
+    if startup:
+        print("\nstartup")
+        for name, seconds in startup.items():
+            print(f"  {name:<28} {1000 * seconds:8.1f} ms")
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "config": {
+            name: getattr(args, name)
+            for name in [
+                "pages", "text_share", "processes", "concurrency", "embed_latency",
+                "generate_latency", "dimensions", "chunk_tokens", "k", "tokenizer", "memory",
+            ]
+        },
+        "max_rss_mb": round(max_rss_mb, 1),
+        "runs": runs,
+        "startup": startup,
+    }
+    if args.write_baseline:
+        with open(args.write_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"baseline written to {args.write_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != report["config"]:
+            print("warning: the baseline was recorded with different settings")
+        regressions = compare(baseline, report, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"nothing slower than the baseline by more than {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Startup cost: import time of the docqa modules and of the CLI.
+
+Every measurement runs in a fresh interpreter, so nothing is already in
+sys.modules; the best of --repeat runs is reported. bench_pipeline.py
+records the same numbers in its baseline.
+
+Usage:
+    python benchmarks/bench_startup.py --repeat 5
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = [
+    "docqa.metrics",
+    "docqa.models",
+    "docqa.answers",
+    "docqa.ingest",
+    "docqa.cache",
+    "docqa.store",
+    "docqa.pipeline",
+    "pandas",
+]
+
+
+def _run(args):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+    start = time.perf_counter()
+    subprocess.run([sys.executable, *args], cwd=ROOT, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def startup_times(repeat=3):
+    """
+    Wall time of a bare interpreter, of importing each of MODULES and of
+    "python -m docqa export" on final_metrics.csv, best of repeat runs.
+
+    Returns:
+        A dict of name -> seconds.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        targets = {"python": ["-c", "pass"]}
+        targets.update({f"import {module}": ["-c", f"import {module}"] for module in MODULES})
+        targets["python -m docqa export"] = [
+            "-m", "docqa", "export", "final_metrics.csv", "-o", os.path.join(directory, "out.csv"),
+        ]
+        return {
+            name: round(min(_run(args) for _ in range(repeat)), 4)
+            for name, args in targets.items()
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    for name, seconds in startup_times(args.repeat).items():
+        print(f"{name:<28} {1000 * seconds:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
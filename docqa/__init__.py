@@ -0,0 +1,38 @@
+"""Shared building blocks for the document question answering scripts.
+
+The notebooks (PDF_Context_extraction.py, Vendor_Document_Analysis.py and
+Sustainability_BenchMarking.py) import from here instead of re-defining the
+same helpers in every file. They share these behaviours:
+
+Model clients
+    docqa.models creates the embedding and generation clients on first use,
+    so cells that only read cached answers or a saved store do not import
+    vertexai or load a model.
+
+Embedding cache
+    Chunks are packed into multi-text embedding requests with a few requests
+    in flight; a chunk that still fails on its own gets a zero vector, so it
+    never matches. Vectors are cached on disk by (model, chunk text)
+    (docqa.cache.CachedEmbedder), so unchanged documents are not re-embedded
+    and each sweep question is embedded once.
+
+Answer cache
+    Prompts are answered concurrently by docqa.generation.AnswerEngine: at
+    most max_concurrency requests in flight, throttled client-side to the
+    model quota, retried with backoff, results in prompt order. Answers are
+    cached on disk by (model, parameters, prompt) (docqa.cache.CachedGenerator),
+    so a re-run only asks the prompts whose question or context changed.
+
+Sweep journal
+    docqa.journal.SweepJournal appends every answered pair to a file as soon
+    as it completes, so after a quota error or kernel restart a re-run only
+    asks the missing pairs. The journal is tied to the index, prompt and
+    question set and is retired once the sweep completes, so a refreshed
+    index or an edited prompt starts a new sweep (unchanged prompts are still
+    answered from the answer cache).
+
+Metrics
+    Per-stage latency histograms, call/retry counts and bytes/tokens
+    processed (docqa.metrics) are only recorded when the DOCQA_METRICS
+    environment variable is set.
+"""
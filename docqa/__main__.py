@@ -0,0 +1,59 @@
+"""Command line entry points that do not need the models or the corpus.
+
+    python -m docqa export final_metrics.csv -o final_metrics_typed.csv
+
+Only the modules a command uses are imported, and the heavy ones (pandas,
+the PDF parsers, vertexai, tiktoken) not at all, so a command starts in a
+fraction of a second.
+"""
+
+import argparse
+import csv
+import sys
+
+
+def export(args):
+    """Re-export a results CSV with its answers parsed into typed columns."""
+    from docqa.answers import VALUE_COLUMNS, parse_answer
+
+    with open(args.results, newline="") as f:
+        reader = csv.DictReader(f)
+        fields = [name for name in reader.fieldnames if name not in VALUE_COLUMNS]
+        rows = list(reader)
+    if args.answer_column not in fields:
+        sys.exit(f"{args.results} has no {args.answer_column!r} column")
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        writer = csv.DictWriter(out, fields + VALUE_COLUMNS)
+        writer.writeheader()
+        for row in rows:
+            value, page, is_null = parse_answer(row[args.answer_column])
+            row.update(value=value, page=page, is_null=is_null)
+            if "primaryDetails" in row:
+                row["primaryDetails"] = "No" if is_null else "Yes"
+            if "secondaryDetails" in row:
+                row["secondaryDetails"] = value
+            writer.writerow({name: row.get(name) for name in fields + VALUE_COLUMNS})
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    if args.output:
+        print(f"{len(rows)} answers written to {args.output}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m docqa", description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("export", help=export.__doc__)
+    command.add_argument("results", help="results CSV with an answer column")
+    command.add_argument("-o", "--output", help="output CSV (default: stdout)")
+    command.add_argument("--answer-column", default="Answer")
+    command.set_defaults(run=export)
+
+    args = parser.parse_args(argv)
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
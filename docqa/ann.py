@@ -0,0 +1,293 @@
+"""Approximate nearest neighbour indexes for large vector stores.
+
+VectorIndex scores every chunk for every query, which is fine for a few
+contracts but not for hundreds of thousands of chunks. The indexes here keep
+the VectorIndex interface (search, search_batch, partitions), so they can be
+passed anywhere a VectorIndex is, and accept new documents with add():
+
+    IVFIndex   inverted file index on NumPy: chunks are clustered with
+               k-means and a query only scores the n_probe closest clusters.
+    HNSWIndex  graph index backed by hnswlib (optional dependency).
+
+Searches restricted to a partition stay exact: a partition is one entity's
+contiguous rows, which is already a small scan.
+"""
+
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from docqa.retrieval import VectorIndex, _top_k_batch
+
+
+def _normalized(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+class _IncrementalIndex(VectorIndex, ABC):
+    """VectorIndex whose rows can be appended to; subclasses index the new rows."""
+
+    def __init__(self, embeddings, metric="cosine", partitions=None):
+        super().__init__(embeddings, metric=metric, partitions=partitions)
+        self._size = self.matrix.shape[0]
+        self._buffers = (self.matrix, self.norms, self._inv_norms)
+
+    def _append(self, embeddings):
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if embeddings.ndim != 2 or (self._size and embeddings.shape[1] != self.dimensions):
+            raise ValueError(
+                f"expected (rows x {self.dimensions}) embeddings, got shape {embeddings.shape}"
+            )
+        start, stop = self._size, self._size + embeddings.shape[0]
+        matrix, norms, inv_norms = self._buffers
+        if stop > matrix.shape[0] or matrix.shape[1] != embeddings.shape[1]:
+            # Capacity doubles, so appending document by document stays linear.
+            capacity = max(stop, 2 * matrix.shape[0])
+            grown = (
+                np.empty((capacity, embeddings.shape[1]), dtype=np.float32),
+                np.empty(capacity, dtype=np.float32),
+                np.empty(capacity, dtype=np.float32),
+            )
+            for old, new in zip(self._buffers, grown):
+                new[:start] = old[:start]
+            matrix, norms, inv_norms = self._buffers = grown
+        matrix[start:stop] = embeddings
+        norms[start:stop] = np.linalg.norm(embeddings, axis=1)
+        with np.errstate(divide="ignore"):
+            inv_norms[start:stop] = np.where(norms[start:stop] > 0, 1.0 / norms[start:stop], 0.0)
+        self._size = stop
+        self.matrix, self.norms, self._inv_norms = matrix[:stop], norms[:stop], inv_norms[:stop]
+        return start, stop
+
+    def add(self, embeddings, partition=None):
+        """
+        Append new chunks, e.g. the chunks of newly ingested documents.
+
+        Rows are added after the existing ones, so the vector store should be
+        extended with the matching rows in the same order.
+
+        Args:
+            embeddings: (chunks x dimensions) array.
+            partition: Optional label (company, document id) for the new rows;
+                it must not already be a partition of the index.
+
+        Returns:
+            The (start, stop) rows the chunks were stored at.
+        """
+        if partition is not None and partition in self.partitions:
+            raise ValueError(f"partition {partition!r} is already in the index")
+        start, stop = self._append(embeddings)
+        self._insert(start, stop)
+        if partition is not None:
+            self.partitions[partition] = (start, stop)
+        return start, stop
+
+    @abstractmethod
+    def _insert(self, start, stop):
+        """Index rows start:stop, already appended to the matrix."""
+
+    @abstractmethod
+    def _search_all(self, queries, k):
+        """Return (positions, scores) of the top k rows for each query."""
+
+    def search(self, query, k=2, partition=None):
+        if partition is not None:
+            return super().search(query, k, partition)
+        positions, scores = self._search_all(np.asarray(query)[None, :], k)
+        return positions[0], scores[0]
+
+    def search_batch(self, queries, k=2, partition=None):
+        if partition is not None:
+            return super().search_batch(queries, k, partition)
+        return self._search_all(queries, k)
+
+
+class IVFIndex(_IncrementalIndex):
+    """
+    Inverted file index: chunks are grouped into n_lists clusters and a query
+    only scores the chunks of the n_probe clusters closest to it.
+
+    Raising n_probe raises recall and latency; n_probe == n_lists is an exact
+    search. Chunks added later are assigned to the existing clusters; rebuild
+    the index once the corpus has grown several times over.
+
+    Args:
+        embeddings: (chunks x dimensions) array.
+        n_lists: Number of clusters (default: about the square root of the
+            number of chunks).
+        n_probe: Clusters scored per query.
+        metric: "cosine" or "dot", as in VectorIndex.
+        partitions: As in VectorIndex.
+        train_size: Chunks sampled to train the clusters.
+        iterations: k-means iterations.
+        seed: Seed for the sampling and the initial centroids.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        n_lists=None,
+        n_probe=8,
+        metric="cosine",
+        partitions=None,
+        train_size=65536,
+        iterations=10,
+        seed=0,
+    ):
+        super().__init__(embeddings, metric=metric, partitions=partitions)
+        if len(self) == 0:
+            raise ValueError("IVFIndex needs embeddings to train its clusters")
+        self.n_lists = min(n_lists or max(1, int(np.sqrt(len(self)))), len(self))
+        self.n_probe = n_probe
+        self.centroids = self._train(train_size, iterations, np.random.default_rng(seed))
+        # Each cluster keeps its own contiguous copy of its rows, so a probe is
+        # one matrix product instead of a gather from the full matrix.
+        self._lists = [np.empty(0, dtype=np.int64) for _ in range(self.n_lists)]
+        self._list_vectors = [
+            np.empty((0, self.dimensions), dtype=np.float32) for _ in range(self.n_lists)
+        ]
+        self._insert(0, len(self))
+
+    def _train(self, train_size, iterations, rng):
+        rows = len(self)
+        sample = self.matrix
+        if rows > train_size:
+            sample = self.matrix[rng.choice(rows, train_size, replace=False)]
+        sample = _normalized(sample)
+        centroids = sample[rng.choice(sample.shape[0], self.n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            counts = np.bincount(assignment, minlength=self.n_lists)
+            empty = counts == 0
+            # Re-seed empty clusters with random chunks instead of dropping them.
+            sums[empty] = sample[rng.choice(sample.shape[0], int(empty.sum()))]
+            centroids = _normalized(sums)
+        return centroids
+
+    def _assign(self, start, stop, block=65536):
+        assignment = np.empty(stop - start, dtype=np.int64)
+        for offset in range(start, stop, block):
+            end = min(offset + block, stop)
+            assignment[offset - start : end - start] = np.argmax(
+                self.matrix[offset:end] @ self.centroids.T, axis=1
+            )
+        return assignment
+
+    def _insert(self, start, stop):
+        assignment = self._assign(start, stop)
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(self.n_lists + 1))
+        ids = order + start
+        for list_id in np.flatnonzero(np.diff(bounds)):
+            members = ids[bounds[list_id] : bounds[list_id + 1]]
+            vectors = self.matrix[members]
+            if self.metric == "cosine":
+                vectors = vectors * self._inv_norms[members, None]
+            self._lists[list_id] = np.concatenate((self._lists[list_id], members))
+            self._list_vectors[list_id] = np.concatenate((self._list_vectors[list_id], vectors))
+
+    def _search_all(self, queries, k):
+        queries = self._prepare_queries(np.atleast_2d(queries))
+        n_queries = queries.shape[0]
+        n_probe = min(self.n_probe, self.n_lists)
+        k = min(k, len(self))
+        probes = _top_k_batch(_normalized(queries) @ self.centroids.T, n_probe)
+        # Each probed cluster contributes its best k per query to a
+        # (queries x n_probe * k) candidate table; the final top-k is taken
+        # over that table. Clusters are visited once, with all queries that
+        # probe them scored in one matrix product.
+        candidate_ids = np.full((n_queries, n_probe * k), -1, dtype=np.int64)
+        candidate_scores = np.full((n_queries, n_probe * k), -np.inf, dtype=np.float32)
+        flat = probes.ravel()
+        order = np.argsort(flat, kind="stable")
+        bounds = np.searchsorted(flat[order], np.arange(self.n_lists + 1))
+        for list_id in np.flatnonzero(np.diff(bounds)):
+            entries = order[bounds[list_id] : bounds[list_id + 1]]
+            rows, slots = np.divmod(entries, n_probe)
+            scores = queries[rows] @ self._list_vectors[list_id].T
+            top = _top_k_batch(scores, k)
+            columns = slots[:, None] * k + np.arange(top.shape[1])
+            candidate_ids[rows[:, None], columns] = self._lists[list_id][top]
+            candidate_scores[rows[:, None], columns] = np.take_along_axis(scores, top, axis=1)
+        top = _top_k_batch(candidate_scores, k)
+        positions = np.take_along_axis(candidate_ids, top, axis=1)
+        scores = np.take_along_axis(candidate_scores, top, axis=1)
+        short = np.flatnonzero(positions[:, -1] < 0) if k else []
+        if len(short):
+            # The probed clusters held fewer than k chunks: search those
+            # queries exactly.
+            positions[short], scores[short] = VectorIndex.search_batch(self, queries[short], k)
+        return positions, scores
+
+
+class HNSWIndex(_IncrementalIndex):
+    """
+    Hierarchical navigable small world graph index backed by hnswlib.
+
+    Raising ef raises recall and latency; M and ef_construction trade build
+    time and memory for graph quality.
+
+    Args:
+        embeddings: (chunks x dimensions) array.
+        ef: Candidate list size at query time (at least k).
+        M: Graph links per node.
+        ef_construction: Candidate list size while inserting.
+        metric: "cosine" or "dot", as in VectorIndex.
+        partitions: As in VectorIndex.
+        threads: Threads used by hnswlib for inserts and batch queries.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        ef=64,
+        M=16,
+        ef_construction=200,
+        metric="cosine",
+        partitions=None,
+        threads=-1,
+    ):
+        try:
+            import hnswlib
+        except ImportError as error:
+            raise ImportError(
+                "HNSWIndex needs hnswlib (pip install hnswlib); IVFIndex has no extra dependencies"
+            ) from error
+        super().__init__(embeddings, metric=metric, partitions=partitions)
+        self.threads = threads
+        self._graph = hnswlib.Index(space="cosine" if metric == "cosine" else "ip", dim=self.dimensions)
+        self._graph.init_index(
+            max_elements=max(len(self), 1), M=M, ef_construction=ef_construction
+        )
+        self.ef = ef
+        self._insert(0, len(self))
+
+    @property
+    def ef(self):
+        return self._ef
+
+    @ef.setter
+    def ef(self, value):
+        self._ef = value
+        self._graph.set_ef(value)
+
+    def _insert(self, start, stop):
+        if stop > self._graph.get_max_elements():
+            self._graph.resize_index(max(stop, 2 * self._graph.get_max_elements()))
+        if stop > start:
+            self._graph.add_items(
+                self.matrix[start:stop], np.arange(start, stop), num_threads=self.threads
+            )
+
+    def _search_all(self, queries, k):
+        k = min(k, len(self))
+        if self._ef < k:
+            self.ef = k
+        labels, distances = self._graph.knn_query(
+            np.atleast_2d(queries).astype(np.float32), k=k, num_threads=self.threads
+        )
+        # hnswlib returns 1 - similarity for both spaces.
+        return labels.astype(np.int64), (1.0 - distances).astype(np.float32)
@@ -0,0 +1,183 @@
+"""Fitting retrieved context into the model's prompt budget.
+
+Retrieved chunks are packed into the prompt best-first for as long as they
+fit. When every retrieved chunk should be considered and they do not fit in
+one prompt, the fragments are answered concurrently and one extra call
+combines the partial answers. If the partial answers do not fit in one
+combine prompt either, they are combined in groups that do, level by level,
+until one answer is left.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from docqa.chunking import chunk_text
+from docqa.tokens import PromptTemplate
+
+COMBINE_PROMPT = PromptTemplate("""The answers below were given to the same question, each from a different part of the documents.
+Combine them into one answer to the question, keeping only what is supported by an answer. If every answer is "NULL", say "NULL".
+
+Question:
+{question}
+
+Answers:
+{answers}
+
+Answer:
+""")
+
+
+def split_oversized(chunks, counter, budget):
+    """
+    Split chunks that do not fit in the budget on their own.
+
+    Args:
+        chunks: Chunk texts, best match first.
+        counter: A docqa.tokens.TokenCounter.
+        budget: Tokens available for context in one prompt.
+
+    Returns:
+        A list of texts, each at most budget tokens, in the original order.
+    """
+    pieces = []
+    for text in chunks:
+        if counter.count(text) <= budget:
+            pieces.append(text)
+        else:
+            pieces.extend(
+                piece.text
+                for piece in chunk_text(text, max_tokens=budget, overlap=0, encoder=counter.encoder)
+            )
+    return pieces
+
+
+def pack_context(chunks, counter, budget):
+    """
+    Pick the best-ranked chunks that fit in the budget.
+
+    Chunks are taken in rank order; one that does not fit is skipped and
+    smaller, lower-ranked chunks may still be taken after it.
+
+    Args:
+        chunks: Chunk texts, best match first.
+        counter: A docqa.tokens.TokenCounter.
+        budget: Tokens available for context.
+
+    Returns:
+        (selected, rest): the chunks that fit, and the ones that did not,
+        both in rank order.
+    """
+    selected = []
+    rest = []
+    used = 0
+    for text, tokens in zip(chunks, counter.count_many(chunks)):
+        if used + tokens <= budget:
+            selected.append(text)
+            used += tokens
+        else:
+            rest.append(text)
+    return selected, rest
+
+
+def pack_fragments(chunks, counter, budget):
+    """Partition chunks into prompt-sized fragments, best-ranked first."""
+    fragments = []
+    while chunks:
+        selected, chunks = pack_context(chunks, counter, budget)
+        if not selected:
+            raise ValueError("a chunk is larger than the context budget; split it first")
+        fragments.append(selected)
+    return fragments
+
+
+def combine_answers(
+    question, answers, generate, counter, token_limit, combine_prompt=COMBINE_PROMPT, max_workers=4
+):
+    """
+    Combine partial answers to a question into one.
+
+    The answers are combined in one call when they fit in the token limit,
+    and otherwise in a tree: groups that fit are combined concurrently and
+    the combined answers are grouped again.
+
+    Args:
+        question: The question text.
+        answers: The partial answers.
+        generate: Callable prompt -> answer text.
+        counter: A docqa.tokens.TokenCounter.
+        token_limit: Maximum tokens of one prompt.
+        combine_prompt: PromptTemplate with {question} and {answers} fields.
+        max_workers: Concurrent combine calls per level.
+
+    Returns:
+        The combined answer text.
+    """
+    budget = token_limit - combine_prompt.count_tokens(counter, question=question, answers=[])
+    if budget <= 0:
+        raise ValueError(f"the combine prompt alone exceeds the {token_limit}-token limit")
+
+    def combine(group):
+        return generate(combine_prompt.format(question=question, answers="\n".join(group)))
+
+    while True:
+        lines = split_oversized([f"- {answer.strip()}" for answer in answers], counter, budget)
+        groups = pack_fragments(lines, counter, budget)
+        if len(groups) <= 1:
+            return combine(groups[0] if groups else [])
+        if len(groups) >= len(answers):
+            raise ValueError(
+                f"the partial answers are too long to combine within the {token_limit}-token limit"
+            )
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            answers = list(pool.map(combine, groups))
+
+
+def answer_with_context(
+    question,
+    chunks,
+    generate,
+    counter,
+    prompt,
+    token_limit,
+    map_reduce=False,
+    max_workers=4,
+    combine_prompt=COMBINE_PROMPT,
+):
+    """
+    Answer a question from retrieved chunks within the prompt token limit.
+
+    Args:
+        question: The question text.
+        chunks: Retrieved chunk texts, best match first.
+        generate: Callable prompt -> answer text.
+        counter: A docqa.tokens.TokenCounter.
+        prompt: PromptTemplate with {context} and {question} fields.
+        token_limit: Maximum tokens of one prompt.
+        map_reduce: If False, only the best chunks that fit in one prompt are
+            used (one call). If True, chunks that do not fit are answered in
+            further prompts concurrently and the answers are combined, see
+            combine_answers.
+        max_workers: Concurrent calls for the map and combine steps.
+        combine_prompt: PromptTemplate with {question} and {answers} fields.
+
+    Returns:
+        The answer text.
+    """
+    budget = token_limit - prompt.count_tokens(counter, context=[], question=question)
+    if budget <= 0:
+        raise ValueError(f"the question alone exceeds the {token_limit}-token limit")
+    pieces = split_oversized(chunks, counter, budget)
+    if map_reduce:
+        fragments = pack_fragments(pieces, counter, budget) or [[]]
+    else:
+        fragments = [pack_context(pieces, counter, budget)[0]]
+
+    def answer_fragment(fragment):
+        return generate(prompt.format(context=" ".join(fragment), question=question))
+
+    if len(fragments) == 1:
+        return answer_fragment(fragments[0])
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        partial_answers = list(pool.map(answer_fragment, fragments))
+    return combine_answers(
+        question, partial_answers, generate, counter, token_limit, combine_prompt, max_workers
+    )
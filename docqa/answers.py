@@ -0,0 +1,115 @@
+"""Parsing generated answers into typed value and page columns.
+
+The prompts ask for answers in the form "{ value, page number }", and the
+model mostly complies: "{ A, 10 }", "{2050, 4}", "{ NULL, NULL }", but also
+"{ GRI rating target value: 4, page number: 10 }" or free text. The
+notebooks post-processed the results row by row with DataFrame.iterrows();
+normalize_answers() parses the whole column with compiled patterns through
+the pandas string methods instead; parse_answer() applies the same patterns
+to one answer, for callers that do not need pandas (python -m docqa export).
+"""
+
+import re
+
+# "{ value , page }" with optional braces; the page is the last
+# comma-separated field and may be labelled "page number:". Anything else
+# (free text, a dict) does not match and is kept whole as the value.
+ANSWER_PATTERN = re.compile(
+    r"""^\s*\{?\s*
+    (?P<value>.*?)\s*,\s*
+    (?:['"]?page\s*(?:number|no\.?)?['"]?\s*:\s*)?['"]?
+    (?P<page>\d+|NULL|N/?A|None)?
+    ['"]?\s*\}?\s*$""",
+    re.IGNORECASE | re.VERBOSE | re.DOTALL,
+)
+# An echoed label in front of the value: "Circularity targets value: NULL",
+# "GRI rating target value,page number For ESCO : 4".
+VALUE_LABEL = re.compile(r"^[^:{}]*\bvalue\b[^:{}]*:\s*", re.IGNORECASE)
+# Values meaning the information was not found.
+NULL_VALUE = re.compile(r"^(?:NULL|N/?A|None|Not available|)\.?$", re.IGNORECASE)
+
+VALUE_COLUMNS = ["value", "page", "is_null"]
+
+
+def parse_answer(answer):
+    """
+    Split one answer into value, page number and NULL status, like
+    parse_answers() does for a column.
+
+    Args:
+        answer: The answer string, or None.
+
+    Returns:
+        (value, page, is_null): value is None when the answer is NULL or
+        missing, page an int or None.
+    """
+    answer = (answer or "").strip()
+    match = ANSWER_PATTERN.match(answer)
+    value = match.group("value") if match else answer
+    page = match.group("page") if match else None
+    value = VALUE_LABEL.sub("", value, count=1).strip()
+    is_null = NULL_VALUE.fullmatch(value) is not None
+    return (
+        None if is_null else value,
+        int(page) if page and page.isdigit() else None,
+        is_null,
+    )
+
+
+def parse_answers(answers):
+    """
+    Split answers into value, page number and NULL status.
+
+    Args:
+        answers: Series of answer strings (missing answers allowed).
+
+    Returns:
+        A DataFrame with the index of answers and columns "value" (string,
+        <NA> when the answer is NULL or missing), "page" (Int64, <NA> when
+        not given) and "is_null" (bool).
+    """
+    import pandas as pd
+
+    answers = answers.astype("string").str.strip()
+    parts = answers.str.extract(ANSWER_PATTERN)
+    # Unparseable answers are kept whole.
+    value = parts["value"].fillna(answers).str.replace(VALUE_LABEL, "", regex=True).str.strip()
+    is_null = value.isna() | value.str.fullmatch(NULL_VALUE).fillna(True).astype(bool)
+    page = pd.to_numeric(parts["page"].where(parts["page"].str.isdigit()), errors="coerce")
+    return pd.DataFrame(
+        {
+            "value": value.mask(is_null),
+            "page": page.astype("Int64"),
+            "is_null": is_null,
+        },
+        index=answers.index,
+    )
+
+
+def normalize_answers(results, answer_column="Answer", categories=()):
+    """
+    Add the parsed value, page and NULL status of every answer to a results
+    frame and fill its primaryDetails/secondaryDetails columns: "Yes" or
+    "No" for whether the information was found, and the value found.
+
+    Args:
+        results: DataFrame of generated answers, one row per question.
+        answer_column: Column holding the raw answers.
+        categories: Columns to store as categoricals (e.g. the company and
+            the ESG type, which repeat on every row).
+
+    Returns:
+        A new DataFrame with typed "value", "page" and "is_null" columns
+        after the original columns.
+    """
+    import pandas as pd
+
+    parsed = parse_answers(results[answer_column])
+    typed = results.drop(columns=VALUE_COLUMNS, errors="ignore").join(parsed)
+    typed["primaryDetails"] = pd.Series("Yes", index=typed.index, dtype="string").mask(
+        typed["is_null"], "No"
+    )
+    typed["secondaryDetails"] = typed["value"]
+    for column in categories:
+        typed[column] = typed[column].astype("category")
+    return typed
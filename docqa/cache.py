@@ -0,0 +1,444 @@
+"""Persistent, content-addressed caches for model calls.
+
+Embeddings are stored in a SQLite file keyed by a hash of (model name,
+normalized chunk text), as raw float32 bytes. SQLite in WAL mode lets several
+worker processes read and write the same cache file safely, and the least
+recently used entries are evicted once the cache grows past its size limit.
+
+Generated answers are cached the same way, keyed by a hash of (model name,
+generation parameters, prompt), with an optional time to live, so re-running
+a sweep only asks the model the prompts that changed.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from docqa import metrics
+
+_WHITESPACE = re.compile(r"\s+")
+
+DEFAULT_MAX_BYTES = 2 * 1024**3
+DEFAULT_MAX_ANSWERS = 200_000
+
+
+def normalize_text(text):
+    """Collapse whitespace so re-extracted but unchanged chunks hit the cache."""
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def cache_key(model_name, text):
+    """
+    Content address of a chunk's embedding.
+
+    Args:
+        model_name: Embedding model name, e.g. "textembedding-gecko@001".
+        text: The chunk text.
+
+    Returns:
+        A 32-byte sha256 digest of the model name and the normalized text.
+    """
+    digest = hashlib.sha256(model_name.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(normalize_text(text).encode("utf-8"))
+    return digest.digest()
+
+
+def _connect(path, timeout):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(
+        path, timeout=timeout, check_same_thread=False, isolation_level=None
+    )
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+class EmbeddingCache:
+    """
+    On-disk LRU cache of embedding vectors.
+
+    Args:
+        path: SQLite file to use; created (with its directory) if missing.
+        max_bytes: Size limit for the stored vectors. When a write pushes the
+            cache past it, least recently used entries are evicted.
+        timeout: Seconds to wait for another process holding the write lock.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, timeout=60.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = _connect(path, timeout)
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                key BLOB PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings(last_access)"
+        )
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def size_bytes(self):
+        """Total bytes of stored vectors."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+            ).fetchone()
+        return row[0]
+
+    def get_many(self, model_name, texts):
+        """
+        Look up the embeddings of several texts.
+
+        Args:
+            model_name: Embedding model name.
+            texts: Sequence of texts.
+
+        Returns:
+            A list with one float32 vector per text, or None where the text
+            is not cached.
+        """
+        keys = [cache_key(model_name, text) for text in texts]
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit.
+            for start in range(0, len(keys), 500):
+                batch = keys[start : start + 500]
+                placeholders = ",".join("?" * len(batch))
+                found.update(
+                    self._connection.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                        batch,
+                    ).fetchall()
+                )
+            if found:
+                now = time.time()
+                self._connection.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+        vectors = []
+        for key in keys:
+            blob = found.get(key)
+            vectors.append(None if blob is None else np.frombuffer(blob, dtype=np.float32))
+        hits = sum(v is not None for v in vectors)
+        self.hits += hits
+        self.misses += len(vectors) - hits
+        return vectors
+
+    def put_many(self, model_name, texts, vectors):
+        """
+        Store the embeddings of several texts and evict if over the limit.
+
+        Args:
+            model_name: Embedding model name.
+            texts: Sequence of texts.
+            vectors: Matching sequence (or 2-D array) of embeddings.
+        """
+        now = time.time()
+        rows = [
+            (
+                cache_key(model_name, text),
+                np.ascontiguousarray(vector, dtype=np.float32).tobytes(),
+                now,
+            )
+            for text, vector in zip(texts, vectors)
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, last_access) "
+                    "VALUES (?, ?, ?)",
+                    rows,
+                )
+                self._evict()
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    def _evict(self):
+        total = self._connection.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()[0]
+        while total > self.max_bytes:
+            oldest = self._connection.execute(
+                "SELECT key, LENGTH(vector) FROM embeddings "
+                "ORDER BY last_access LIMIT 256"
+            ).fetchall()
+            if not oldest:
+                break
+            evicted = []
+            for key, size in oldest:
+                if total <= self.max_bytes:
+                    break
+                evicted.append((key,))
+                total -= size
+            self._connection.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+
+
+class CachedEmbedder:
+    """
+    Wraps a BatchEmbedder so only texts missing from the cache are embedded.
+
+    Args:
+        embedder: A docqa.embedding.BatchEmbedder.
+        cache: An EmbeddingCache.
+        model_name: Name the vectors are cached under; use the name passed to
+            TextEmbeddingModel.from_pretrained.
+    """
+
+    def __init__(self, embedder, cache, model_name):
+        self.embedder = embedder
+        self.cache = cache
+        self.model_name = model_name
+        self.failed_positions = []
+
+    def embed(self, texts):
+        """
+        Embed a sequence of texts, reusing cached vectors.
+
+        Args:
+            texts: Sequence of texts.
+
+        Returns:
+            A (texts x dimensions) float32 array in input order.
+        """
+        texts = list(texts)
+        cached = self.cache.get_many(self.model_name, texts)
+        # Identical chunks (repeated headers, boilerplate clauses) are only
+        # embedded once.
+        missing = {}
+        for position, vector in enumerate(cached):
+            if vector is None:
+                missing.setdefault(normalize_text(texts[position]), []).append(position)
+        self.failed_positions = []
+        # Both counted per text position, so hits / (hits + misses) is the
+        # share of the input served from the cache.
+        misses = sum(map(len, missing.values()))
+        metrics.count("embedding_cache_hits", len(texts) - misses)
+        metrics.count("embedding_cache_misses", misses)
+        if missing:
+            first_positions = [positions[0] for positions in missing.values()]
+            missing_texts = [texts[p] for p in first_positions]
+            fresh = self.embedder.embed(missing_texts)
+            failed = set(getattr(self.embedder, "failed_positions", ()))
+            keep = [i for i in range(len(missing_texts)) if i not in failed]
+            self.cache.put_many(
+                self.model_name, [missing_texts[i] for i in keep], fresh[keep]
+            )
+            for i, positions in enumerate(missing.values()):
+                for position in positions:
+                    cached[position] = fresh[i]
+                    if i in failed:
+                        self.failed_positions.append(position)
+            self.failed_positions.sort()
+        dimensions = next((len(v) for v in cached if v is not None), 0)
+        matrix = np.zeros((len(texts), dimensions), dtype=np.float32)
+        for position, vector in enumerate(cached):
+            matrix[position] = vector
+        return matrix
+
+    def embed_one(self, text):
+        """Embed a single text and return a 1-D vector."""
+        return self.embed([text])[0]
+
+
+def answer_key(model_name, prompt, params=None):
+    """
+    Content address of a generated answer.
+
+    Args:
+        model_name: Generation model name, e.g. "text-bison@001".
+        prompt: The full prompt text; it contains the question and the
+            retrieved context, so a change to either is a new key.
+        params: Generation parameters (temperature, max_output_tokens, ...).
+
+    Returns:
+        A 32-byte sha256 digest.
+    """
+    digest = hashlib.sha256(model_name.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(json.dumps(params or {}, sort_keys=True, default=str).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(prompt.encode("utf-8"))
+    return digest.digest()
+
+
+class AnswerCache:
+    """
+    On-disk cache of generated answers with a TTL and LRU eviction.
+
+    Args:
+        path: SQLite file to use (may be the embedding cache's file); created
+            if missing.
+        ttl: Seconds an answer stays valid; None keeps answers until evicted.
+        max_entries: When a write pushes the cache past this many answers,
+            the least recently used ones are evicted.
+        timeout: Seconds to wait for another process holding the write lock.
+    """
+
+    def __init__(self, path, ttl=None, max_entries=DEFAULT_MAX_ANSWERS, timeout=60.0):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = _connect(path, timeout)
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS answers (
+                key BLOB PRIMARY KEY,
+                answer TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS answers_last_access ON answers(last_access)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS answers_created ON answers(created)")
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+    @property
+    def hit_rate(self):
+        """Share of lookups answered from the cache since it was opened."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, key):
+        """
+        Look up an answer.
+
+        Args:
+            key: A key from answer_key().
+
+        Returns:
+            The cached answer, or None if it is missing or expired.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT answer, created FROM answers WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl is not None and row[1] < now - self.ttl:
+                self._connection.execute("DELETE FROM answers WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._connection.execute(
+                "UPDATE answers SET last_access = ? WHERE key = ?", (now, key)
+            )
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, answer):
+        """Store an answer, dropping expired ones and evicting if over the limit."""
+        now = time.time()
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO answers (key, answer, created, last_access) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, answer, now, now),
+                )
+                if self.ttl is not None:
+                    self._connection.execute(
+                        "DELETE FROM answers WHERE created < ?", (now - self.ttl,)
+                    )
+                excess = (
+                    self._connection.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+                    - self.max_entries
+                )
+                if excess > 0:
+                    self._connection.execute(
+                        "DELETE FROM answers WHERE key IN "
+                        "(SELECT key FROM answers ORDER BY last_access LIMIT ?)",
+                        (excess,),
+                    )
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+
+
+class CachedGenerator:
+    """
+    Wraps an AnswerEngine so prompts answered before are not sent again.
+
+    Cache hits do not count against the engine's rate limit, so an unchanged
+    sweep finishes without calling the model.
+
+    Args:
+        engine: A docqa.generation.AnswerEngine.
+        cache: An AnswerCache.
+        model_name: Name the answers are cached under; use the name passed
+            to TextGenerationModel.from_pretrained.
+    """
+
+    def __init__(self, engine, cache, model_name):
+        self.engine = engine
+        self.cache = cache
+        self.model_name = model_name
+
+    def generate(self, prompt):
+        """Answer one prompt from the cache, or with the engine on a miss."""
+        key = answer_key(self.model_name, prompt, self.engine.predict_kwargs)
+        answer = self.cache.get(key)
+        if answer is None:
+            metrics.count("answer_cache_misses")
+            answer = self.engine.generate(prompt)
+            self.cache.put(key, answer)
+        else:
+            metrics.count("answer_cache_hits")
+        return answer
+
+    def map(self, fn, items):
+        """Run fn over items on the engine's thread pool, see AnswerEngine.map."""
+        return self.engine.map(fn, items)
+
+    def generate_all(self, prompts):
+        """Answer many prompts concurrently; results are in input order."""
+        return list(self.map(self.generate, prompts))
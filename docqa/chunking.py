@@ -0,0 +1,131 @@
+"""Splitting page text into chunks for embedding."""
+
+import bisect
+import re
+from collections import namedtuple
+
+from docqa import metrics
+from docqa.tokens import get_encoder
+
+# Chunks stay well inside textembedding-gecko's 3072-token input limit (the
+# p50k tokenizer used here and gecko's tokenizer do not count identically),
+# and a handful of them still fit text-bison's prompt.
+DEFAULT_CHUNK_TOKENS = 1024
+DEFAULT_OVERLAP_TOKENS = 64
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n\s*")
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?;:])\s+")
+
+# text is text[char_start:char_end] of the page it came from.
+Chunk = namedtuple("Chunk", ["text", "char_start", "char_end", "n_tokens"])
+
+
+# The function get_chunks_iter() can be used to split a piece of text into smaller chunks,
+# each of which is at most maxlength characters long.
+# This can be useful for tasks such as summarization, question answering, and translation.
+@metrics.timed("get_chunks_iter")
+def get_chunks_iter(text, maxlength):
+    """
+    Get chunks of text, each of which is at most maxlength characters long.
+
+    Args:
+        text: The text to be chunked.
+        maxlength: The maximum length of each chunk.
+
+    Returns:
+        An iterator over the chunks of text.
+    """
+    start = 0
+    final_chunk = []
+    while start + maxlength < len(text):
+        end = text.rfind(" ", start, start + maxlength + 1)
+        if end <= start:
+            # No space in the window: cut the word instead of emitting a
+            # bogus chunk and starting over from the beginning.
+            end = start + maxlength
+            final_chunk.append(text[start:end])
+            start = end
+        else:
+            final_chunk.append(text[start:end])
+            start = end + 1
+    final_chunk.append(text[start:])
+    return final_chunk
+
+
+def _boundary_tokens(pattern, text, offsets):
+    """Indices of the tokens in which each match of pattern starts."""
+    return [
+        bisect.bisect_right(offsets, match.start()) - 1 for match in pattern.finditer(text)
+    ]
+
+
+def _last_boundary(boundaries, low, high):
+    """Largest boundary in (low, high], or None."""
+    i = bisect.bisect_right(boundaries, high)
+    if i and boundaries[i - 1] > low:
+        return boundaries[i - 1]
+    return None
+
+
+@metrics.timed("chunk_text")
+def chunk_text(
+    text,
+    max_tokens=DEFAULT_CHUNK_TOKENS,
+    overlap=DEFAULT_OVERLAP_TOKENS,
+    encoder=None,
+    min_fill=0.5,
+):
+    """
+    Split text into chunks of at most max_tokens tokens.
+
+    The page is tokenized once. Each chunk ends at the last paragraph break
+    inside its token budget, else the last sentence break, else the budget
+    itself, as long as that keeps the chunk at least min_fill full. The next
+    chunk starts overlap tokens before the previous one ended.
+
+    Args:
+        text: The page text.
+        max_tokens: Token budget per chunk.
+        overlap: Tokens shared by consecutive chunks.
+        encoder: tiktoken-style encoder with encode_ordinary() and
+            decode_with_offsets(); defaults to p50k_base.
+        min_fill: Fraction of max_tokens a chunk must reach before it may be
+            cut early at a paragraph or sentence break.
+
+    Returns:
+        A list of Chunk tuples in page order.
+    """
+    if overlap >= max_tokens:
+        raise ValueError("overlap must be smaller than max_tokens")
+    encoder = encoder or get_encoder()
+    tokens = encoder.encode_ordinary(text)
+    n_tokens = len(tokens)
+    if n_tokens == 0:
+        return []
+    if n_tokens <= max_tokens:
+        return [Chunk(text, 0, len(text), n_tokens)]
+
+    _, offsets = encoder.decode_with_offsets(tokens)
+    offsets = list(offsets) + [len(text)]
+    paragraphs = _boundary_tokens(_PARAGRAPH_BREAK, text, offsets)
+    sentences = _boundary_tokens(_SENTENCE_BREAK, text, offsets)
+
+    chunks = []
+    start = 0
+    while True:
+        end = start + max_tokens
+        if end >= n_tokens:
+            end = n_tokens
+        else:
+            low = start + max(1, int(max_tokens * min_fill))
+            boundary = _last_boundary(paragraphs, low, end)
+            if boundary is None:
+                boundary = _last_boundary(sentences, low, end)
+            if boundary is not None:
+                end = boundary
+        chunks.append(
+            Chunk(text[offsets[start] : offsets[end]], offsets[start], offsets[end], end - start)
+        )
+        if end == n_tokens:
+            return chunks
+        start = max(end - overlap, start + 1)
@@ -0,0 +1,206 @@
+"""Page text normalization profiles.
+
+The notebooks cleaned every page with re.sub("[^A-Za-z0-9]+", " ", ...)
+through DataFrame.apply, which also removed the "%", ".", "$" and "-" that
+answers such as "net zero by 2050" or "42.5% renewable" depend on. A
+profile says which normalizations to apply; TextCleaner joins all pages of a
+document into one buffer and runs each compiled pattern once over it, so the
+cost is a handful of regex passes per document rather than per page.
+"""
+
+import re
+from collections import Counter, namedtuple
+
+CleaningProfile = namedtuple(
+    "CleaningProfile",
+    [
+        "keep",  # regex character class body of the characters kept, or None
+        "repair_hyphenation",  # join words hyphenated across a line break
+        "strip_headers_footers",  # drop lines repeated at the top/bottom of pages
+        "collapse_whitespace",  # one space between words, paragraph breaks kept
+    ],
+)
+
+PROFILES = {
+    # What the notebooks used to do: only letters and digits survive.
+    "harsh": CleaningProfile(r"A-Za-z0-9", False, False, False),
+    # For question answering: keeps the characters numbers, percentages,
+    # currencies, dates, ranges and comparisons are written with ("<1%",
+    # "€5m", "+2.5"), the ";" the chunker splits sentences on, and the
+    # apostrophes and ampersands of names such as "company's" and "S&P".
+    "qa": CleaningProfile(r"\w\s%.,;$\u20ac+<>=/:()'\u2019&\-", True, True, True),
+    # Layout fixes only; every character is kept.
+    "light": CleaningProfile(None, True, True, True),
+}
+DEFAULT_PROFILE = "qa"
+
+# Pages are joined with NUL, which PDF text never contains (it is stripped
+# from the input first), and split again after the bulk pass. \x01 marks
+# paragraph breaks while single line breaks are collapsed.
+_PAGE_BREAK = "\x00"
+_PARAGRAPH_MARK = "\x01"
+# The patterns start with a literal, so the regex engine skips through
+# ordinary text with a fast search instead of trying a match at every
+# character; other whitespace is mapped to spaces with str.translate first.
+_HYPHENATED = re.compile(r"-[ \t]*\n[ \t]*(?=\w)")
+_BROKEN_SUFFIX = re.compile(r"-[ \t]*\n[ \t]*\w+")
+_WORD = re.compile(r"\w+")
+_BLANKS = {i: " " for i in range(0x3001) if chr(i).isspace() and chr(i) != "\n"}
+_SPACES = re.compile(r"  +")
+_PARAGRAPH = re.compile(r"\n\n+")
+_DIGITS = re.compile(r"\d+")
+
+
+def repair_hyphenation(text):
+    """
+    Join words hyphenated across a line break.
+
+    The document's own words tell a soft break from a compound: when the
+    part after the break starts lowercase and is not a word found elsewhere
+    in the text, or the joined word is, the hyphen is dropped
+    ("envi-\\nronment" -> "environment"); otherwise it is kept
+    ("net-\\nzero" -> "net-zero" when "zero" also appears on its own).
+    """
+    if not _HYPHENATED.search(text):
+        return text
+    # Only the few words next to a break are looked up, each with a literal
+    # search, instead of collecting every word of the document.
+    rest = _BROKEN_SUFFIX.sub(" ", text).lower()
+    found = {}
+
+    def in_text(word):
+        if word not in found:
+            pattern = rf"(?<!\w){re.escape(word)}(?!\w)"
+            found[word] = re.search(pattern, rest) is not None
+        return found[word]
+
+    def join(match):
+        start = match.start()
+        string = match.string
+        # Only a hyphen right after a letter or digit splits a word.
+        if not start or not string[start - 1].isalnum():
+            return match.group()
+        suffix = _WORD.match(string, match.end()).group()
+        if suffix[0].islower():
+            word_start = start
+            while word_start and string[word_start - 1].isalnum():
+                word_start -= 1
+            joined = (string[word_start:start] + suffix).lower()
+            if in_text(joined) or not in_text(suffix.lower()):
+                return ""
+        return "-"
+
+    return _HYPHENATED.sub(join, text)
+
+
+def get_profile(profile):
+    """Look up a profile by name; CleaningProfile instances pass through."""
+    if isinstance(profile, CleaningProfile):
+        return profile
+    try:
+        return PROFILES[profile]
+    except KeyError:
+        raise ValueError(
+            f"unknown cleaning profile {profile!r}, expected one of {list(PROFILES)}"
+        ) from None
+
+
+def repeated_lines(pages, edge_lines=3, min_share=0.5):
+    """
+    Find header and footer lines: lines among the first or last edge_lines
+    of a page that recur on at least min_share of the pages (and on at least
+    two). Digits are ignored when comparing, so "Page 3 of 40" matches
+    "Page 4 of 40".
+
+    Args:
+        pages: The page texts of one document.
+        edge_lines: Lines at the top and at the bottom of a page to consider.
+        min_share: Fraction of pages a line must appear on.
+
+    Returns:
+        A set of digit-normalized, stripped lines.
+    """
+    if len(pages) < 2:
+        return set()
+    counts = Counter()
+    for page in pages:
+        lines = [line.strip() for line in page.splitlines() if line.strip()]
+        edges = lines[:edge_lines] + lines[-edge_lines:]
+        counts.update({_DIGITS.sub("#", line) for line in edges})
+    needed = max(2, min_share * len(pages))
+    return {line for line, count in counts.items() if count >= needed}
+
+
+def _strip_lines(page, repeated, edge_lines):
+    lines = page.splitlines()
+    content = [i for i, line in enumerate(lines) if line.strip()]
+    edges = set(content[:edge_lines] + content[-edge_lines:])
+    return "\n".join(
+        line
+        for i, line in enumerate(lines)
+        if i not in edges or _DIGITS.sub("#", line.strip()) not in repeated
+    )
+
+
+class TextCleaner:
+    """
+    Applies a cleaning profile to the pages of a document in bulk.
+
+    Args:
+        profile: Profile name from PROFILES or a CleaningProfile.
+        edge_lines, min_share: Header/footer detection, see repeated_lines.
+    """
+
+    def __init__(self, profile=DEFAULT_PROFILE, edge_lines=3, min_share=0.5):
+        self.profile = get_profile(profile)
+        self.edge_lines = edge_lines
+        self.min_share = min_share
+        # Runs of other characters become one space; NUL is kept so the page
+        # breaks survive.
+        self._drop = (
+            re.compile(f"[^{self.profile.keep}{_PAGE_BREAK}]+") if self.profile.keep else None
+        )
+
+    def clean_pages(self, pages):
+        """
+        Clean the pages of one document.
+
+        Args:
+            pages: List of page texts (None counts as empty).
+
+        Returns:
+            A list of cleaned texts, one per page.
+        """
+        pages = [
+            (page or "").replace(_PAGE_BREAK, "").replace(_PARAGRAPH_MARK, "") for page in pages
+        ]
+        if not pages:
+            return []
+        if self.profile.strip_headers_footers:
+            repeated = repeated_lines(pages, self.edge_lines, self.min_share)
+            if repeated:
+                pages = [_strip_lines(page, repeated, self.edge_lines) for page in pages]
+        text = _PAGE_BREAK.join(pages)
+        if self.profile.repair_hyphenation:
+            text = repair_hyphenation(text)
+        if self._drop is not None:
+            text = self._drop.sub(" ", text)
+        if self.profile.collapse_whitespace:
+            text = _SPACES.sub(" ", text.translate(_BLANKS))
+            text = text.replace(" \n", "\n").replace("\n ", "\n")
+            text = _PARAGRAPH.sub(_PARAGRAPH_MARK, text).replace("\n", " ")
+            text = text.replace(_PARAGRAPH_MARK, "\n\n")
+            return [page.strip() for page in text.split(_PAGE_BREAK)]
+        return text.split(_PAGE_BREAK)
+
+    def clean(self, text):
+        """
+        Clean a single text (no header/footer detection across pages).
+
+        Example:
+            >>> TextCleaner("qa").clean(
+            ...     "Net zero: the company's net-\\nzero and envi-\\nronment goals; S&P <1%, €5m."
+            ... )
+            "Net zero: the company's net-zero and environment goals; S&P <1%, €5m."
+        """
+        return self.clean_pages([text])[0]
@@ -0,0 +1,204 @@
+"""Batched, concurrent embedding of chunks and questions.
+
+embedding_model_with_backoff sends one text per request, so embedding a corpus
+costs one network round trip per chunk. BatchEmbedder packs texts into
+requests up to the model's batch and token limits, keeps a bounded number of
+requests in flight and returns the embeddings in input order.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+from tenacity import Retrying, stop_after_attempt, wait_random_exponential
+
+from docqa import metrics
+
+# textembedding-gecko@001 accepts at most 5 texts per request and 3072 input
+# tokens per text.
+GECKO_MAX_BATCH_SIZE = 5
+GECKO_MAX_INPUT_TOKENS = 3072
+GECKO_DIMENSIONS = 768
+# Upper bound on the summed tokens of one request.
+DEFAULT_MAX_BATCH_TOKENS = 5 * GECKO_MAX_INPUT_TOKENS
+
+
+class EmbeddingError(RuntimeError):
+    """Raised when a single text still fails after retries and splitting."""
+
+    def __init__(self, position, cause):
+        super().__init__(f"embedding failed for text at position {position}: {cause}")
+        self.position = position
+        self.cause = cause
+
+
+def approx_token_count(text):
+    # Roughly 4 characters per token for English text; only used for packing.
+    return len(text) // 4 + 1
+
+
+def pack_batches(texts, max_batch_size, max_batch_tokens, count_tokens=approx_token_count):
+    """
+    Group consecutive texts into request-sized batches.
+
+    Args:
+        texts: Sequence of texts to embed.
+        max_batch_size: Maximum number of texts per request.
+        max_batch_tokens: Maximum summed tokens per request. A text larger
+            than this on its own still gets a batch to itself.
+        count_tokens: Callable returning the token count of a text.
+
+    Returns:
+        A list of lists of positions into texts, in input order.
+    """
+    batches = []
+    current = []
+    current_tokens = 0
+    for position, text in enumerate(texts):
+        tokens = count_tokens(text)
+        if current and (
+            len(current) >= max_batch_size or current_tokens + tokens > max_batch_tokens
+        ):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(position)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+class BatchEmbedder:
+    """
+    Embed many texts with few requests.
+
+    Args:
+        model: Object with a get_embeddings(list_of_texts) method returning one
+            result with a .values attribute per text (TextEmbeddingModel or
+            docqa.fakes.FakeEmbeddingModel).
+        max_batch_size: Maximum texts per request.
+        max_batch_tokens: Maximum summed tokens per request.
+        max_concurrency: Number of requests kept in flight.
+        count_tokens: Callable used to estimate the tokens of a text.
+        attempts: Attempts per request before the batch is split.
+        retry_wait: tenacity wait strategy between attempts; defaults to the
+            same random exponential backoff as embedding_model_with_backoff.
+        skip_failures: If True, texts that fail on their own get a zero vector
+            (which never matches in VectorIndex) instead of raising.
+        dimensions: Length of the model's vectors. Learned from the first
+            successful request if None; with skip_failures, a call in which
+            every text fails before that raises EmbeddingError.
+    """
+
+    def __init__(
+        self,
+        model,
+        max_batch_size=GECKO_MAX_BATCH_SIZE,
+        max_batch_tokens=DEFAULT_MAX_BATCH_TOKENS,
+        max_concurrency=4,
+        count_tokens=approx_token_count,
+        attempts=3,
+        retry_wait=None,
+        skip_failures=False,
+        dimensions=None,
+    ):
+        if max_batch_size < 1 or max_concurrency < 1:
+            raise ValueError("max_batch_size and max_concurrency must be at least 1")
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_concurrency = max_concurrency
+        self.count_tokens = count_tokens
+        self.attempts = attempts
+        self.retry_wait = retry_wait or wait_random_exponential(min=1, max=20)
+        self.skip_failures = skip_failures
+        self.dimensions = dimensions
+        self.failed_positions = []
+
+    def _request(self, texts):
+        for attempt in Retrying(
+            wait=self.retry_wait,
+            stop=stop_after_attempt(self.attempts),
+            before_sleep=metrics.retry_hook("embedding_request"),
+            reraise=True,
+        ):
+            with attempt, metrics.timer("embedding_request"):
+                embeddings = self.model.get_embeddings(list(texts))
+        if len(embeddings) != len(texts):
+            raise ValueError(
+                f"model returned {len(embeddings)} embeddings for {len(texts)} texts"
+            )
+        if metrics.REGISTRY.enabled:
+            metrics.count("embedded_texts", len(texts))
+            metrics.count("embedded_tokens", sum(self.count_tokens(text) for text in texts))
+        return [each.values for each in embeddings]
+
+    def _embed_batch(self, texts, positions):
+        """Embed one batch, splitting it in half on failure."""
+        try:
+            return positions, self._request([texts[p] for p in positions])
+        except Exception as e:
+            if len(positions) == 1:
+                if not self.skip_failures:
+                    raise EmbeddingError(positions[0], e) from e
+                return positions, [None]
+        middle = len(positions) // 2
+        left_positions, left = self._embed_batch(texts, positions[:middle])
+        right_positions, right = self._embed_batch(texts, positions[middle:])
+        return left_positions + right_positions, left + right
+
+    def embed(self, texts):
+        """
+        Embed a sequence of texts.
+
+        Args:
+            texts: Sequence of texts (chunks or questions).
+
+        Returns:
+            A (texts x dimensions) float32 array whose row i is the embedding
+            of texts[i].
+        """
+        texts = list(texts)
+        self.failed_positions = []
+        batches = pack_batches(
+            texts, self.max_batch_size, self.max_batch_tokens, self.count_tokens
+        )
+        results = [None] * len(texts)
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            pending = set()
+            for batch in batches:
+                pending.add(pool.submit(self._embed_batch, texts, batch))
+                if len(pending) >= self.max_concurrency:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    self._collect(done, results)
+            self._collect(pending, results)
+        self.failed_positions.sort()
+        return self._to_matrix(results)
+
+    def _collect(self, futures, results):
+        for future in futures:
+            positions, vectors = future.result()
+            for position, vector in zip(positions, vectors):
+                results[position] = vector
+                if vector is None:
+                    self.failed_positions.append(position)
+
+    def _to_matrix(self, results):
+        dimensions = next((len(v) for v in results if v is not None), self.dimensions)
+        if dimensions is None:
+            if results:
+                raise EmbeddingError(
+                    self.failed_positions[0],
+                    "no text could be embedded and the vector size is unknown (pass dimensions)",
+                )
+            dimensions = 0
+        self.dimensions = dimensions
+        matrix = np.zeros((len(results), dimensions), dtype=np.float32)
+        for i, vector in enumerate(results):
+            if vector is not None:
+                matrix[i] = vector
+        return matrix
+
+    def embed_one(self, text):
+        """Embed a single text (e.g. a question) and return a 1-D vector."""
+        return self.embed([text])[0]
@@ -0,0 +1,201 @@
+"""Local stand-ins for the Vertex AI models and the tokenizer, for offline
+benchmarks.
+
+The fakes are deterministic: the same text always gets the same embedding, and
+texts that share words get similar embeddings, so retrieval over a synthetic
+corpus behaves sensibly.
+"""
+
+import hashlib
+import random
+import re
+import threading
+import time
+from functools import lru_cache
+
+import numpy as np
+
+_WORD = re.compile(r"\w+")
+_NUMBER = re.compile(r"\d[\d,.]*%?")
+
+
+class FakeModelError(RuntimeError):
+    """Injected failure, standing in for a quota or transient server error."""
+
+
+@lru_cache(maxsize=1 << 16)
+def _word_slot(word, dimensions):
+    digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+    value = int.from_bytes(digest, "little")
+    return value % dimensions, 1.0 if (value >> 32) & 1 else -1.0
+
+
+def fake_embedding(text, dimensions=768):
+    """
+    Deterministic bag-of-words embedding of a text (feature hashing).
+
+    Args:
+        text: The text to embed.
+        dimensions: Length of the returned vector.
+
+    Returns:
+        A unit-length float32 vector (all zeros for text without words).
+    """
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for word in _WORD.findall(text.lower()):
+        slot, sign = _word_slot(word, dimensions)
+        vector[slot] += sign
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+class FakeEmbedding:
+    """Mimics vertexai TextEmbedding: the vector is in .values."""
+
+    __slots__ = ("values",)
+
+    def __init__(self, values):
+        self.values = values
+
+
+class FakeEmbeddingModel:
+    """
+    Drop-in replacement for TextEmbeddingModel.get_embeddings.
+
+    Args:
+        dimensions: Embedding length (gecko returns 768).
+        latency: Seconds slept per request, standing in for the round trip.
+        per_text_latency: Extra seconds slept per text in the request.
+        max_batch_size: Requests with more texts than this are rejected.
+        failure_rate: Probability that a request raises FakeModelError.
+        seed: Seed for the failure injection.
+    """
+
+    def __init__(
+        self,
+        dimensions=768,
+        latency=0.0,
+        per_text_latency=0.0,
+        max_batch_size=250,
+        failure_rate=0.0,
+        seed=0,
+    ):
+        self.dimensions = dimensions
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+        self.max_batch_size = max_batch_size
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.texts = 0
+
+    def _should_fail(self):
+        with self._lock:
+            self.requests += 1
+            return self._random.random() < self.failure_rate
+
+    def get_embeddings(self, texts):
+        if len(texts) > self.max_batch_size:
+            raise ValueError(
+                f"at most {self.max_batch_size} texts per request, got {len(texts)}"
+            )
+        delay = self.latency + self.per_text_latency * len(texts)
+        if delay:
+            time.sleep(delay)
+        if self._should_fail():
+            raise FakeModelError("injected embedding failure")
+        with self._lock:
+            self.texts += len(texts)
+        return [
+            FakeEmbedding(fake_embedding(text, self.dimensions).tolist())
+            for text in texts
+        ]
+
+
+class FakeResponse:
+    """Mimics vertexai TextGenerationResponse: the answer is in .text."""
+
+    __slots__ = ("text",)
+
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGenerationModel:
+    """
+    Drop-in replacement for TextGenerationModel.predict.
+
+    The answer is "{ value, NULL }" where value is the first number in the
+    prompt's context (or NULL), so sweeps produce parseable output.
+
+    Args:
+        latency: Seconds slept per request.
+        jitter: Extra uniformly random seconds, up to this much, per request.
+        failure_rate: Probability that a request raises FakeModelError.
+        seed: Seed for jitter and failure injection.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, failure_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def predict(self, prompt, **kwargs):
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + self.jitter * self._random.random()
+            fail = self._random.random() < self.failure_rate
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise FakeModelError("injected generation failure")
+        context = prompt.split("Question:", 1)[0]
+        match = _NUMBER.search(context)
+        return FakeResponse(f"{{ {match.group() if match else 'NULL'}, NULL }}")
+
+
+class FakeEncoder:
+    """
+    Word-level stand-in for a tiktoken encoder, for running the chunking and
+    token accounting offline (tiktoken downloads its encodings on first use).
+
+    Every word with its leading whitespace is one token, which is close to
+    how p50k_base splits English text.
+    """
+
+    _TOKEN = re.compile(r"\s*\S+|\s+")
+
+    def __init__(self):
+        self._ids = {}
+        self._tokens = []
+
+    def encode_ordinary(self, text):
+        ids = self._ids
+        tokens = []
+        for piece in self._TOKEN.findall(text):
+            token = ids.get(piece)
+            if token is None:
+                token = ids[piece] = len(self._tokens)
+                self._tokens.append(piece)
+            tokens.append(token)
+        return tokens
+
+    def encode_ordinary_batch(self, texts, **kwargs):
+        return [self.encode_ordinary(text) for text in texts]
+
+    def decode(self, tokens):
+        return "".join(self._tokens[token] for token in tokens)
+
+    def decode_with_offsets(self, tokens):
+        offsets = []
+        position = 0
+        for token in tokens:
+            offsets.append(position)
+            position += len(self._tokens[token])
+        return self.decode(tokens), offsets
@@ -0,0 +1,165 @@
+"""Concurrent, rate-limited calls to the text generation model.
+
+The document x question sweeps used to call generation_model.predict strictly
+one at a time. AnswerEngine runs them on a thread pool with a cap on requests
+in flight, a client-side token bucket sized to the project's quota, and
+retries with backoff, and yields results in input order as they complete.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from tenacity import Retrying, stop_after_attempt, wait_random_exponential
+
+from docqa import metrics
+
+# text-bison default online prediction quota is 60 requests per minute.
+DEFAULT_REQUESTS_PER_MINUTE = 60
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter.
+
+    Args:
+        rate: Tokens added per second.
+        capacity: Maximum tokens held, i.e. the largest burst allowed.
+    """
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, requests_per_minute, burst=None):
+        return cls(requests_per_minute / 60.0, burst)
+
+    def acquire(self, tokens=1.0):
+        """Block until tokens are available, then take them."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class AnswerEngine:
+    """
+    Runs model calls concurrently within a request quota.
+
+    Args:
+        model: Object with predict(prompt, **kwargs) returning a response with
+            a .text attribute (TextGenerationModel or docqa.fakes
+            .FakeGenerationModel).
+        max_concurrency: Maximum requests in flight.
+        requests_per_minute: Client-side quota; None disables rate limiting.
+        burst: Requests allowed back to back before the rate applies.
+        attempts: Attempts per prompt before the error is raised.
+        retry_wait: tenacity wait strategy; defaults to the same random
+            exponential backoff as text_generation_model_with_backoff.
+        **predict_kwargs: Passed to every predict call (e.g. temperature).
+    """
+
+    def __init__(
+        self,
+        model,
+        max_concurrency=8,
+        requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+        burst=None,
+        attempts=3,
+        retry_wait=None,
+        **predict_kwargs,
+    ):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.bucket = (
+            TokenBucket.per_minute(requests_per_minute, burst)
+            if requests_per_minute
+            else None
+        )
+        self.attempts = attempts
+        self.retry_wait = retry_wait or wait_random_exponential(min=1, max=20)
+        self.predict_kwargs = predict_kwargs
+        self._in_flight = threading.BoundedSemaphore(max_concurrency)
+        self.calls = 0
+        self.retries = 0
+        self._stats_lock = threading.Lock()
+
+    def _count_retry(self, retry_state):
+        with self._stats_lock:
+            self.retries += 1
+        metrics.count("generation_request_retries")
+
+    def _predict_once(self, prompt):
+        if self.bucket is not None:
+            self.bucket.acquire()
+        with self._in_flight:
+            with self._stats_lock:
+                self.calls += 1
+            metrics.count("prompt_chars", len(prompt))
+            with metrics.timer("generation_request"):
+                return self.model.predict(prompt, **self.predict_kwargs).text
+
+    def generate(self, prompt):
+        """
+        Answer one prompt, retrying with backoff. Safe to call from any thread;
+        the concurrency cap and rate limit apply across all callers.
+        """
+        for attempt in Retrying(
+            wait=self.retry_wait,
+            stop=stop_after_attempt(self.attempts),
+            before_sleep=self._count_retry,
+            reraise=True,
+        ):
+            with attempt:
+                return self._predict_once(prompt)
+
+    def map(self, fn, items):
+        """
+        Apply fn to every item on the engine's thread pool.
+
+        fn is typically a function that retrieves context and calls
+        generate(); it may also call generate() several times. Items are
+        submitted a window at a time (twice max_concurrency), so a consumer
+        such as a journal sees every result as soon as it and the ones before
+        it are done. If a call raises, or the consumer stops iterating, the
+        items not started yet are cancelled instead of spending quota.
+
+        Args:
+            fn: Callable taking one item.
+            items: Iterable of items.
+
+        Yields:
+            fn(item) for every item, in the order of items.
+        """
+        items = iter(items)
+        pool = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        pending = deque(pool.submit(fn, item) for item in islice(items, 2 * self.max_concurrency))
+        try:
+            while pending:
+                result = pending.popleft().result()
+                pending.extend(pool.submit(fn, item) for item in islice(items, 1))
+                yield result
+        finally:
+            for future in pending:
+                future.cancel()
+            pool.shutdown(wait=True)
+
+    def generate_all(self, prompts):
+        """Answer many prompts concurrently; results are in input order."""
+        return list(self.map(self.generate, prompts))
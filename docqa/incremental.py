@@ -0,0 +1,225 @@
+"""Incremental re-indexing driven by source file fingerprints.
+
+A saved store (docqa.store) records the size, modification time and content
+hash of every file it was built from. refresh_index() compares the current
+files against that record and only ingests, chunks and embeds the files that
+are new or changed; the chunks of unchanged files are carried over with their
+embeddings, and the chunks of deleted or changed files are dropped. The
+store also records the chunk size, overlap and cleaning profile; when they
+change, every file is chunked and embedded again.
+
+Files that fail to parse are recorded with their fingerprint and the error,
+and are not tried again until they change (or retry_failed=True), so one
+broken PDF does not force a rebuild on every refresh. Chunks whose embedding
+failed are stored as zero vectors (norm 0 in the saved norms); the next
+refresh embeds them again.
+"""
+
+import hashlib
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from docqa import pipeline
+from docqa.chunking import DEFAULT_CHUNK_TOKENS, DEFAULT_OVERLAP_TOKENS
+from docqa.cleaning import DEFAULT_PROFILE, get_profile
+from docqa.store import load_store, read_manifest, save_store
+
+FileDiff = namedtuple("FileDiff", ["added", "changed", "removed", "unchanged"])
+
+
+def content_hash(path, block_size=1 << 20):
+    """sha256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fingerprint(path, previous=None):
+    """
+    Fingerprint of a source file: size, mtime and content hash.
+
+    The content is only hashed when size or mtime differ from the previous
+    fingerprint, so an unchanged corpus costs one stat() per file. A file
+    that was touched (or re-downloaded) without changing keeps its hash.
+
+    Args:
+        path: The file.
+        previous: The file's fingerprint from the last run, if any.
+
+    Returns:
+        A dict with "size", "mtime_ns" and "sha256".
+    """
+    stat = os.stat(path)
+    if previous and previous["size"] == stat.st_size and previous["mtime_ns"] == stat.st_mtime_ns:
+        return previous
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": content_hash(path)}
+
+
+def diff_sources(previous, current):
+    """
+    Compare two {path: fingerprint} records.
+
+    Returns:
+        A FileDiff of sorted path lists. Files whose content hash is the same
+        count as unchanged even if their mtime moved.
+    """
+    added = sorted(set(current) - set(previous))
+    removed = sorted(set(previous) - set(current))
+    changed = sorted(
+        path
+        for path in set(current) & set(previous)
+        if current[path]["sha256"] != previous[path]["sha256"]
+    )
+    unchanged = sorted(set(current) & set(previous) - set(changed))
+    return FileDiff(added, changed, removed, unchanged)
+
+
+def chunk_config(max_tokens, overlap, profile):
+    """The chunking settings a store records in its manifest, as JSON types."""
+    return {
+        "max_tokens": max_tokens,
+        "overlap": overlap,
+        "profile": get_profile(profile)._asdict(),
+    }
+
+
+def _partitioned_as(chunk_store, entity_of):
+    """Whether the store's rows are partitioned as entity_of would do it."""
+    names = chunk_store.categories.get("file_name", [])
+    entities = chunk_store.categories.get("entity", [])
+    codes, first_rows = np.unique(chunk_store.columns["file_name"], return_index=True)
+    if entity_of is None:
+        expected = names
+    else:
+        lookup = entity_of.get if isinstance(entity_of, dict) else entity_of
+        expected = [lookup(name) for name in names]
+    for code, row in zip(codes, first_rows):
+        entity_code = int(chunk_store.columns["entity"][row])
+        stored = None if entity_code < 0 else entities[entity_code]
+        if expected[code] != stored:
+            return False
+    return True
+
+
+def _kept_batches(chunk_store, index, keep, batch_size):
+    """(records, embeddings, unembedded) batches of the kept rows of a saved store."""
+    positions = np.flatnonzero(keep)
+    for start in range(0, len(positions), batch_size):
+        batch = positions[start : start + batch_size]
+        records = chunk_store.take(batch).to_dict("records")
+        # Rows whose embedding failed were saved as zero vectors.
+        unembedded = np.flatnonzero(index.norms[batch] == 0)
+        yield records, np.array(index.matrix[batch]), unembedded
+
+
+def refresh_index(
+    directory,
+    paths,
+    embedder,
+    entity_of=None,
+    max_tokens=DEFAULT_CHUNK_TOKENS,
+    overlap=DEFAULT_OVERLAP_TOKENS,
+    batch_size=250,
+    profile=DEFAULT_PROFILE,
+    processes=None,
+    retry_failed=False,
+):
+    """
+    Bring a saved store up to date with the files in paths.
+
+    New and changed files go through ingest -> clean -> chunk -> embed; the
+    chunks of unchanged files are reused, and the chunks of removed and
+    changed files are dropped. The store is then saved again with the new
+    fingerprints. Files that fail to parse are fingerprinted with their error
+    and skipped until they change; chunks saved without an embedding are
+    embedded again. A store made with other chunking settings is rebuilt
+    from scratch, and the chunks are always partitioned with the given
+    entity_of.
+
+    Args:
+        directory: Store directory (created on the first run).
+        paths: The current source files, e.g. docqa.ingest.files(path).
+        embedder: Object with an embed(texts) method.
+        entity_of: File name -> entity mapping, see IndexBuilder.finish().
+        max_tokens, overlap, batch_size, profile, processes: As in
+            pipeline.stream_index.
+        retry_failed: Parse the files that failed before even if they did
+            not change, e.g. after installing a missing parser.
+
+    Returns:
+        (chunk_store, index, diff): the memory-mapped refreshed store, its
+        VectorIndex and the FileDiff that was applied.
+    """
+    config = chunk_config(max_tokens, overlap, profile)
+    manifest = read_manifest(directory)
+    if manifest and manifest.get("config") != config:
+        print("chunking settings changed: rebuilding the index")
+        manifest = None
+    previous = manifest["sources"] if manifest else {}
+    if retry_failed:
+        previous = {path: fp for path, fp in previous.items() if "error" not in fp}
+    current = {}
+    for path in paths:
+        before = previous.get(path)
+        current[path] = fingerprint(path, before)
+        if before and "error" in before and current[path]["sha256"] == before["sha256"]:
+            # Touched but not changed: it still fails.
+            current[path] = dict(current[path], error=before["error"])
+    diff = diff_sources(previous, current)
+    skipped = [path for path in diff.unchanged if "error" in current[path]]
+    if skipped:
+        print(f"{len(skipped)} file(s) skipped: they failed to parse before and did not change")
+    if manifest and not (diff.added or diff.changed or diff.removed):
+        chunk_store, index = load_store(directory)
+        if _partitioned_as(chunk_store, entity_of) and not np.any(index.norms == 0):
+            print(f"index up to date: {len(diff.unchanged)} files unchanged")
+            return chunk_store, index, diff
+        # Only the entities changed or some chunks still lack an embedding:
+        # regroup the saved chunks and embed the missing ones below.
+        del chunk_store, index
+
+    builder = pipeline.IndexBuilder()
+    kept = 0
+    reembedded = 0
+    if manifest:
+        chunk_store, index = load_store(directory)
+        names = chunk_store.categories.get("file_name", [])
+        stale = [code for code, name in enumerate(names) if name not in diff.unchanged]
+        keep = ~np.isin(chunk_store.columns["file_name"], stale)
+        kept = int(keep.sum())
+        for records, embeddings, unembedded in _kept_batches(chunk_store, index, keep, batch_size):
+            if len(unembedded):
+                embeddings[unembedded] = embedder.embed([records[i]["chunks"] for i in unembedded])
+                reembedded += len(unembedded)
+            builder.add(records, embeddings)
+        del chunk_store, index
+
+    to_ingest = diff.added + diff.changed
+    parsed = set()
+    failed = {}
+    pages = pipeline.ingest(to_ingest, processes=processes, parsed=parsed, failed=failed)
+    chunks = pipeline.chunk(pipeline.clean(pages, profile), max_tokens, overlap)
+    for records, embeddings in pipeline.embed(chunks, embedder, batch_size):
+        builder.add(records, embeddings)
+    embedded = len(builder) - kept
+
+    sources = {}
+    for path, fp in current.items():
+        if path in failed:
+            sources[path] = dict(fp, error=failed[path])
+        elif path in diff.unchanged or path in parsed:
+            sources[path] = fp
+    save_store(directory, *builder.finish(entity_of), sources=sources, config=config)
+    print(
+        f"index refresh: {len(diff.added)} added, {len(diff.changed)} changed, "
+        f"{len(diff.removed)} removed, {len(diff.unchanged)} unchanged"
+        + (f", {len(failed)} failed" if failed else "")
+        + f"; {kept} chunks kept, {embedded} chunks embedded"
+        + (f", {reembedded} re-embedded" if reembedded else "")
+    )
+    chunk_store, index = load_store(directory)
+    return chunk_store, index, diff
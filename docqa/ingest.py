@@ -0,0 +1,244 @@
+"""Reading documents from disk into per-page data packets.
+
+The parsing libraries (PyMuPDF, PyPDF2, textract) are imported when the
+first document of a type is parsed, so importing this module is cheap.
+"""
+
+import io
+import multiprocessing
+import os
+import time
+from collections import deque, namedtuple
+
+from docqa import metrics
+
+
+def create_data_packet(file_name, file_type, page_number, file_content, extractor=None):
+    """Creating a simple dictionary to store all information (content and metadata)
+    extracted from the document"""
+    data_packet = {}
+    data_packet["file_name"] = file_name
+    data_packet["file_type"] = file_type
+    data_packet["page_number"] = page_number
+    data_packet["content"] = file_content
+    # Which library produced the text, e.g. "fitz", "pypdf2" or "textract".
+    data_packet["extractor"] = extractor
+    return data_packet
+
+
+def files(path):
+    """
+    Function that returns only filenames if the path is a directory,
+    or returns the single file if the path is a file.
+    """
+    if os.path.isfile(path):
+        # If it's a file, yield just that file
+        metrics.count("files_listed")
+        yield path
+    elif os.path.isdir(path):
+        # If it's a directory, list all files (sorted, so runs are repeatable)
+        for file in sorted(os.listdir(path)):
+            file_path = os.path.join(path, file)
+            if os.path.isfile(file_path):
+                metrics.count("files_listed")
+                yield file_path
+    else:
+        raise NotADirectoryError(f"{path} is neither a file nor a directory")
+
+
+# PyMuPDF is several times faster than PyPDF2 and also reads most pages PyPDF2
+# returns nothing for, so it goes first; PyPDF2 is the per-page fallback.
+DEFAULT_PDF_EXTRACTORS = ("fitz", "pypdf2")
+
+
+class _PdfDocument:
+    """
+    One PDF read from disk once, parsed lazily by each extractor that needs it.
+
+    Args:
+        data: The raw bytes of the file.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self._fitz = None
+        self._pypdf2 = None
+
+    def fitz(self):
+        if self._fitz is None:
+            import fitz  # For handling unsearchable PDFs
+
+            self._fitz = fitz.open(stream=self.data, filetype="pdf")
+        return self._fitz
+
+    def pypdf2(self):
+        if self._pypdf2 is None:
+            from PyPDF2 import PdfReader  # For searchable PDFs
+
+            self._pypdf2 = PdfReader(io.BytesIO(self.data))
+        return self._pypdf2
+
+    def page_count(self, extractor):
+        if extractor == "fitz":
+            return self.fitz().page_count
+        return len(self.pypdf2().pages)
+
+    def page_text(self, extractor, i):
+        if extractor == "fitz":
+            return self.fitz().load_page(i).get_text("text")
+        if extractor == "pypdf2":
+            return self.pypdf2().pages[i].extract_text() or ""
+        raise ValueError(f"unknown PDF extractor {extractor!r}")
+
+    def close(self):
+        if self._fitz is not None:
+            self._fitz.close()
+
+
+def extract_pdf_pages(file_name, extractors=DEFAULT_PDF_EXTRACTORS, image_dir=None):
+    """
+    Extract the text of every page of a PDF, reading the file once.
+
+    Each page is tried with the extractors in order and the first one that
+    returns text wins, so a mixed PDF keeps the text of every page any
+    extractor can read.
+
+    Args:
+        file_name: Path of the PDF.
+        extractors: Extractor names to try per page, fastest first.
+        image_dir: If given, pages without text in any extractor are rendered
+            there as PNG for OCR.
+
+    Returns:
+        A list of data packets, one per page with text.
+    """
+    with open(file_name, "rb") as f:
+        document = _PdfDocument(f.read())
+    packets = []
+    try:
+        for i in range(document.page_count(extractors[0])):
+            for extractor in extractors:
+                text = document.page_text(extractor, i)
+                if text.strip():  # Ensure non-empty text
+                    packets.append(
+                        create_data_packet(
+                            file_name,
+                            ".pdf",
+                            page_number=int(i + 1),
+                            file_content=text,
+                            extractor=extractor,
+                        )
+                    )
+                    break
+            else:
+                if image_dir is not None:
+                    # Page has no text layer at all: render it as an image.
+                    image_name = f"page-{i + 1}-{os.path.basename(file_name)}.png"
+                    pix = document.fitz().load_page(i).get_pixmap()
+                    pix.save(os.path.join(image_dir, image_name))
+                    print(f"Page {i + 1} of {file_name} rendered as image.")
+    finally:
+        document.close()
+    return packets
+
+
+@metrics.timed("extract_pages")
+def extract_pages(file_name):
+    """
+    Extract the text of one document.
+
+    Args:
+        file_name: Path of the document.
+
+    Returns:
+        A list of data packets, one per page with text for PDFs and a single
+        packet (page_number None) for other file types.
+    """
+    _, file_type = os.path.splitext(file_name)
+    if file_type == ".pdf":
+        return extract_pdf_pages(file_name)
+    # For non-PDF file types, use textract
+    import textract
+
+    text = textract.process(file_name).decode("utf-8")
+    return [
+        create_data_packet(
+            file_name, file_type, page_number=None, file_content=text, extractor="textract"
+        )
+    ]
+
+
+# Outcome of parsing one file: its packets, the wall time spent in the worker
+# and an error message (None on success).
+IngestResult = namedtuple("IngestResult", ["file_name", "packets", "seconds", "error"])
+
+DEFAULT_FILE_TIMEOUT = 300.0
+
+
+def _timed_extract(extract, file_name):
+    start = time.perf_counter()
+    try:
+        packets, error = extract(file_name), None
+    except Exception as e:
+        packets, error = [], f"{type(e).__name__}: {e}"
+    return packets, time.perf_counter() - start, error
+
+
+def ingest_parallel(
+    paths, processes=None, timeout=DEFAULT_FILE_TIMEOUT, extract=extract_pages, context=None
+):
+    """
+    Parse files on a process pool and stream the results back in input order.
+
+    At most one file per worker is in flight, so a file's timeout starts when
+    a worker picks it up. A file that raises is reported with its error; a file
+    that hangs or crashes its worker is reported as timed out, the pool is
+    replaced and the other in-flight files are resubmitted.
+
+    Args:
+        paths: Iterable of file paths, e.g. files(path).
+        processes: Number of worker processes (default: one per CPU).
+        timeout: Seconds a single file may take before it is abandoned.
+        extract: Picklable callable turning a path into a list of data packets.
+        context: Optional multiprocessing context, e.g. get_context("spawn").
+
+    Yields:
+        One IngestResult per path, in the order of paths.
+    """
+    paths = list(paths)
+    processes = max(1, min(processes or os.cpu_count() or 1, len(paths) or 1))
+    context = context or multiprocessing
+    pool = context.Pool(processes)
+    in_flight = deque()
+
+    def submit(file_name):
+        result = pool.apply_async(_timed_extract, (extract, file_name))
+        return file_name, result, time.monotonic() + timeout
+
+    remaining = iter(paths)
+    try:
+        while True:
+            while len(in_flight) < processes:
+                file_name = next(remaining, None)
+                if file_name is None:
+                    break
+                in_flight.append(submit(file_name))
+            if not in_flight:
+                break
+            file_name, result, deadline = in_flight.popleft()
+            try:
+                packets, seconds, error = result.get(max(0.0, deadline - time.monotonic()))
+            except multiprocessing.TimeoutError:
+                yield IngestResult(file_name, [], timeout, f"timed out after {timeout}s")
+                # A stuck worker cannot be reclaimed on its own: replace the
+                # pool and resubmit the unfinished files that were running
+                # beside it.
+                pool.terminate()
+                pool = context.Pool(processes)
+                in_flight = deque(
+                    entry if entry[1].ready() else submit(entry[0]) for entry in in_flight
+                )
+                continue
+            yield IngestResult(file_name, packets, seconds, error)
+    finally:
+        pool.terminate()
@@ -0,0 +1,174 @@
+"""Durable record of the completed pairs of an entity x question sweep.
+
+A sweep over 11 companies x 20 questions used to keep its answers in a list
+until the final to_csv, so a quota error or kernel restart on pair 180 lost
+all of them. SweepJournal appends one JSON line per completed pair (entity,
+question, answer and the positions of the retrieved chunks) and fsyncs it;
+pipeline.answer(..., journal=...) skips the pairs already in the journal,
+so a rerun only pays for the pairs that are missing.
+
+A journal only resumes the sweep that wrote it. Its first line holds a
+fingerprint of the sweep (the store manifest, the prompt, the entities and
+questions, see sweep_fingerprint); a journal with a different fingerprint is
+discarded when it is opened, so a refreshed index or an edited prompt is
+never answered from stale pairs. When pipeline.answer has yielded every
+pair it calls finish(), which moves the journal aside to <path>.done, so the
+next run starts a new sweep and only an interrupted run is resumed.
+
+A crash while a line is being written leaves at most that line truncated;
+it is cut off when the journal is opened again and the pair is asked again.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+def sweep_fingerprint(*parts):
+    """
+    sha256 hex digest identifying a sweep.
+
+    Args:
+        *parts: JSON-serializable values that determine the answers, e.g.
+            the store manifest, the prompt template, the entities and the
+            questions. Values that are not JSON types are hashed by str().
+    """
+    text = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class SweepJournal:
+    """
+    Append-only JSONL journal of completed (entity, question) pairs.
+
+    Args:
+        path: The journal file; created (with its directory) if missing.
+        fingerprint: Identifies the sweep, see sweep_fingerprint(). An
+            existing journal written with another fingerprint is discarded.
+        fsync: Flush every record to disk before returning, so a completed
+            pair survives a crash of the machine, not only of the process.
+    """
+
+    def __init__(self, path, fingerprint=None, fsync=True):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self.records = {}
+        self.skipped_lines = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(path) and not self._load():
+            os.remove(path)
+        new = not os.path.exists(path)
+        self._file = open(path, "a", encoding="utf-8")
+        if new:
+            self._write({"fingerprint": fingerprint, "started": time.time()})
+
+    def _load(self):
+        """Read the records of an existing journal; False if it is stale."""
+        with open(self.path, "rb+") as f:
+            data = f.read()
+            complete = data.rfind(b"\n") + 1
+            if complete < len(data):
+                # The last record was cut off mid-write.
+                f.truncate(complete)
+                self.skipped_lines += 1
+        lines = data[:complete].splitlines()
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, ValueError):
+            header = {}
+        if "fingerprint" not in header or header["fingerprint"] != self.fingerprint:
+            print(f"{self.path}: written by a different sweep, starting a new one")
+            self.skipped_lines = 0
+            return False
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                self.skipped_lines += 1
+                continue
+            self.records[record["entity"], record["question"]] = record
+        if self.skipped_lines:
+            print(f"{self.path}: dropped {self.skipped_lines} incomplete record(s)")
+        return True
+
+    def _write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+    def finish(self):
+        """
+        Close a journal whose sweep completed and move it to <path>.done,
+        so the next sweep starts from scratch instead of resuming it.
+        """
+        self.close()
+        os.replace(self.path, f"{self.path}.done")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, pair):
+        return tuple(pair) in self.records
+
+    def get(self, entity, question):
+        """The record of a completed pair, or None."""
+        return self.records.get((entity, question))
+
+    def record(self, entity, question, answer, chunk_ids=(), **fields):
+        """
+        Append a completed pair. Safe to call from the sweep's worker threads.
+
+        Args:
+            entity: The company name or document id.
+            question: The question text as asked (with the entity appended).
+            answer: The generated answer.
+            chunk_ids: Row positions of the chunks retrieved for the prompt.
+            **fields: Other JSON-serializable values to keep, e.g. the
+                question's esgType.
+
+        Returns:
+            The record dict.
+        """
+        record = {
+            "entity": entity,
+            "question": question,
+            "answer": answer,
+            "chunk_ids": [int(i) for i in chunk_ids],
+            "completed": time.time(),
+            **fields,
+        }
+        self._write(record)
+        with self._lock:
+            self.records[entity, question] = record
+        return record
+
+
+def read_journal(path):
+    """The complete pair records of a journal file, in the order they were written."""
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if "entity" in record:
+                records.append(record)
+    return records
@@ -0,0 +1,255 @@
+"""Lightweight per-stage metrics: latency histograms and counters.
+
+The pipeline stages record into a process-wide registry: how long each file
+took to parse, each chunking pass, embedding request, retrieval and model
+call; how often calls were made and retried; and how many bytes, pages,
+chunks and tokens went through. The registry is disabled unless the
+DOCQA_METRICS environment variable is set or enable() is called; while
+disabled, every recording function returns after one attribute check.
+
+    from docqa import metrics
+    metrics.enable()
+    ...
+    print(metrics.summary())
+    metrics.write(".cache/metrics.json")   # or metrics.prom for Prometheus
+
+Retries of tenacity-decorated functions are counted by passing
+metrics.retry_hook(name) as the decorator's before_sleep.
+"""
+
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+# Upper bounds (seconds) of the latency histogram buckets, from a fast
+# cache hit to a slow model call; +Inf is implicit.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PROMETHEUS_PREFIX = "docqa_"
+
+_NULL_TIMER = nullcontext()
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram in the Prometheus style.
+
+    Args:
+        buckets: Sorted upper bounds of the buckets.
+    """
+
+    __slots__ = ("buckets", "counts", "count", "sum", "min", "max")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        """
+        Estimate a quantile by linear interpolation within its bucket.
+
+        Args:
+            q: Quantile between 0 and 1.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                low = self.buckets[i - 1] if i else 0.0
+                high = self.buckets[i] if i < len(self.buckets) else self.max
+                value = low + (high - low) * (rank - seen) / count
+                return min(max(value, self.min), self.max)
+            seen += count
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "buckets": dict(zip([*map(str, self.buckets), "+Inf"], self.counts)),
+        }
+
+
+class Metrics:
+    """
+    Thread-safe registry of named counters and latency histograms.
+
+    Args:
+        enabled: Whether anything is recorded.
+        buckets: Histogram bucket bounds.
+    """
+
+    def __init__(self, enabled=False, buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+
+    def count(self, name, value=1):
+        """Add value to the counter name."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        """Record one latency, in seconds, in the histogram name."""
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def timer(self, name):
+        """
+        Context manager recording the duration of its block in the histogram
+        name; a block that raises is counted in "<name>_errors" instead.
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def timed(self, name):
+        """Decorator timing every call of a function, see timer()."""
+
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with _Timer(self, name):
+                    return fn(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def retry_hook(self, name):
+        """
+        A tenacity before_sleep callback counting the retries of name in the
+        counter "<name>_retries".
+        """
+
+        def before_sleep(retry_state):
+            self.count(f"{name}_retries")
+
+        return before_sleep
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "histograms": {name: h.to_dict() for name, h in self.histograms.items()},
+            }
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def to_prometheus(self, prefix=PROMETHEUS_PREFIX):
+        """The metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {prefix}{name}_total counter")
+                lines.append(f"{prefix}{name}_total {value}")
+            for name, histogram in sorted(self.histograms.items()):
+                metric = f"{prefix}{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, count in zip([*map(str, histogram.buckets), "+Inf"], histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f"{metric}_sum {histogram.sum}")
+                lines.append(f"{metric}_count {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Write the metrics to path: Prometheus text for *.prom, else JSON."""
+        text = self.to_prometheus() if path.endswith(".prom") else self.to_json(indent=2)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            f.write(text)
+
+    def summary(self):
+        """A short human-readable table of the histograms and counters."""
+        lines = []
+        with self._lock:
+            for name, h in sorted(self.histograms.items(), key=lambda item: -item[1].sum):
+                lines.append(
+                    f"{name:<28} {h.count:>8} calls {h.sum:10.2f}s total "
+                    f"p50 {h.quantile(0.5):8.3f}s p95 {h.quantile(0.95):8.3f}s"
+                )
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"{name:<28} {value:>8}")
+        return "\n".join(lines)
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.metrics.observe(self.name, time.perf_counter() - self.start)
+        else:
+            self.metrics.count(f"{self.name}_errors")
+        return False
+
+
+REGISTRY = Metrics(enabled=bool(os.environ.get("DOCQA_METRICS")))
+
+count = REGISTRY.count
+observe = REGISTRY.observe
+timer = REGISTRY.timer
+timed = REGISTRY.timed
+retry_hook = REGISTRY.retry_hook
+to_json = REGISTRY.to_json
+to_prometheus = REGISTRY.to_prometheus
+write = REGISTRY.write
+summary = REGISTRY.summary
+reset = REGISTRY.reset
+
+
+def enable():
+    REGISTRY.enabled = True
+
+
+def disable():
+    REGISTRY.enabled = False
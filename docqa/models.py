@@ -0,0 +1,82 @@
+"""Lazily constructed Vertex AI model clients.
+
+The notebooks called TextGenerationModel.from_pretrained and
+TextEmbeddingModel.from_pretrained at import time, so every run paid for
+importing vertexai and loading both models, even one that only reads cached
+answers. The clients here are built on their first use; until then nothing
+from vertexai is imported.
+
+    generation_model = models.generation_model("text-bison@001")
+    ...
+    generation_model.predict(prompt)   # vertexai is imported and loaded here
+"""
+
+import threading
+
+GENERATION_MODEL = "text-bison@001"
+EMBEDDING_MODEL = "textembedding-gecko@001"
+
+
+class LazyModel:
+    """
+    Stands in for a model client and builds it on first attribute access.
+
+    Attribute access (predict, get_embeddings, ...) is forwarded to the
+    loaded client, so a LazyModel can be passed wherever the client was,
+    e.g. to AnswerEngine or BatchEmbedder. Loading is thread-safe and
+    happens once.
+
+    Args:
+        loader: Callable name -> client.
+        name: Model name passed to the loader.
+    """
+
+    def __init__(self, loader, name):
+        self._loader = loader
+        self._client = None
+        self._lock = threading.Lock()
+        self.name = name
+
+    @property
+    def loaded(self):
+        return self._client is not None
+
+    def load(self):
+        """The client, loading it if that has not happened yet."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._loader(self.name)
+        return self._client
+
+    def __getattr__(self, attribute):
+        # Only called for attributes LazyModel itself does not have.
+        if attribute.startswith("__"):
+            raise AttributeError(attribute)
+        return getattr(self.load(), attribute)
+
+    def __repr__(self):
+        state = "loaded" if self.loaded else "not loaded"
+        return f"LazyModel({self.name!r}, {state})"
+
+
+def _load_generation_model(name):
+    from vertexai.language_models import TextGenerationModel
+
+    return TextGenerationModel.from_pretrained(name)
+
+
+def _load_embedding_model(name):
+    from vertexai.language_models import TextEmbeddingModel
+
+    return TextEmbeddingModel.from_pretrained(name)
+
+
+def generation_model(name=GENERATION_MODEL):
+    """A TextGenerationModel that is loaded on first use."""
+    return LazyModel(_load_generation_model, name)
+
+
+def embedding_model(name=EMBEDDING_MODEL):
+    """A TextEmbeddingModel that is loaded on first use."""
+    return LazyModel(_load_embedding_model, name)
@@ -0,0 +1,432 @@
+"""Staged document QA pipeline: ingest -> clean -> chunk -> embed -> index -> answer.
+
+Every stage is a generator over the previous stage's output, so each file is
+read, cleaned, chunked and embedded exactly once and the question sweep runs
+once over the finished index.
+"""
+
+import os
+import re
+from array import array
+from itertools import groupby
+from operator import itemgetter
+
+import numpy as np
+import pandas as pd
+
+from docqa import metrics
+from docqa.chunking import DEFAULT_CHUNK_TOKENS, DEFAULT_OVERLAP_TOKENS, chunk_text
+from docqa.cleaning import DEFAULT_PROFILE, TextCleaner
+from docqa.embedding import GECKO_MAX_INPUT_TOKENS
+from docqa.ingest import DEFAULT_FILE_TIMEOUT, extract_pages, ingest_parallel
+from docqa.queries import entity_question
+from docqa.retrieval import VectorIndex, partition_rows
+from docqa.store import ChunkStore
+
+CHUNK_COLUMNS = [
+    "file_name",
+    "file_type",
+    "page_number",
+    "chunks",
+    # Position of the chunk in its page's (cleaned) content.
+    "char_start",
+    "char_end",
+    "n_tokens",
+]
+# How IndexBuilder stores the columns other than the chunk text.
+CATEGORY_COLUMNS = ["file_name", "file_type"]
+INT_COLUMNS = ["page_number", "char_start", "char_end", "n_tokens"]
+
+
+def ingest(
+    paths, extract=extract_pages, processes=None, timeout=DEFAULT_FILE_TIMEOUT, parsed=None, failed=None
+):
+    """
+    Stage 1: yield one data packet per page of every file.
+
+    Files are parsed on a process pool (see docqa.ingest.ingest_parallel) and
+    their packets come back in the order of paths. Files that fail or time
+    out are reported and skipped.
+
+    Args:
+        paths: Iterable of file paths, e.g. docqa.ingest.files(path).
+        extract: Picklable callable turning a path into a list of data packets.
+        processes: Number of worker processes (default: one per CPU).
+        timeout: Seconds a single file may take before it is abandoned.
+        parsed: Optional set the names of the files that parsed without error
+            are added to, including files without any pages.
+        failed: Optional dict that gets file name -> error message for the
+            files that failed or timed out.
+    """
+    for result in ingest_parallel(paths, processes, timeout, extract):
+        if result.error:
+            metrics.count("files_failed")
+            print(f"{result.file_name}: skipped ({result.error})")
+            if failed is not None:
+                failed[result.file_name] = str(result.error)
+            continue
+        if parsed is not None:
+            parsed.add(result.file_name)
+        # The files are parsed in worker processes; their timings are
+        # recorded here, in the process that owns the metrics.
+        if metrics.REGISTRY.enabled:
+            metrics.observe("extract_pages", result.seconds)
+            metrics.count("files_parsed")
+            metrics.count("pages", len(result.packets))
+            metrics.count("file_bytes", os.path.getsize(result.file_name))
+        print(f"{result.file_name}: {len(result.packets)} pages in {result.seconds:.2f}s")
+        yield from result.packets
+
+
+def clean(packets, profile=DEFAULT_PROFILE):
+    """
+    Stage 2: yield the packets with their content normalized.
+
+    The pages of a file are cleaned together, in one bulk pass over the
+    file's joined text (see docqa.cleaning.TextCleaner), which also lets
+    headers and footers repeated across its pages be removed.
+
+    Args:
+        packets: Page packets, the pages of a file consecutive.
+        profile: Cleaning profile name from docqa.cleaning.PROFILES ("qa",
+            "light" or the old letters-and-digits-only "harsh") or a
+            CleaningProfile.
+    """
+    cleaner = TextCleaner(profile)
+    for _, pages in groupby(packets, key=itemgetter("file_name")):
+        pages = list(pages)
+        cleaned = cleaner.clean_pages([packet["content"] for packet in pages])
+        for packet, content in zip(pages, cleaned):
+            yield dict(packet, content=content)
+
+
+def chunk(
+    packets, max_tokens=DEFAULT_CHUNK_TOKENS, overlap=DEFAULT_OVERLAP_TOKENS, encoder=None
+):
+    """
+    Stage 3: split every page into chunks of at most max_tokens tokens.
+
+    See docqa.chunking.chunk_text for how chunk boundaries are chosen.
+
+    Args:
+        packets: Iterable of data packets.
+        max_tokens: Token budget per chunk; at most the embedding model's
+            input limit.
+        overlap: Tokens shared by consecutive chunks of a page.
+        encoder: Optional tiktoken-style encoder.
+
+    Yields:
+        Dicts with the CHUNK_COLUMNS keys, one per chunk.
+    """
+    if max_tokens > GECKO_MAX_INPUT_TOKENS:
+        raise ValueError(
+            f"max_tokens={max_tokens} exceeds the embedding input limit "
+            f"of {GECKO_MAX_INPUT_TOKENS} tokens"
+        )
+    for packet in packets:
+        pieces = chunk_text(packet["content"], max_tokens, overlap, encoder)
+        if metrics.REGISTRY.enabled:
+            metrics.count("chunks", len(pieces))
+            metrics.count("chunk_tokens", sum(piece.n_tokens for piece in pieces))
+        for piece in pieces:
+            yield {
+                "file_name": packet["file_name"],
+                "file_type": packet["file_type"],
+                "page_number": packet["page_number"],
+                "chunks": piece.text,
+                "char_start": piece.char_start,
+                "char_end": piece.char_end,
+                "n_tokens": piece.n_tokens,
+            }
+
+
+def embed(chunks, embedder, batch_size=250):
+    """
+    Stage 4: embed the chunks batch_size at a time.
+
+    Args:
+        chunks: Iterable of chunk dicts from chunk().
+        embedder: Object with an embed(texts) method, e.g. BatchEmbedder or
+            CachedEmbedder.
+        batch_size: Chunks handed to the embedder per call.
+
+    Yields:
+        (chunk_dicts, embeddings) pairs, embeddings being a float32 matrix.
+    """
+    batch = []
+    for record in chunks:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch, embedder.embed([r["chunks"] for r in batch])
+            batch = []
+    if batch:
+        yield batch, embedder.embed([r["chunks"] for r in batch])
+
+
+def _compact(name):
+    return re.sub(r"[^0-9a-z]", "", name.casefold())
+
+
+def entity_matcher(entities):
+    """
+    Map file names to the entity named in them.
+
+    Names are compared case-insensitively with punctuation and spaces removed,
+    so "Regal Rexnord" matches "dataset/regal-rexnord-esg-2022.pdf". Longer
+    entity names are tried first.
+
+    Args:
+        entities: Company names or document ids.
+
+    Returns:
+        A callable file_name -> entity, or None if no entity matches.
+    """
+    compact = sorted(((_compact(e), e) for e in entities), key=lambda item: -len(item[0]))
+
+    def entity_of(file_name):
+        name = _compact(os.path.basename(file_name))
+        return next((entity for key, entity in compact if key and key in name), None)
+
+    return entity_of
+
+
+class IndexBuilder:
+    """
+    Accumulates embedded chunks into the final compact vector store.
+
+    Embeddings are copied into one growing float32 matrix (capacity doubles
+    when full) instead of being kept as a list of per-batch arrays, so the
+    pipeline never holds more than the index plus one batch. Chunk texts go
+    into one UTF-8 buffer and the metadata into typed arrays (file names and
+    types as small integer codes), so no Python object is kept per chunk.
+
+    Args:
+        initial_capacity: Rows to allocate for the first batch.
+    """
+
+    def __init__(self, initial_capacity=1024):
+        self.initial_capacity = initial_capacity
+        self._embeddings = None
+        self._size = 0
+        self._reset_columns()
+
+    def _reset_columns(self):
+        self._text = bytearray()
+        self._offsets = array("q", [0])
+        self._codes = {column: array("i") for column in CATEGORY_COLUMNS}
+        self._categories = {column: {} for column in CATEGORY_COLUMNS}
+        self._ints = {column: array("q") for column in INT_COLUMNS}
+
+    def __len__(self):
+        return self._size
+
+    def add(self, records, embeddings):
+        """Append one embedded batch (chunk dicts and their embedding rows)."""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        needed = self._size + len(records)
+        if self._embeddings is None:
+            capacity = max(self.initial_capacity, needed)
+            self._embeddings = np.empty((capacity, embeddings.shape[1]), dtype=np.float32)
+        elif needed > self._embeddings.shape[0]:
+            grown = np.empty(
+                (max(needed, 2 * self._embeddings.shape[0]), self._embeddings.shape[1]),
+                dtype=np.float32,
+            )
+            grown[: self._size] = self._embeddings[: self._size]
+            self._embeddings = grown
+        self._embeddings[self._size : needed] = embeddings
+        self._size = needed
+        for record in records:
+            self._text += record["chunks"].encode("utf-8")
+            self._offsets.append(len(self._text))
+            for column, codes in self._codes.items():
+                categories = self._categories[column]
+                codes.append(categories.setdefault(record[column], len(categories)))
+            for column, values in self._ints.items():
+                value = record[column]
+                # Non-PDF files have no page number.
+                values.append(-1 if value is None or value is pd.NA else int(value))
+
+    def finish(self, entity_of=None):
+        """
+        Materialize the vector store.
+
+        Rows are grouped by entity and the index gets one partition per
+        entity, so a company's questions can be searched over its own chunks
+        only.
+
+        Args:
+            entity_of: Maps a file name to its entity: a dict, a callable such
+                as entity_matcher(companies), or None to use the file name
+                itself. Files mapped to None belong to no partition.
+
+        Returns:
+            (chunk_store, index): a docqa.store.ChunkStore with the
+            CHUNK_COLUMNS plus an "entity" column, one row per chunk, and a
+            VectorIndex whose row positions match it.
+        """
+        if self._embeddings is None:
+            embeddings = np.empty((0, 0), dtype=np.float32)
+        else:
+            # Give back the unused capacity without copying the used rows.
+            self._embeddings.resize((self._size, self._embeddings.shape[1]), refcheck=False)
+            embeddings = self._embeddings
+        file_names = list(self._categories["file_name"])
+        if entity_of is None:
+            file_entities = file_names
+        else:
+            lookup = entity_of.get if isinstance(entity_of, dict) else entity_of
+            file_entities = [lookup(name) for name in file_names]
+        entities = list(dict.fromkeys(e for e in file_entities if e is not None))
+        entity_codes = np.array(
+            [-1 if e is None else entities.index(e) for e in file_entities], dtype=np.int32
+        )
+        columns = {
+            column: np.frombuffer(codes, dtype=np.int32) for column, codes in self._codes.items()
+        }
+        columns.update(
+            (column, np.frombuffer(values, dtype=np.int64).astype(np.int32))
+            for column, values in self._ints.items()
+        )
+        columns["entity"] = entity_codes[columns["file_name"]]
+        offsets = np.frombuffer(self._offsets, dtype=np.int64)
+        text = np.frombuffer(self._text, dtype=np.uint8)
+
+        order, partitions = partition_rows(
+            [None if code < 0 else entities[code] for code in columns["entity"]]
+        )
+        if np.any(order != np.arange(len(order))):
+            embeddings = embeddings[order]
+            columns = {column: values[order] for column, values in columns.items()}
+            lengths = np.diff(offsets)[order]
+            text = np.concatenate([text[offsets[i] : offsets[i + 1]] for i in order])
+            offsets = np.concatenate(([0], np.cumsum(lengths)))
+        categories = {column: list(self._categories[column]) for column in CATEGORY_COLUMNS}
+        categories["entity"] = entities
+        chunk_store = ChunkStore(text, offsets, columns, categories, nullable=["page_number"])
+        self._embeddings = None
+        self._size = 0
+        self._reset_columns()
+        return chunk_store, VectorIndex(embeddings, partitions=partitions)
+
+
+def build_index(embedded_batches, entity_of=None):
+    """
+    Stage 5: collect the embedded batches into the vector store.
+
+    Args:
+        embedded_batches: (batch, embeddings) pairs from embed().
+        entity_of: File name -> entity mapping, see IndexBuilder.finish().
+
+    Returns:
+        (chunk_store, index) as in IndexBuilder.finish().
+    """
+    builder = IndexBuilder()
+    for batch, embeddings in embedded_batches:
+        builder.add(batch, embeddings)
+    return builder.finish(entity_of)
+
+
+def stream_index(
+    paths,
+    embedder,
+    max_tokens=DEFAULT_CHUNK_TOKENS,
+    overlap=DEFAULT_OVERLAP_TOKENS,
+    batch_size=250,
+    profile=DEFAULT_PROFILE,
+    processes=None,
+    entity_of=None,
+):
+    """
+    Run ingest -> clean -> chunk -> embed -> index as one stream.
+
+    Pages flow through the stages as generators, so apart from the finished
+    index only one file's pages and one embedding batch are held at a time;
+    no intermediate DataFrame of the whole corpus is built.
+
+    Args:
+        paths: Iterable of file paths, e.g. docqa.ingest.files(path).
+        embedder: Object with an embed(texts) method.
+        max_tokens: Token budget per chunk.
+        overlap: Tokens shared by consecutive chunks of a page.
+        batch_size: Chunks handed to the embedder per call.
+        profile: Cleaning profile, see clean().
+        processes: Worker processes for parsing (default: one per CPU).
+        entity_of: File name -> entity mapping, see IndexBuilder.finish().
+
+    Returns:
+        (chunk_store, index) as in IndexBuilder.finish().
+    """
+    pages = ingest(paths, processes=processes)
+    chunks = chunk(clean(pages, profile), max_tokens, overlap)
+    return build_index(embed(chunks, embedder, batch_size), entity_of)
+
+
+def answer(entities, questions, get_context, answer_question, map_fn=None, journal=None):
+    """
+    Stage 6: ask every question for every entity.
+
+    Args:
+        entities: Document ids or company names appended to each question.
+        questions: List of question dicts with a "question" key.
+        get_context: Callable question -> (context, top_matched_df).
+        answer_question: Callable (question, context, top_matched_df) ->
+            answer text; it builds the prompt and calls the model.
+        map_fn: Optional map(fn, items) used to run the (entity, question)
+            pairs, e.g. AnswerEngine.map to answer them concurrently. It must
+            return results in the order of items. Defaults to the builtin map.
+        journal: Optional docqa.journal.SweepJournal. Every answered pair is
+            appended to it as soon as it completes, and pairs it already
+            holds are not asked again; their answers come from the journal
+            (with top_matched_df None). Once every pair has been yielded the
+            journal is finished, so the next sweep does not resume it.
+
+    Yields:
+        Dicts with the entity, the question, the question dict, the retrieved
+        chunks (top_matched_df and their positions, chunk_ids), the generated
+        answer and whether it was resumed from the journal, in entity then
+        question order.
+    """
+    pairs = [
+        (entity, question_data, entity_question(question_data, entity))
+        for entity in entities
+        for question_data in questions
+    ]
+
+    def answer_pair(pair):
+        entity, question_data, question = pair
+        context, top_matched_df = get_context(question)
+        result = {
+            "entity": entity,
+            "question": question,
+            "question_data": question_data,
+            "top_matched_df": top_matched_df,
+            "chunk_ids": [] if top_matched_df is None else list(top_matched_df.index),
+            "answer": answer_question(question, context, top_matched_df),
+            "resumed": False,
+        }
+        if journal is not None:
+            journal.record(entity, question, result["answer"], result["chunk_ids"])
+        return result
+
+    done = dict(journal.records) if journal is not None else {}
+    pending = [pair for pair in pairs if (pair[0], pair[2]) not in done]
+    if journal is not None and done:
+        print(f"resuming: {len(pairs) - len(pending)} of {len(pairs)} pairs already answered")
+    answered = iter((map_fn or map)(answer_pair, pending))
+    for entity, question_data, question in pairs:
+        record = done.get((entity, question))
+        if record is None:
+            yield next(answered)
+            continue
+        yield {
+            "entity": entity,
+            "question": question,
+            "question_data": question_data,
+            "top_matched_df": None,
+            "chunk_ids": record["chunk_ids"],
+            "answer": record["answer"],
+            "resumed": True,
+        }
+    if journal is not None:
+        journal.finish()
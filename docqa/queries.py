@@ -0,0 +1,138 @@
+"""Query embeddings for entity x question sweeps.
+
+The sweeps ask the same questions for every company or contract by appending
+" For <entity>" to each question, which used to cost one embedding call per
+(entity, question) pair. Here every unique question is embedded once. When
+the index has a partition for the entity, its questions are searched over
+that entity's chunks only; otherwise the entity name is embedded once too and
+the pair's query vector is composed from the two.
+"""
+
+import numpy as np
+
+from docqa import metrics
+from docqa.retrieval import context_from_positions
+
+# How strongly the entity name pulls the query towards that entity's chunks.
+DEFAULT_ENTITY_WEIGHT = 0.35
+
+
+def entity_question(question_data, entity):
+    """The question text the sweeps ask for one entity."""
+    return question_data["question"] + f" For {entity}"
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+class QueryEmbedder:
+    """
+    Memoizes query embeddings.
+
+    Every distinct text is embedded once per QueryEmbedder; wrapping a
+    CachedEmbedder also reuses vectors from earlier runs.
+
+    Args:
+        embedder: Object with an embed(texts) method returning a matrix
+            (BatchEmbedder or CachedEmbedder).
+    """
+
+    def __init__(self, embedder):
+        self.embedder = embedder
+        self._vectors = {}
+
+    def embed(self, texts):
+        """
+        Embed texts, sending only the ones not seen before in one batch.
+
+        Returns:
+            A (texts x dimensions) float32 array in input order.
+        """
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        missing = list(dict.fromkeys(t for t in texts if t not in self._vectors))
+        if missing:
+            for text, vector in zip(missing, self.embedder.embed(missing)):
+                self._vectors[text] = vector
+        return np.stack([self._vectors[t] for t in texts]).astype(np.float32, copy=False)
+
+
+def compose_queries(question_vectors, entity_vectors, entity_weight=DEFAULT_ENTITY_WEIGHT):
+    """
+    Query vectors for every (entity, question) pair.
+
+    Each pair's vector is the normalized question vector plus entity_weight
+    times the normalized entity vector, standing in for the embedding of
+    "<question> For <entity>".
+
+    Args:
+        question_vectors: (questions x dimensions) array.
+        entity_vectors: (entities x dimensions) array.
+        entity_weight: Weight of the entity term; 0 uses the question alone.
+
+    Returns:
+        An (entities x questions x dimensions) float32 array.
+    """
+    questions = _normalize(np.asarray(question_vectors, dtype=np.float32))
+    entities = _normalize(np.asarray(entity_vectors, dtype=np.float32))
+    return _normalize(questions[None, :, :] + entity_weight * entities[:, None, :])
+
+
+@metrics.timed("sweep_contexts")
+def sweep_contexts(
+    entities,
+    questions,
+    query_embedder,
+    index,
+    vector_store,
+    sort_index_value=5,
+    entity_weight=DEFAULT_ENTITY_WEIGHT,
+):
+    """
+    Retrieve the context of every (entity, question) pair, one batched search
+    per entity partition plus one for the entities without a partition.
+
+    Args:
+        entities: Company names or document ids.
+        questions: Question dicts with a "question" key.
+        query_embedder: A QueryEmbedder.
+        index: VectorIndex over vector_store's embeddings.
+        vector_store: The chunk DataFrame.
+        sort_index_value: Chunks to retrieve per pair.
+        entity_weight: See compose_queries; only used for entities the index
+            has no partition for.
+
+    Returns:
+        A dict mapping entity_question(question_data, entity) to the pair's
+        (context, top_matched_df), ready to back pipeline.answer's
+        get_context.
+    """
+    entities = list(entities)
+    questions = list(questions)
+    if not entities or not questions:
+        return {}
+    question_vectors = query_embedder.embed([q["question"] for q in questions])
+    positions = {}
+    unpartitioned = [entity for entity in entities if entity not in index.partitions]
+    for entity in entities:
+        if entity in index.partitions:
+            positions[entity] = index.search_batch(
+                question_vectors, sort_index_value, partition=entity
+            )[0]
+    if unpartitioned:
+        queries = compose_queries(
+            question_vectors, query_embedder.embed(unpartitioned), entity_weight
+        )
+        found, _ = index.search_batch(queries.reshape(-1, queries.shape[-1]), sort_index_value)
+        for entity, rows in zip(unpartitioned, found.reshape(len(unpartitioned), len(questions), -1)):
+            positions[entity] = rows
+    return {
+        entity_question(question_data, entity): context_from_positions(
+            vector_store, positions[entity][i]
+        )
+        for entity in entities
+        for i, question_data in enumerate(questions)
+    }
@@ -0,0 +1,219 @@
+"""Columnar results: answers streamed to Parquet, partitioned by run and entity.
+
+The sweeps collected their answers in a list and wrote one CSV at the end,
+repeating the full question text on every row and leaving the dashboards to
+re-parse the "{ value, page }" answers. ResultsWriter writes them as they
+arrive, in record batches, to a Parquet dataset laid out as
+
+    results/run=20261017T093000/entity=Regal%20Rexnord/part-0.parquet
+
+Question and category columns are dictionary encoded, the parsed value,
+page and is_null are typed columns, and a reader can load one run or one
+entity without touching the rest:
+
+    with ResultsWriter("results") as writer:
+        for result in pipeline.answer(...):
+            writer.write(result["entity"], question=..., answer=result["answer"])
+
+    df = read_results("results", runs=[writer.run])
+
+pyarrow is only needed by this module and is imported on first use.
+"""
+
+import os
+import time
+from urllib.parse import quote
+
+from docqa.answers import parse_answer
+
+# Low-cardinality string columns, stored as a dictionary plus int32 codes.
+DICTIONARY_COLUMNS = ("question", "esgType", "esgIndicators")
+PARTITION_COLUMNS = ("run", "entity")
+DEFAULT_BATCH_ROWS = 1000
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as error:
+        raise ImportError(
+            "writing and reading Parquet results needs pyarrow (pip install pyarrow)"
+        ) from error
+    return pyarrow
+
+
+def new_run_id():
+    """A sortable id for a sweep run, the local time it started."""
+    return time.strftime("%Y%m%dT%H%M%S")
+
+
+def _column_type(pa, name, dictionary_columns):
+    if name in dictionary_columns:
+        return pa.dictionary(pa.int32(), pa.string())
+    return {
+        "value": pa.string(),
+        "page": pa.int32(),
+        "is_null": pa.bool_(),
+        "chunk_ids": pa.list_(pa.int32()),
+        "completed": pa.float64(),
+    }.get(name, pa.string())
+
+
+class ResultsWriter:
+    """
+    Streams answer rows to a Parquet dataset partitioned by run and entity.
+
+    Rows are buffered and written per entity every batch_rows rows, each
+    batch as a row group of that entity's file, so memory stays bounded by
+    the batch and not by the sweep. Files are written under a temporary name
+    and renamed on close(), so an interrupted run leaves no unreadable
+    Parquet files behind: the temporary name starts with an underscore, which
+    pyarrow skips when it reads the dataset.
+
+    Args:
+        root: Directory of the dataset; created if missing.
+        run: Run id of this sweep; defaults to new_run_id().
+        answer_column: Column holding the answer text; the value, page and
+            is_null columns are parsed from it.
+        dictionary_columns: Columns stored dictionary encoded.
+        batch_rows: Rows buffered before they are written.
+        compression: Parquet compression codec.
+    """
+
+    def __init__(
+        self,
+        root,
+        run=None,
+        answer_column="answer",
+        dictionary_columns=DICTIONARY_COLUMNS,
+        batch_rows=DEFAULT_BATCH_ROWS,
+        compression="zstd",
+    ):
+        self.pa = _pyarrow()
+        self.root = root
+        self.run = run or new_run_id()
+        self.answer_column = answer_column
+        self.dictionary_columns = tuple(dictionary_columns)
+        self.batch_rows = batch_rows
+        self.compression = compression
+        self.schema = None
+        self.rows_written = 0
+        self._rows = []
+        self._writers = {}
+        self._paths = {}
+
+    def _entity_directory(self, entity):
+        # Partition values are URI-encoded, as pyarrow's hive partitioning
+        # expects, so entity names may contain spaces and slashes.
+        return os.path.join(
+            self.root, f"run={quote(self.run, safe='')}", f"entity={quote(str(entity), safe='')}"
+        )
+
+    def write(self, entity, **columns):
+        """
+        Add one answer row.
+
+        Args:
+            entity: The company name or document id the row belongs to.
+            **columns: The row's columns, including answer_column. The
+                columns of the first row fix the schema of the run.
+        """
+        value, page, is_null = parse_answer(columns.get(self.answer_column))
+        self._rows.append((entity, {**columns, "value": value, "page": page, "is_null": is_null}))
+        if len(self._rows) >= self.batch_rows:
+            self.flush()
+
+    def _make_schema(self, row):
+        pa = self.pa
+        return pa.schema([
+            (name, _column_type(pa, name, self.dictionary_columns))
+            for name in row
+            if name not in PARTITION_COLUMNS
+        ])
+
+    def flush(self):
+        """Write the buffered rows, one record batch per entity."""
+        if not self._rows:
+            return
+        pa = self.pa
+        if self.schema is None:
+            self.schema = self._make_schema(self._rows[0][1])
+        by_entity = {}
+        for entity, row in self._rows:
+            by_entity.setdefault(entity, []).append(row)
+        for entity, rows in by_entity.items():
+            batch = pa.RecordBatch.from_pylist(rows, schema=self.schema)
+            self._writer(entity).write_batch(batch)
+            self.rows_written += len(rows)
+        self._rows = []
+
+    def _writer(self, entity):
+        writer = self._writers.get(entity)
+        if writer is None:
+            directory = self._entity_directory(entity)
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, "part-0.parquet")
+            writer = self.pa.parquet.ParquetWriter(
+                os.path.join(directory, "_part-0.parquet"), self.schema, compression=self.compression
+            )
+            self._writers[entity] = writer
+            self._paths[entity] = path
+        return writer
+
+    def close(self):
+        """Write the remaining rows and finish the files of every entity."""
+        self.flush()
+        for entity, writer in self._writers.items():
+            writer.close()
+            path = self._paths[entity]
+            os.replace(os.path.join(os.path.dirname(path), "_part-0.parquet"), path)
+        self._writers = {}
+        self._paths = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_results(root, runs=None, entities=None, columns=None):
+    """
+    Load a results dataset, or the selected runs and entities of it.
+
+    Only the partitions that match are read.
+
+    Args:
+        root: Directory of the dataset.
+        runs: Optional list of run ids to load.
+        entities: Optional list of entities to load.
+        columns: Optional list of columns to load; run and entity are
+            always included.
+
+    Returns:
+        A DataFrame with run and entity columns followed by the row columns;
+        page is Int64 and the dictionary columns are categoricals.
+    """
+    pa = _pyarrow()
+    import pandas as pd
+    import pyarrow.dataset as ds
+
+    partitioning = ds.partitioning(
+        pa.schema([("run", pa.string()), ("entity", pa.string())]), flavor="hive"
+    )
+    dataset = ds.dataset(root, format="parquet", partitioning=partitioning)
+    filters = []
+    if runs is not None:
+        filters.append(ds.field("run").isin([str(run) for run in runs]))
+    if entities is not None:
+        filters.append(ds.field("entity").isin([str(entity) for entity in entities]))
+    expression = None
+    for condition in filters:
+        expression = condition if expression is None else expression & condition
+    if columns is not None:
+        columns = [*PARTITION_COLUMNS, *(name for name in columns if name not in PARTITION_COLUMNS)]
+    else:
+        columns = [*PARTITION_COLUMNS, *(name for name in dataset.schema.names if name not in PARTITION_COLUMNS)]
+    table = dataset.to_table(columns=columns, filter=expression)
+    return table.to_pandas(types_mapper={pa.int32(): pd.Int64Dtype()}.get)
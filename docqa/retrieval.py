@@ -0,0 +1,322 @@
+"""Vectorized top-k retrieval over chunk embeddings.
+
+All chunk embeddings are stacked into one contiguous float32 matrix so a
+question is scored with a single matrix-vector product (or a whole batch of
+questions with one matrix-matrix product) instead of a Python call per chunk.
+"""
+
+import numpy as np
+
+from docqa import metrics
+
+METRICS = ("cosine", "dot")
+
+
+def _top_k(scores, k):
+    """
+    Get the positions of the k highest scores, best first.
+
+    Args:
+        scores: 1-D array of similarity scores.
+        k: How many positions to return.
+
+    Returns:
+        An int array of at most k positions sorted by decreasing score.
+    """
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < scores.shape[0]:
+        # argpartition is O(n); only the k survivors need a real sort.
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.shape[0])
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def _top_k_batch(scores, k):
+    """Row-wise version of _top_k for a (queries x chunks) score matrix."""
+    n_queries, n_rows = scores.shape
+    k = min(k, n_rows)
+    if k <= 0:
+        return np.empty((n_queries, 0), dtype=np.int64)
+    if k < n_rows:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(n_rows), (n_queries, n_rows))
+    order = np.argsort(
+        -np.take_along_axis(scores, candidates, axis=1), axis=1, kind="stable"
+    )
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def partition_rows(labels):
+    """
+    Order rows so the rows of every label are contiguous.
+
+    Args:
+        labels: One label (e.g. company or document id) per row; None for rows
+            that belong to no partition.
+
+    Returns:
+        (order, partitions): the stable row permutation that groups the rows
+        by label, in order of first appearance with unlabelled rows last, and
+        a dict mapping each label to its (start, stop) rows after reordering.
+    """
+    codes_of = {}
+    for label in labels:
+        if label is not None and label not in codes_of:
+            codes_of[label] = len(codes_of)
+    unlabelled = len(codes_of)
+    codes = np.fromiter(
+        (unlabelled if label is None else codes_of[label] for label in labels),
+        dtype=np.int64,
+        count=len(labels),
+    )
+    order = np.argsort(codes, kind="stable")
+    bounds = np.concatenate(([0], np.cumsum(np.bincount(codes, minlength=unlabelled + 1))))
+    partitions = {
+        label: (int(bounds[code]), int(bounds[code + 1])) for label, code in codes_of.items()
+    }
+    return order, partitions
+
+
+class VectorIndex:
+    """
+    Exact similarity search over a fixed set of chunk embeddings.
+
+    Row i of the index is row i of the vector store it was built from, so the
+    positions returned by search() can be used directly with DataFrame.iloc.
+
+    Args:
+        embeddings: A (chunks x dimensions) array, or anything np.asarray
+            accepts (e.g. a list of per-chunk vectors).
+        metric: "cosine" (default) or "dot". The gecko embeddings are unit
+            length, so both rank chunks the same way as the old np.dot scoring.
+        partitions: Optional dict mapping a label (company, document id) to
+            the contiguous (start, stop) rows holding its chunks, as returned
+            by partition_rows(). Searches given a partition only score those
+            rows.
+        norms: Optional precomputed row norms. Passing them (e.g. from a
+            saved store) avoids reading the whole matrix when the index is
+            built over a memory-mapped file.
+    """
+
+    def __init__(self, embeddings, metric="cosine", partitions=None, norms=None):
+        if metric not in METRICS:
+            raise ValueError(f"metric must be one of {METRICS}, got {metric!r}")
+        matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if matrix.ndim == 1 and matrix.size == 0:
+            matrix = matrix.reshape(0, 0)
+        if matrix.ndim != 2:
+            raise ValueError(f"embeddings must be 2-D, got shape {matrix.shape}")
+        self.matrix = matrix
+        self.metric = metric
+        self.partitions = dict(partitions or {})
+        if norms is None:
+            norms = np.linalg.norm(matrix, axis=1)
+        self.norms = np.asarray(norms, dtype=np.float32)
+        # Empty chunks embed to zero vectors; keep them at score 0 instead of nan.
+        with np.errstate(divide="ignore"):
+            self._inv_norms = np.where(self.norms > 0, 1.0 / self.norms, 0.0).astype(
+                np.float32
+            )
+
+    @classmethod
+    def from_frame(cls, vector_store, column="embedding", metric="cosine", dimensions=None):
+        """
+        Build an index from the "embedding" column of a chunk DataFrame.
+
+        Args:
+            vector_store: DataFrame with one embedding (list or np.array) per row.
+            column: Name of the embedding column.
+            metric: Similarity metric, see VectorIndex.
+            dimensions: Length of the embeddings, used when no row has one
+                (every embedding call failed). Without it that raises
+                ValueError instead of building an index queries cannot match.
+
+        Returns:
+            A VectorIndex whose row positions match vector_store's row positions.
+        """
+        values = [
+            None if v is None else np.asarray(v, dtype=np.float32)
+            for v in vector_store[column].to_numpy()
+        ]
+        dimensions = next((v.shape[0] for v in values if v is not None), dimensions)
+        if dimensions is None:
+            if values:
+                raise ValueError(
+                    f"none of the {len(values)} rows has an embedding; pass dimensions to "
+                    "build an index of zero vectors"
+                )
+            dimensions = 0
+        matrix = np.zeros((len(values), dimensions), dtype=np.float32)
+        for i, v in enumerate(values):
+            # Chunks whose embedding failed stay as zero rows and never match.
+            if v is not None:
+                matrix[i] = v
+        return cls(matrix, metric=metric)
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    @property
+    def dimensions(self):
+        return self.matrix.shape[1]
+
+    def rows(self, partition=None):
+        """The (start, stop) rows of a partition; all rows for None."""
+        if partition is None:
+            return 0, len(self)
+        try:
+            return self.partitions[partition]
+        except KeyError:
+            raise KeyError(f"the index has no partition {partition!r}") from None
+
+    def _prepare_queries(self, queries):
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        if self.metric == "cosine":
+            norms = np.linalg.norm(queries, axis=-1, keepdims=True)
+            queries = queries / np.where(norms > 0, norms, 1.0)
+        return queries
+
+    def scores(self, query, partition=None):
+        """
+        Score every chunk against one query vector.
+
+        Args:
+            query: 1-D query embedding.
+            partition: Only score this partition's rows.
+
+        Returns:
+            A float32 array with one score per chunk of the partition (of the
+            whole index if partition is None).
+        """
+        start, stop = self.rows(partition)
+        if start == stop:
+            # Nothing to score; an empty index may not know its dimensions.
+            return np.empty(0, dtype=np.float32)
+        scores = self.matrix[start:stop] @ self._prepare_queries(query)
+        if self.metric == "cosine":
+            scores *= self._inv_norms[start:stop]
+        return scores
+
+    def scores_batch(self, queries, partition=None):
+        """
+        Score every chunk against a batch of query vectors at once.
+
+        Args:
+            queries: (queries x dimensions) array.
+            partition: Only score this partition's rows.
+
+        Returns:
+            A (queries x chunks) float32 score matrix.
+        """
+        start, stop = self.rows(partition)
+        if start == stop:
+            return np.empty((len(queries), 0), dtype=np.float32)
+        scores = self._prepare_queries(queries) @ self.matrix[start:stop].T
+        if self.metric == "cosine":
+            scores *= self._inv_norms[start:stop]
+        return scores
+
+    def search(self, query, k=2, partition=None):
+        """
+        Find the k chunks most similar to a query.
+
+        Args:
+            query: 1-D query embedding.
+            k: Number of chunks to return.
+            partition: Only search this partition, e.g. one company's chunks.
+
+        Returns:
+            (positions, scores), both sorted by decreasing similarity.
+            Positions are rows of the whole index; both are empty when there
+            is nothing to search.
+        """
+        scores = self.scores(query, partition)
+        top = _top_k(scores, k)
+        return top + self.rows(partition)[0], scores[top]
+
+    def search_batch(self, queries, k=2, partition=None):
+        """
+        Find the k most similar chunks for every query in a batch.
+
+        Args:
+            queries: (queries x dimensions) array.
+            k: Number of chunks to return per query.
+            partition: Only search this partition, e.g. one company's chunks.
+
+        Returns:
+            (positions, scores), each of shape (queries x k), every row sorted
+            by decreasing similarity. Positions are rows of the whole index.
+        """
+        scores = self.scores_batch(queries, partition)
+        top = _top_k_batch(scores, k)
+        return top + self.rows(partition)[0], np.take_along_axis(scores, top, axis=1)
+
+
+def context_from_positions(vector_store, positions, text_column="chunks"):
+    """
+    Turn search() positions into the (context, top_matched_df) pair the
+    notebooks pass to the prompt.
+
+    Args:
+        vector_store: The chunk DataFrame (or docqa.store.ChunkStore) the
+            index was built from.
+        positions: Row positions, best match first.
+        text_column: Column holding the chunk text.
+
+    Returns:
+        The matched chunk texts joined into one string, and a DataFrame with
+        file_name, page_number and the chunk text of every match.
+    """
+    # DataFrame.take and ChunkStore.take both select rows by position.
+    top_matched_df = vector_store.take(np.asarray(positions))[
+        ["file_name", "page_number", text_column]
+    ]
+    context = " ".join(top_matched_df[text_column].values)
+    return context, top_matched_df
+
+
+@metrics.timed("retrieval")
+def get_context_from_question(
+    question, vector_store, index, embed_fn, sort_index_value=2, text_column="chunks"
+):
+    """
+    Embed a question and return the context built from its closest chunks.
+
+    Args:
+        question: The question text.
+        vector_store: The chunk DataFrame the index was built from.
+        index: VectorIndex over vector_store's embeddings.
+        embed_fn: Callable taking a list of texts and returning one embedding,
+            e.g. embedding_model_with_backoff.
+        sort_index_value: How many chunks to pick.
+        text_column: Column holding the chunk text.
+
+    Returns:
+        (context, top_matched_df) as in context_from_positions().
+    """
+    positions, _ = index.search(np.asarray(embed_fn([question])), sort_index_value)
+    return context_from_positions(vector_store, positions, text_column)
+
+
+def get_contexts_for_questions(
+    query_vectors, vector_store, index, sort_index_value=2, text_column="chunks"
+):
+    """
+    Batched get_context_from_question for pre-computed query embeddings.
+
+    Args:
+        query_vectors: (questions x dimensions) array of query embeddings.
+        vector_store: The chunk DataFrame the index was built from.
+        index: VectorIndex over vector_store's embeddings.
+        sort_index_value: How many chunks to pick per question.
+        text_column: Column holding the chunk text.
+
+    Returns:
+        A list with one (context, top_matched_df) pair per query, in order.
+    """
+    positions, _ = index.search_batch(query_vectors, sort_index_value)
+    return [context_from_positions(vector_store, row, text_column) for row in positions]
@@ -0,0 +1,326 @@
+"""On-disk, memory-mapped chunk store.
+
+The vector store used to live only in the notebook kernel, so every session
+re-ingested and re-embedded the corpus. save_store() writes it as a directory
+of flat files:
+
+    manifest.json     row count, columns, categories, metric, partitions,
+                      source file fingerprints, chunking settings
+    embeddings.npy    (chunks x dimensions) float32 matrix
+    norms.npy         row norms of the matrix
+    text.bin          all chunk texts, UTF-8, back to back
+    text_offsets.npy  byte offset of every chunk's text (chunks + 1)
+    <column>.npy      one typed array per metadata column; categorical
+                      columns (file names, types, entities) as int32 codes
+
+load_store() maps the arrays and the text buffer read-only with np.load /
+np.memmap, so loading costs the manifest and the norms, pages are only read
+when a chunk is touched, and processes loading the same store share the
+pages through the OS page cache.
+"""
+
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from docqa.retrieval import VectorIndex
+
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+TEXT_COLUMN = "chunks"
+
+
+def _nullable_int(values):
+    """Whether a Series holds integers with missing values (Int64 or float with NaN)."""
+    if pd.api.types.is_extension_array_dtype(values) and pd.api.types.is_integer_dtype(values):
+        return True
+    if not pd.api.types.is_float_dtype(values) or not values.isna().any():
+        return False
+    present = values.dropna()
+    return bool((present == np.floor(present)).all())
+
+
+class ChunkRecord:
+    """One chunk of a ChunkStore, read out of its columns."""
+
+    __slots__ = (
+        "position",
+        "file_name",
+        "file_type",
+        "page_number",
+        "entity",
+        "text",
+        "char_start",
+        "char_end",
+        "n_tokens",
+    )
+
+    def __init__(self, position, **fields):
+        self.position = position
+        for name in self.__slots__[1:]:
+            setattr(self, name, fields.get(name))
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"ChunkRecord({fields})"
+
+
+class ChunkStore:
+    """
+    Chunk texts and metadata held column by column in flat arrays.
+
+    Args:
+        text: UTF-8 bytes of all chunk texts back to back (bytes, a uint8
+            array or a memmap).
+        offsets: int64 array of chunks + 1 byte offsets into text.
+        columns: Dict of column name -> 1-D numpy array, one value per chunk.
+        categories: Dict of column name -> list of categories for the columns
+            stored as integer codes (-1 for a missing value).
+        nullable: Integer columns in which -1 means a missing value (e.g. the
+            page number of a non-PDF file).
+    """
+
+    def __init__(self, text, offsets, columns, categories=None, nullable=()):
+        if isinstance(text, (bytes, bytearray)):
+            text = np.frombuffer(text, dtype=np.uint8)
+        self._text = text
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.columns = dict(columns)
+        self.categories = {name: list(values) for name, values in (categories or {}).items()}
+        self.nullable = list(nullable)
+
+    @classmethod
+    def from_frame(cls, vector_store, text_column=TEXT_COLUMN):
+        """
+        Convert a chunk DataFrame (e.g. from pipeline.build_index) to a store.
+
+        Category, string and object columns are stored as integer codes.
+        Integer columns with missing values (nullable Int64, or floats with
+        NaN such as a page_number of non-PDF files) are stored as int32 with
+        -1 for a missing value, as IndexBuilder does; other numeric columns
+        as they are. An "embedding" column is left out, the vectors belong
+        to the index.
+        """
+        encoded = [text.encode("utf-8") for text in vector_store[text_column]]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(text) for text in encoded], out=offsets[1:])
+        columns = {}
+        categories = {}
+        nullable = []
+        for name in vector_store.columns:
+            if name in (text_column, "embedding"):
+                continue
+            values = vector_store[name]
+            if (
+                pd.api.types.is_string_dtype(values)
+                or pd.api.types.is_object_dtype(values)
+                or isinstance(values.dtype, pd.CategoricalDtype)
+            ):
+                values = values.astype("category")
+                columns[name] = values.cat.codes.to_numpy(dtype=np.int32)
+                categories[name] = values.cat.categories.tolist()
+            elif _nullable_int(values):
+                columns[name] = values.fillna(-1).to_numpy(dtype=np.int32)
+                nullable.append(name)
+            else:
+                columns[name] = values.to_numpy()
+        return cls(b"".join(encoded), offsets, columns, categories, nullable)
+
+    def __len__(self):
+        return self.offsets.shape[0] - 1
+
+    @property
+    def shape(self):
+        return len(self), len(self.columns) + 1
+
+    def text(self, position):
+        """The text of one chunk."""
+        start, stop = self.offsets[position], self.offsets[position + 1]
+        return bytes(self._text[start:stop]).decode("utf-8")
+
+    def texts(self, positions=None):
+        """The texts of the chunks at positions (all chunks if None)."""
+        if positions is None:
+            positions = range(len(self))
+        return [self.text(position) for position in positions]
+
+    def column(self, name, positions=None):
+        """
+        One metadata column (or the chunk texts) as a pandas Series.
+
+        Args:
+            name: Column name, or "chunks" for the texts.
+            positions: Optional row positions to select.
+        """
+        if name == TEXT_COLUMN:
+            return pd.Series(self.texts(positions), name=name, dtype=object)
+        values = self.columns[name]
+        if positions is not None:
+            values = values[np.asarray(positions)]
+        if name in self.categories:
+            values = pd.Categorical.from_codes(values, self.categories[name])
+        elif name in self.nullable:
+            values = pd.arrays.IntegerArray(values.astype(np.int64), values < 0)
+        return pd.Series(values, name=name)
+
+    def record(self, position):
+        """
+        One chunk as a ChunkRecord, without building a DataFrame.
+
+        Args:
+            position: Row position of the chunk.
+        """
+        fields = {}
+        for name, values in self.columns.items():
+            value = values[position]
+            if name in self.categories:
+                value = self.categories[name][value] if value >= 0 else None
+            elif name in self.nullable and value < 0:
+                value = None
+            else:
+                value = value.item()
+            fields[name] = value
+        return ChunkRecord(position, text=self.text(position), **fields)
+
+    def records(self, positions=None):
+        """Yield ChunkRecords for positions (all chunks if None)."""
+        for position in range(len(self)) if positions is None else positions:
+            yield self.record(position)
+
+    def __getitem__(self, name):
+        return self.column(name)
+
+    def take(self, positions):
+        """
+        The chunks at positions as a DataFrame, like DataFrame.take, so a
+        store can be passed wherever the chunk DataFrame was.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        frame = {name: self.column(name, positions).array for name in self.columns}
+        frame[TEXT_COLUMN] = self.texts(positions)
+        return pd.DataFrame(frame, index=positions)
+
+    def head(self, n=5):
+        return self.take(np.arange(min(n, len(self))))
+
+    def to_frame(self):
+        """Materialize the whole store as a chunk DataFrame."""
+        return self.take(np.arange(len(self))).reset_index(drop=True)
+
+
+def save_store(directory, vector_store, index, sources=None, config=None):
+    """
+    Write a chunk store and its index to a directory.
+
+    The store is written to a temporary sibling directory that then replaces
+    the old one, so an interrupted save leaves the previous store intact and
+    processes still mapping the old files are not affected.
+
+    Args:
+        directory: Target directory; an existing store there is replaced.
+        vector_store: Chunk DataFrame or ChunkStore.
+        index: The VectorIndex built over vector_store's rows.
+        sources: Optional JSON-serializable description of the source files
+            (see docqa.incremental), kept in the manifest.
+        config: Optional JSON-serializable settings the chunks were made
+            with (see docqa.incremental), kept in the manifest.
+    """
+    if not isinstance(vector_store, ChunkStore):
+        vector_store = ChunkStore.from_frame(vector_store)
+    if len(vector_store) != len(index):
+        raise ValueError(f"{len(vector_store)} chunks but {len(index)} index rows")
+    directory = os.path.normpath(directory)
+    staging = f"{directory}.tmp-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    np.save(os.path.join(staging, "embeddings.npy"), np.asarray(index.matrix, dtype=np.float32))
+    np.save(os.path.join(staging, "norms.npy"), np.asarray(index.norms, dtype=np.float32))
+    np.save(os.path.join(staging, "text_offsets.npy"), vector_store.offsets)
+    vector_store._text.tofile(os.path.join(staging, "text.bin"))
+    for name, values in vector_store.columns.items():
+        np.save(os.path.join(staging, f"{name}.npy"), values)
+    manifest = {
+        "version": FORMAT_VERSION,
+        "rows": len(vector_store),
+        "dimensions": index.dimensions,
+        "metric": index.metric,
+        "columns": list(vector_store.columns),
+        "categories": vector_store.categories,
+        "nullable": vector_store.nullable,
+        "partitions": {str(label): list(rows) for label, rows in index.partitions.items()},
+        "sources": sources or {},
+        "config": config or {},
+    }
+    with open(os.path.join(staging, MANIFEST), "w") as f:
+        json.dump(manifest, f)
+    retired = f"{directory}.old-{os.getpid()}"
+    if os.path.exists(directory):
+        os.rename(directory, retired)
+    os.rename(staging, directory)
+    shutil.rmtree(retired, ignore_errors=True)
+
+
+def read_manifest(directory):
+    """The manifest of a saved store, or None if there is no store."""
+    if not store_exists(directory):
+        return None
+    with open(os.path.join(directory, MANIFEST)) as f:
+        return json.load(f)
+
+
+def store_exists(directory):
+    """Whether directory holds a completely written store."""
+    return os.path.exists(os.path.join(directory, MANIFEST))
+
+
+def load_store(directory, mmap=True):
+    """
+    Open a store written by save_store.
+
+    Args:
+        directory: The store directory.
+        mmap: Map the embeddings, columns and text read-only instead of
+            reading them into memory.
+
+    Returns:
+        (chunk_store, index): a ChunkStore and a VectorIndex over the stored
+        embeddings, with the saved metric and partitions.
+    """
+    manifest = read_manifest(directory)
+    if manifest is None:
+        raise FileNotFoundError(f"no saved store in {directory}")
+    if manifest["version"] != FORMAT_VERSION:
+        raise ValueError(f"unsupported store version {manifest['version']} in {directory}")
+    mmap_mode = "r" if mmap else None
+
+    def array(name):
+        return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+
+    text_path = os.path.join(directory, "text.bin")
+    if not mmap:
+        text = np.fromfile(text_path, dtype=np.uint8)
+    elif os.path.getsize(text_path):
+        text = np.memmap(text_path, dtype=np.uint8, mode="r")
+    else:
+        # np.memmap cannot map an empty file.
+        text = np.empty(0, dtype=np.uint8)
+    chunk_store = ChunkStore(
+        text,
+        array("text_offsets"),
+        {name: array(name) for name in manifest["columns"]},
+        manifest["categories"],
+        manifest.get("nullable", ()),
+    )
+    embeddings = array("embeddings")
+    if manifest["rows"] == 0:
+        embeddings = embeddings.reshape(0, manifest["dimensions"])
+    index = VectorIndex(
+        embeddings,
+        metric=manifest["metric"],
+        partitions={label: tuple(rows) for label, rows in manifest["partitions"].items()},
+        norms=np.load(os.path.join(directory, "norms.npy")),
+    )
+    return chunk_store, index
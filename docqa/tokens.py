@@ -0,0 +1,134 @@
+"""Token accounting for prompts and chunks.
+
+The tiktoken encoder is loaded once per process, every distinct text is
+encoded at most once, and a prompt's token count is the sum of the cached
+counts of its parts (template text, context chunks, question) instead of a
+fresh encode of the whole prompt.
+"""
+
+import string
+from functools import lru_cache
+
+DEFAULT_ENCODING = "p50k_base"
+
+
+@lru_cache(maxsize=None)
+def get_encoder(encoding=DEFAULT_ENCODING):
+    """Load a tiktoken encoding once per process."""
+    import tiktoken
+
+    return tiktoken.get_encoding(encoding)
+
+
+class TokenCounter:
+    """
+    Cached token counts per text.
+
+    Counting the parts of a text separately can only lose merges across the
+    part boundaries, so a sum of part counts is, in practice, an upper bound
+    on the count of the joined text and safe for budget checks.
+
+    Args:
+        encoding: tiktoken encoding name.
+        encoder: Encoder to use instead of loading encoding (anything with
+            encode_ordinary and encode_ordinary_batch).
+        max_entries: Cached texts kept before the oldest are dropped.
+    """
+
+    def __init__(self, encoding=DEFAULT_ENCODING, encoder=None, max_entries=1_000_000):
+        self._encoder = encoder
+        self.encoding = encoding
+        self.max_entries = max_entries
+        self._counts = {}
+
+    @property
+    def encoder(self):
+        if self._encoder is None:
+            self._encoder = get_encoder(self.encoding)
+        return self._encoder
+
+    def __len__(self):
+        return len(self._counts)
+
+    def _remember(self, text, count):
+        if len(self._counts) >= self.max_entries:
+            # dicts keep insertion order: drop the oldest entry.
+            del self._counts[next(iter(self._counts))]
+        self._counts[text] = count
+
+    def seed(self, texts, counts):
+        """Record counts computed elsewhere, e.g. the chunker's n_tokens."""
+        for text, count in zip(texts, counts):
+            self._remember(text, int(count))
+
+    def count(self, text):
+        """Token count of one text."""
+        count = self._counts.get(text)
+        if count is None:
+            count = len(self.encoder.encode_ordinary(text))
+            self._remember(text, count)
+        return count
+
+    def count_many(self, texts):
+        """
+        Token counts of many texts, encoding all cache misses in one batch call.
+
+        Args:
+            texts: Sequence of texts.
+
+        Returns:
+            A list of token counts in input order.
+        """
+        texts = list(texts)
+        missing = list({text for text in texts if text not in self._counts})
+        if missing:
+            for text, tokens in zip(missing, self.encoder.encode_ordinary_batch(missing)):
+                self._remember(text, len(tokens))
+        return [self.count(text) for text in texts]
+
+    def count_joined(self, parts):
+        """Token count of the parts joined together, from their cached counts."""
+        return sum(self.count_many(parts))
+
+
+class PromptTemplate:
+    """
+    A str.format prompt template whose token count is computed from parts.
+
+    Args:
+        template: Template string with {named} fields.
+
+    Example:
+        QA = PromptTemplate("Context:\\n{context}\\nQuestion:\\n{question}")
+        QA.count_tokens(counter, context=chunks, question=question)
+    """
+
+    def __init__(self, template):
+        self.template = template
+        parsed = list(string.Formatter().parse(template))
+        self.literals = [literal for literal, _, _, _ in parsed if literal]
+        self.fields = [field for _, field, _, _ in parsed if field is not None]
+
+    def format(self, **values):
+        return self.template.format(**values)
+
+    def count_tokens(self, counter, **values):
+        """
+        Token count of the formatted prompt without building or encoding it.
+
+        Args:
+            counter: A TokenCounter.
+            **values: One value per field; a string, or a list of strings
+                (e.g. context chunks) that will be joined with spaces.
+
+        Returns:
+            The summed token count of the template text and the values.
+        """
+        total = counter.count_joined(self.literals)
+        for field in self.fields:
+            value = values[field]
+            if isinstance(value, str):
+                total += counter.count(value)
+            else:
+                total += counter.count_joined(value)
+        return total
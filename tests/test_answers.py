@@ -0,0 +1,50 @@
+import os
+
+import pandas as pd
+import pytest
+
+from docqa.answers import parse_answer, parse_answers
+
+FINAL_METRICS = os.path.join(os.path.dirname(__file__), os.pardir, "final_metrics.csv")
+
+
+@pytest.fixture(scope="module")
+def answers():
+    return pd.read_csv(FINAL_METRICS, index_col=0)["Answer"]
+
+
+def test_parse_answer_agrees_with_parse_answers_on_final_metrics(answers):
+    parsed = parse_answers(answers)
+
+    for position, answer in answers.items():
+        value, page, is_null = parse_answer(None if pd.isna(answer) else answer)
+        row = parsed.loc[position]
+        assert (None if pd.isna(row["value"]) else row["value"]) == value, answer
+        assert (None if pd.isna(row["page"]) else int(row["page"])) == page, answer
+        assert bool(row["is_null"]) == is_null, answer
+
+
+def test_final_metrics_has_values_pages_and_nulls(answers):
+    parsed = parse_answers(answers)
+
+    assert parsed["is_null"].any() and not parsed["is_null"].all()
+    assert parsed["page"].notna().any()
+
+
+@pytest.mark.parametrize(
+    "answer, expected",
+    [
+        ("{ 2050, 4 }", ("2050", 4, False)),
+        ("{ NULL, NULL }", (None, None, True)),
+        ("{ GRI rating target value: 4, page number: 10 }", ("4", 10, False)),
+        ("{ Circularity targets value: NULL,page number: NULL }", (None, None, True)),
+        ("{ , 8 }", (None, 8, True)),
+        ("Yes, Regal Rexnord is focussing on ESG assurance.",
+         ("Yes, Regal Rexnord is focussing on ESG assurance.", None, False)),
+        (None, (None, None, True)),
+    ],
+)
+def test_parse_answer(answer, expected):
+    assert parse_answer(answer) == expected
+    column = parse_answers(pd.Series([answer], dtype=object)).iloc[0]
+    assert (None if pd.isna(column["value"]) else column["value"]) == expected[0]
@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from docqa import cache
+from docqa.cache import AnswerCache, CachedEmbedder, EmbeddingCache, answer_key
+from docqa.embedding import BatchEmbedder
+from docqa.fakes import FakeEmbeddingModel
+
+
+class Clock:
+    """Stands in for the time module, so cache timestamps are under test control."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds=1.0):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, "time", clock)
+    return clock
+
+
+def vector(value, dimensions=4):
+    return np.full(dimensions, value, dtype=np.float32)
+
+
+def test_embedding_cache_evicts_the_least_recently_used_vectors(tmp_path, clock):
+    # Room for three 4-float vectors.
+    with EmbeddingCache(str(tmp_path / "cache.sqlite"), max_bytes=3 * 16) as store:
+        for value, text in enumerate(["a", "b", "c"]):
+            store.put_many("gecko", [text], [vector(value)])
+            clock.advance()
+        store.get_many("gecko", ["a"])
+        clock.advance()
+
+        store.put_many("gecko", ["d"], [vector(3)])
+
+        a, b, c, d = store.get_many("gecko", ["a", "b", "c", "d"])
+        assert b is None
+        np.testing.assert_array_equal(a, vector(0))
+        assert c is not None and d is not None
+        assert store.size_bytes() <= 3 * 16
+
+
+def test_embedding_cache_keys_include_the_model(tmp_path):
+    with EmbeddingCache(str(tmp_path / "cache.sqlite")) as store:
+        store.put_many("gecko@001", ["net zero"], [vector(1)])
+
+        assert store.get_many("gecko@003", ["net zero"]) == [None]
+        assert store.get_many("gecko@001", ["net  zero "])[0] is not None
+
+
+def test_cached_embedder_only_embeds_misses_and_counts_per_text(tmp_path):
+    model = FakeEmbeddingModel(dimensions=8)
+    with EmbeddingCache(str(tmp_path / "cache.sqlite")) as store:
+        embedder = CachedEmbedder(BatchEmbedder(model), store, "fake")
+        first = embedder.embed(["scope 1", "scope 2", "scope 1"])
+        second = embedder.embed(["scope 1", "scope 2", "scope 3"])
+
+        np.testing.assert_array_equal(first[0], first[2])
+        np.testing.assert_array_equal(first[:2], second[:2])
+        assert model.texts == 3
+        assert (store.hits, store.misses) == (2, 4)
+
+
+def test_answer_cache_expires_answers_after_the_ttl(tmp_path, clock):
+    with AnswerCache(str(tmp_path / "answers.sqlite"), ttl=60) as answers:
+        key = answer_key("bison", "What is the net zero target?")
+        answers.put(key, "{ 2050, 4 }")
+
+        clock.advance(59)
+        assert answers.get(key) == "{ 2050, 4 }"
+        clock.advance(2)
+        assert answers.get(key) is None
+        assert len(answers) == 0
+
+
+def test_answer_cache_evicts_the_least_recently_used_answers(tmp_path, clock):
+    with AnswerCache(str(tmp_path / "answers.sqlite"), max_entries=2) as answers:
+        first, second, third = (answer_key("bison", f"prompt {i}") for i in range(3))
+        answers.put(first, "1")
+        clock.advance()
+        answers.put(second, "2")
+        clock.advance()
+        answers.get(first)
+        clock.advance()
+
+        answers.put(third, "3")
+
+        assert answers.get(second) is None
+        assert answers.get(first) == "1"
+        assert answers.get(third) == "3"
+
+
+def test_answer_keys_depend_on_the_generation_parameters():
+    prompt = "What is the net zero target?"
+
+    assert answer_key("bison", prompt, {"temperature": 0.0}) != answer_key(
+        "bison", prompt, {"temperature": 0.2}
+    )
+    assert answer_key("bison", prompt) == answer_key("bison", prompt)
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from tenacity import wait_none
+
+from docqa.embedding import BatchEmbedder, EmbeddingError
+from docqa.fakes import FakeEmbeddingModel, FakeModelError, fake_embedding
+
+
+class PoisonedModel(FakeEmbeddingModel):
+    """Rejects every request that contains the poisoned text."""
+
+    def __init__(self, poison, **kwargs):
+        super().__init__(**kwargs)
+        self.poison = poison
+        self.batch_sizes = []
+
+    def get_embeddings(self, texts):
+        self.batch_sizes.append(len(texts))
+        if self.poison in texts:
+            raise FakeModelError("poisoned batch")
+        return super().get_embeddings(texts)
+
+
+TEXTS = [f"chunk {i} reports {i}% renewable energy" for i in range(8)]
+
+
+def test_a_failing_batch_is_split_until_the_bad_text_is_isolated():
+    model = PoisonedModel(TEXTS[5], dimensions=16)
+    embedder = BatchEmbedder(
+        model,
+        max_batch_size=8,
+        max_concurrency=1,
+        attempts=1,
+        retry_wait=wait_none(),
+        skip_failures=True,
+        dimensions=16,
+    )
+
+    matrix = embedder.embed(TEXTS)
+
+    assert embedder.failed_positions == [5]
+    assert not matrix[5].any()
+    for i in (0, 1, 2, 3, 4, 6, 7):
+        np.testing.assert_allclose(matrix[i], fake_embedding(TEXTS[i], 16), rtol=1e-6)
+    # The batch of 8 fails, then only the halves holding the bad text do.
+    assert model.batch_sizes == [8, 4, 4, 2, 1, 1, 2]
+
+
+def test_a_text_that_fails_on_its_own_raises_without_skip_failures():
+    embedder = BatchEmbedder(
+        PoisonedModel(TEXTS[2], dimensions=16), attempts=1, retry_wait=wait_none()
+    )
+
+    with pytest.raises(EmbeddingError) as raised:
+        embedder.embed(TEXTS)
+    assert raised.value.position == 2
+
+
+def test_requests_are_retried_before_the_batch_is_split():
+    model = FakeEmbeddingModel(dimensions=16, failure_rate=0.5, seed=3)
+    embedder = BatchEmbedder(model, attempts=10, retry_wait=wait_none())
+
+    matrix = embedder.embed(TEXTS)
+
+    assert matrix.shape == (8, 16)
+    assert embedder.failed_positions == []
+    assert model.texts == len(TEXTS)
@@ -0,0 +1,109 @@
+import os
+
+import numpy as np
+import pytest
+
+from docqa import chunking
+from docqa.embedding import BatchEmbedder
+from docqa.fakes import FakeEmbeddingModel, FakeEncoder
+from docqa.incremental import refresh_index
+from docqa.ingest import files
+from docqa.pipeline import entity_matcher
+
+fitz = pytest.importorskip("fitz")
+
+COMPANIES = ["Acme", "Globex", "Initech"]
+TOPICS = ["renewable energy", "water withdrawal", "scope 1 emissions", "board diversity"]
+
+
+@pytest.fixture(autouse=True)
+def offline_encoder(monkeypatch):
+    # tiktoken downloads its encodings on first use.
+    encoder = FakeEncoder()
+    monkeypatch.setattr(chunking, "get_encoder", lambda *args, **kwargs: encoder)
+
+
+def write_report(path, company, pages=2):
+    document = fitz.open()
+    for page in range(pages):
+        # Distinct lines per page, so the cleaner does not take them for a
+        # running header.
+        document.new_page().insert_text(
+            (36, 72), f"{company} reports {TOPICS[page]} of {10 + page}% in 2022.", fontsize=9
+        )
+    document.save(str(path))
+    document.close()
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    directory = tmp_path / "reports"
+    directory.mkdir()
+    for company in COMPANIES:
+        write_report(directory / f"{company.lower()}-esg-report.pdf", company)
+    return directory
+
+
+def refresh(store, corpus, model):
+    return refresh_index(
+        str(store),
+        files(str(corpus)),
+        BatchEmbedder(model),
+        entity_matcher(COMPANIES + ["Umbrella"]),
+        max_tokens=50,
+        overlap=0,
+        processes=1,
+    )
+
+
+def test_first_refresh_embeds_every_file(tmp_path, corpus):
+    model = FakeEmbeddingModel(dimensions=16)
+
+    chunk_store, index, diff = refresh(tmp_path / "store", corpus, model)
+
+    assert len(diff.added) == 3 and not diff.changed and not diff.removed
+    assert len(chunk_store) == len(index) == model.texts == 6
+    assert set(index.partitions) == set(COMPANIES)
+
+
+def test_unchanged_run_embeds_nothing(tmp_path, corpus):
+    model = FakeEmbeddingModel(dimensions=16)
+    _, first_index, _ = refresh(tmp_path / "store", corpus, model)
+    first_matrix = np.array(first_index.matrix)
+    embedded = model.texts
+
+    chunk_store, index, diff = refresh(tmp_path / "store", corpus, model)
+
+    assert model.texts == embedded
+    assert len(diff.unchanged) == 3 and not (diff.added or diff.changed or diff.removed)
+    np.testing.assert_array_equal(index.matrix, first_matrix)
+
+
+def test_added_and_removed_files_are_applied(tmp_path, corpus):
+    model = FakeEmbeddingModel(dimensions=16)
+    refresh(tmp_path / "store", corpus, model)
+    embedded = model.texts
+    os.remove(corpus / "globex-esg-report.pdf")
+    write_report(corpus / "umbrella-esg-report.pdf", "Umbrella", pages=3)
+
+    chunk_store, index, diff = refresh(tmp_path / "store", corpus, model)
+
+    assert [os.path.basename(p) for p in diff.added] == ["umbrella-esg-report.pdf"]
+    assert [os.path.basename(p) for p in diff.removed] == ["globex-esg-report.pdf"]
+    assert model.texts - embedded == 3
+    assert set(index.partitions) == {"Acme", "Initech", "Umbrella"}
+    names = {os.path.basename(name) for name in chunk_store.to_frame()["file_name"]}
+    assert "globex-esg-report.pdf" not in names
+
+
+def test_broken_files_are_skipped_until_they_change(tmp_path, corpus):
+    model = FakeEmbeddingModel(dimensions=16)
+    (corpus / "broken.pdf").write_bytes(b"not a pdf")
+    refresh(tmp_path / "store", corpus, model)
+    embedded = model.texts
+
+    os.utime(corpus / "broken.pdf")
+    _, _, diff = refresh(tmp_path / "store", corpus, model)
+
+    assert model.texts == embedded
+    assert not (diff.added or diff.changed)
@@ -0,0 +1,96 @@
+import os
+
+import pandas as pd
+import pytest
+
+from docqa import pipeline
+from docqa.journal import SweepJournal, read_journal, sweep_fingerprint
+
+ENTITIES = ["Acme", "Globex", "Initech"]
+QUESTIONS = [{"question": f"what is indicator {i}?"} for i in range(4)]
+
+
+class QuotaError(RuntimeError):
+    pass
+
+
+class Model:
+    """Answers every question, raising on the call numbered fail_on."""
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.questions = []
+
+    def __call__(self, question, context, top_matched_df):
+        self.questions.append(question)
+        if len(self.questions) == self.fail_on:
+            raise QuotaError("quota exceeded")
+        return f"{{ {len(self.questions)}, 1 }}"
+
+
+def get_context(question):
+    return question, pd.DataFrame({"chunks": [question]}, index=[3, 7])
+
+
+def sweep(path, model, fingerprint):
+    with SweepJournal(path, fingerprint=fingerprint) as journal:
+        return list(pipeline.answer(ENTITIES, QUESTIONS, get_context, model, journal=journal))
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "journal" / "sweep.jsonl")
+
+
+FINGERPRINT = sweep_fingerprint({"rows": 6}, "prompt", ENTITIES, QUESTIONS)
+
+
+def test_a_resumed_sweep_only_asks_the_missing_pairs(path):
+    with pytest.raises(QuotaError):
+        sweep(path, Model(fail_on=7), FINGERPRINT)
+    # The process died while writing the next record.
+    with open(path, "a") as f:
+        f.write('{"entity": "Initech", "quest')
+
+    model = Model()
+    results = sweep(path, model, FINGERPRINT)
+
+    assert len(model.questions) == 12 - 6
+    assert [r["resumed"] for r in results] == [True] * 6 + [False] * 6
+    assert [r["entity"] for r in results] == [e for e in ENTITIES for _ in QUESTIONS]
+    assert all(r["chunk_ids"] == [3, 7] for r in results)
+    assert not os.path.exists(path)
+    assert len(read_journal(path + ".done")) == 12
+
+
+def test_a_completed_sweep_starts_over(path):
+    sweep(path, Model(), FINGERPRINT)
+
+    model = Model()
+    sweep(path, model, FINGERPRINT)
+
+    assert len(model.questions) == 12
+
+
+def test_a_journal_of_another_sweep_is_discarded(path):
+    with pytest.raises(QuotaError):
+        sweep(path, Model(fail_on=5), FINGERPRINT)
+
+    model = Model()
+    sweep(path, model, sweep_fingerprint({"rows": 7}, "prompt", ENTITIES, QUESTIONS))
+
+    assert len(model.questions) == 12
+
+
+def test_a_truncated_record_is_dropped_on_load(path):
+    with SweepJournal(path, fingerprint=FINGERPRINT) as journal:
+        journal.record("Acme", "q?", "{ 1, 2 }", [4])
+    with open(path, "a") as f:
+        f.write('{"entity": "Acme", "question": "q2')
+
+    with SweepJournal(path, fingerprint=FINGERPRINT) as journal:
+        assert journal.skipped_lines == 1
+        assert ("Acme", "q?") in journal
+        assert journal.get("Acme", "q?")["chunk_ids"] == [4]
+    with open(path, "rb") as f:
+        assert f.read().endswith(b"\n")
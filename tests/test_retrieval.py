@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from docqa.retrieval import VectorIndex
+
+
+def test_search_returns_the_top_k_rows_in_decreasing_similarity():
+    embeddings = np.eye(4, dtype=np.float32)
+    embeddings[3] = [0.9, 0.1, 0.0, 0.0]
+    index = VectorIndex(embeddings)
+
+    positions, scores = index.search(np.array([1.0, 0.0, 0.0, 0.0]), k=2)
+
+    assert positions.tolist() == [0, 3]
+    assert scores[0] == pytest.approx(1.0)
+    assert scores[0] > scores[1]
+
+
+def test_search_batch_matches_search():
+    rng = np.random.default_rng(0)
+    index = VectorIndex(rng.normal(size=(50, 8)).astype(np.float32))
+    queries = rng.normal(size=(3, 8))
+
+    positions, scores = index.search_batch(queries, k=5)
+
+    for query, row_positions, row_scores in zip(queries, positions, scores):
+        expected_positions, expected_scores = index.search(query, k=5)
+        assert row_positions.tolist() == expected_positions.tolist()
+        np.testing.assert_allclose(row_scores, expected_scores, rtol=1e-5)
+
+
+def test_search_in_a_partition_only_returns_its_rows():
+    embeddings = np.tile(np.eye(2, dtype=np.float32), (3, 1))
+    index = VectorIndex(embeddings, partitions={"Acme": (2, 4)})
+
+    positions, _ = index.search(np.array([1.0, 0.0]), k=2, partition="Acme")
+
+    assert positions.tolist() == [2, 3]
+
+
+def test_k_larger_than_the_index_returns_every_row():
+    index = VectorIndex(np.eye(3, dtype=np.float32))
+
+    positions, scores = index.search(np.array([0.0, 1.0, 0.0]), k=10)
+
+    assert sorted(positions.tolist()) == [0, 1, 2]
+    assert positions[0] == 1
+    assert len(scores) == 3
+
+
+def test_searching_an_empty_index_returns_nothing():
+    index = VectorIndex.from_frame(pd.DataFrame({"embedding": []}))
+
+    positions, scores = index.search(np.ones(768), k=5)
+    batch_positions, batch_scores = index.search_batch(np.ones((2, 768)), k=5)
+
+    assert len(index) == 0
+    assert positions.size == scores.size == 0
+    assert batch_positions.shape == batch_scores.shape == (2, 0)
+
+
+def test_from_frame_needs_dimensions_when_no_row_is_embedded():
+    frame = pd.DataFrame({"embedding": [None, None]})
+
+    with pytest.raises(ValueError):
+        VectorIndex.from_frame(frame)
+    index = VectorIndex.from_frame(frame, dimensions=4)
+    assert index.matrix.shape == (2, 4)